@@ -0,0 +1,2 @@
+""" Benchmarks for json2mqtt, run them with: python -m benchmarks.<name> --help
+"""
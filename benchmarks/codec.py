@@ -0,0 +1,64 @@
+""" Decode and encode time of the json codecs for the payloads in schemas/examples
+
+Every payload is padded to the given sizes, decoded from the raw response bytes
+and the decoded document is encoded again, as the scheduler does for list and dict fields.
+
+    python -m benchmarks.codec --sizes 1024 16384 262144 --rounds 2000
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.server import load_examples, pad
+from json2mqtt.codec import CODECS, get_codec
+from json2mqtt.settings import ConfigError
+
+
+def measure(function, values, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        for value in values:
+            function(value)
+
+    return (time.process_time() - start) / (rounds * len(values)) * 1e6
+
+
+def run(sizes, rounds, examples=None):
+    examples = examples if examples is not None else load_examples()
+    results = []
+
+    for size in sizes:
+        payloads = [pad(payload, size) for _, payload in sorted(examples.items())]
+        documents = [json.loads(payload) for payload in payloads]
+
+        for name in CODECS:
+            try:
+                codec = get_codec(name)
+            except ConfigError:
+                continue
+
+            results.append({
+                "codec": name,
+                "size": size,
+                "payloads": len(payloads),
+                "decode_us": round(measure(codec.loads, payloads, rounds), 2),
+                "encode_us": round(measure(codec.dumps, documents, rounds), 2),
+            })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 16384, 262144], help="payload sizes in bytes")
+    parser.add_argument("--rounds", type=int, default=2000, help="number of times every payload is decoded and encoded")
+    arguments = parser.parse_args()
+
+    for result in run(sizes=arguments.sizes, rounds=arguments.rounds):
+        json.dump(result, sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
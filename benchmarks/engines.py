@@ -0,0 +1,136 @@
+""" Compare the thread and asyncio scheduler engines
+
+Every engine runs in a fresh process against a local HTTP server (in yet another process),
+polling the same set of generated schemas. Reports thread count, RSS and fetches/sec as json.
+
+    python -m benchmarks.engines --schemas 500 --interval 1 --duration 10
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.server import serve
+from benchmarks.sink import SinkClient, settings
+from json2mqtt.scheduler import create_scheduler
+from json2mqtt.schemas import Schemas
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss():
+    """ Current resident set size in KiB
+    """
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def generate(count, port, interval):
+    for number in range(count):
+        yield {
+            "name": f"bench_{number}",
+            "url": f"http://127.0.0.1:{port}/current_usage",
+            "interval": interval,
+            "fields": {
+                "result": {"type": "String", "path": "result"},
+            }
+        }
+
+
+def run(engine, count, port, interval, duration, concurrency, results):
+    logger = logging.getLogger('json2mqtt.benchmark')
+
+    with tempfile.TemporaryDirectory() as directory:
+        schemas = Schemas(logger=logger, schema_dir=directory)
+        for schema in generate(count=count, port=port, interval=interval):
+            schemas.add_schema(schema=schema)
+
+        client = SinkClient(
+            schemas=schemas,
+            settings=settings(scheduler_engine=engine, max_concurrency=concurrency),
+            logger=logger,
+        )
+
+        fetches = []
+        scheduler = create_scheduler(client=client)
+        handle = scheduler.handle
+
+        def counting(*args, **kwargs):
+            fetches.append(1)
+            return handle(*args, **kwargs)
+
+        scheduler.handle = counting
+
+        baseline = rss()
+        start = time.perf_counter()
+        scheduler.start()
+
+        time.sleep(duration)
+        threads = threading.active_count()
+        memory = rss()
+
+        elapsed = time.perf_counter() - start
+        scheduler.close()
+
+    results.put({
+        "engine": engine,
+        "schemas": count,
+        "threads": threads,
+        "rss_kib": memory,
+        "rss_growth_kib": memory - baseline,
+        "fetches": len(fetches),
+        "fetches_per_sec": round(len(fetches) / elapsed, 2),
+        "messages": client.messages,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schemas", type=int, default=200, help="number of schemas to poll")
+    parser.add_argument("--interval", type=float, default=1, help="schema interval in seconds")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run each engine")
+    parser.add_argument("--concurrency", type=int, default=50, help="max_concurrency for the asyncio engine")
+    parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+    arguments = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    port = free_port()
+
+    ready = context.Event()
+    server = context.Process(target=serve, kwargs=dict(port=port, ready=ready), daemon=True)
+    server.start()
+    ready.wait()
+
+    try:
+        for engine in arguments.engines:
+            results = context.Queue()
+            process = context.Process(target=run, args=(
+                engine, arguments.schemas, port, arguments.interval, arguments.duration, arguments.concurrency, results,
+            ))
+            process.start()
+            json.dump(results.get(), sys.stdout)
+            sys.stdout.write("\n")
+            process.join()
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
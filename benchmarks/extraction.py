@@ -0,0 +1,111 @@
+""" Per-tick CPU time of field extraction for a wide schema
+
+Compares the compiled plan used by Scheduler._process against the previous
+implementation, which parsed every path and resolved every type on each tick.
+
+    python -m benchmarks.extraction --fields 200 --ticks 2000
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+
+import jmespath
+
+from benchmarks.sink import SinkClient, settings
+from json2mqtt.scheduler import Scheduler, TYPES
+from json2mqtt.schemas import Schemas
+
+
+def generate(fields):
+    schema = {
+        "name": "wide",
+        "url": "http://localhost/wide",
+        "interval": 1,
+        "fields": {},
+    }
+    data = {}
+
+    for number in range(fields):
+        device = f"dev_{number // 10}"
+        data.setdefault(device, {})[f"value_{number}"] = str(number)
+        schema["fields"][f"field_{number}"] = {
+            "type": "String",
+            "cast": "Integer",
+            "path": f"{device}.value_{number}",
+        }
+
+    return schema, data
+
+
+def uncompiled(client, data, schema):
+    """ The extraction loop as it was before schemas were compiled into plans
+    """
+    name = schema.get('name')
+
+    for key, cfg in schema.get('fields', {}).items():
+        value = jmespath.search(cfg.get('path'), data)
+
+        stringtype = cfg.get('type')
+        if value is None or not isinstance(value, TYPES.get(stringtype.title(), None)):
+            continue
+
+        casttype = cfg.get('cast', None)
+        if casttype:
+            cast_to = TYPES.get(casttype.title(), None)
+            try:
+                value = cast_to(value)
+            except ValueError:
+                pass
+
+        topic = client.topic(name=name, key=key, base_topic=schema.get('topic', None))
+
+        if isinstance(value, list) or isinstance(value, dict):
+            value = json.dumps(value)
+
+        client.publish(topic=topic, payload=value)
+
+
+def measure(function, ticks):
+    start = time.process_time()
+    for _ in range(ticks):
+        function()
+
+    return (time.process_time() - start) / ticks * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fields", type=int, default=200, help="number of fields in the schema")
+    parser.add_argument("--ticks", type=int, default=2000, help="number of ticks to measure")
+    arguments = parser.parse_args()
+
+    logger = logging.getLogger('json2mqtt.benchmark')
+    logger.setLevel(logging.INFO)
+
+    schema, data = generate(fields=arguments.fields)
+
+    with tempfile.TemporaryDirectory() as directory:
+        schemas = Schemas(logger=logger, schema_dir=directory)
+        schemas.add_schema(schema=schema)
+
+        client = SinkClient(schemas=schemas, settings=settings(), logger=logger)
+        scheduler = Scheduler(client=client)
+
+        before = measure(lambda: uncompiled(client=client, data=data, schema=schema), ticks=arguments.ticks)
+        after = measure(lambda: scheduler._process(data=data, schema=schema), ticks=arguments.ticks)
+
+    json.dump({
+        "fields": arguments.fields,
+        "ticks": arguments.ticks,
+        "uncompiled_us_per_tick": round(before, 1),
+        "compiled_us_per_tick": round(after, 1),
+        "speedup": round(before / after, 2),
+    }, sys.stdout)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
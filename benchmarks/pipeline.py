@@ -0,0 +1,201 @@
+""" End-to-end throughput of the scheduler for a growing amount of schemas
+
+For every schema count, a fresh process polls generated schemas against a local HTTP server
+(in yet another process) and publishes to an in-process sink. The schemas cycle through the
+payloads in schemas/examples, with a field for every top level value.
+Every schema polls its own url, so requests are not coalesced.
+
+Reports fetches/sec, messages/sec, p50/p99 tick latency, thread count and RSS as json, one line per run.
+The tick latency is the time between a timer firing and its messages being published.
+
+    python -m benchmarks.pipeline --schemas 10 100 1000 5000 --latency 0.01 --size 4096
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import multiprocessing
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.engines import free_port, rss
+from benchmarks.server import load_examples, serve
+from benchmarks.sink import SinkClient, settings
+from json2mqtt.scheduler import create_scheduler
+from json2mqtt.schemas import Schemas
+
+
+TYPES = (
+    (bool, "Boolean"),
+    (int, "Integer"),
+    (float, "Float"),
+    (str, "String"),
+)
+
+
+def fields(payload):
+    """ A field for every top level string or number of a json object
+    """
+    result = {}
+    for key, value in json.loads(payload).items():
+        for cls, name in TYPES:
+            if isinstance(value, cls) and key.isidentifier():
+                result[key] = {"type": name, "path": key}
+                break
+
+    return result
+
+
+def generate(count, port, interval, examples=None):
+    examples = examples if examples is not None else load_examples()
+    templates = [(name, fields(payload)) for name, payload in sorted(examples.items())]
+    templates = [(name, values) for name, values in templates if values]
+
+    for number in range(count):
+        name, values = templates[number % len(templates)]
+        yield {
+            "name": f"bench_{number}",
+            "url": f"http://127.0.0.1:{port}/{name}?schema={number}",
+            "interval": interval,
+            "fields": values,
+        }
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def timed(function, latencies):
+    """ Wrap a (coroutine) function to record how long every call takes
+    """
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    return wrapper
+
+
+def run(count, port, interval, duration, engine="thread", concurrency=50, workers=0, results=None):
+    logger = logging.getLogger('json2mqtt.benchmark')
+
+    with tempfile.TemporaryDirectory() as directory:
+        schemas = Schemas(logger=logger, schema_dir=directory)
+        for schema in generate(count=count, port=port, interval=interval):
+            schemas.add_schema(schema=schema)
+
+        client = SinkClient(
+            schemas=schemas,
+            settings=settings(scheduler_engine=engine, max_concurrency=concurrency, workers=workers),
+            logger=logger,
+        )
+
+        latencies = []
+        scheduler = create_scheduler(client=client)
+        if workers < 2:
+            scheduler.fetch = timed(scheduler.fetch, latencies)
+
+        baseline = rss()
+        start = time.perf_counter()
+        scheduler.start()
+
+        time.sleep(duration)
+        threads = threading.active_count()
+        memory = rss()
+        elapsed = time.perf_counter() - start
+        fetches, messages = len(latencies), client.messages
+
+        if workers > 1:
+            # Fetches happen in the worker processes, count them from their metrics
+            schemas = scheduler.metrics.snapshot()["schemas"].values()
+            fetches = sum(s.get("fetch_success_total", 0) + s.get("fetch_failure_total", 0) for s in schemas)
+
+        scheduler.close()
+
+    result = {
+        "engine": engine,
+        "workers": workers,
+        "schemas": count,
+        "duration": round(elapsed, 3),
+        "fetches": fetches,
+        "fetches_per_sec": round(fetches / elapsed, 2),
+        "messages": messages,
+        "messages_per_sec": round(messages / elapsed, 2),
+        "tick_latency_p50": round(percentile(latencies, 50), 6) if workers < 2 else None,
+        "tick_latency_p99": round(percentile(latencies, 99), 6) if workers < 2 else None,
+        "threads": threads,
+        "rss_kib": memory,
+        "rss_growth_kib": memory - baseline,
+    }
+
+    if results is not None:
+        results.put(result)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schemas", type=int, nargs="+", default=[10, 100, 1000, 5000], help="schema counts to run")
+    parser.add_argument("--interval", type=float, default=1, help="schema interval in seconds")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run every schema count")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the http server waits before answering")
+    parser.add_argument("--size", type=int, default=0, help="minimal size of the http responses in bytes")
+    parser.add_argument("--engine", default="thread", choices=["thread", "asyncio"])
+    parser.add_argument("--concurrency", type=int, default=50, help="max_concurrency of the scheduler")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, tick latency is not measured with workers")
+    arguments = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    port = free_port()
+
+    ready = context.Event()
+    server = context.Process(target=serve, kwargs=dict(
+        port=port, ready=ready, latency=arguments.latency, size=arguments.size,
+    ), daemon=True)
+    server.start()
+    ready.wait()
+
+    try:
+        for count in arguments.schemas:
+            results = context.Queue()
+            process = context.Process(target=run, kwargs=dict(
+                count=count,
+                port=port,
+                interval=arguments.interval,
+                duration=arguments.duration,
+                engine=arguments.engine,
+                concurrency=arguments.concurrency,
+                workers=arguments.workers,
+                results=results,
+            ))
+            process.start()
+            json.dump(results.get(), sys.stdout)
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+            process.join()
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
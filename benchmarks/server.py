@@ -0,0 +1,122 @@
+""" A local HTTP stand-in that serves the payloads in schemas/examples
+
+Every request can be slowed down and padded, using the server defaults or the query string:
+
+    http://127.0.0.1:8000/current_usage?latency=0.05&size=65536
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schemas", "examples")
+
+
+def load_examples(directory=EXAMPLES):
+    payloads = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename), 'rb') as fh:
+                payloads[os.path.splitext(filename)[0]] = fh.read()
+
+    return payloads
+
+
+def pad(payload, size):
+    """ Grow a json object to at least size bytes by adding a padding key
+    """
+    missing = size - len(payload)
+    if missing <= 0:
+        return payload
+
+    data = json.loads(payload)
+    data["_padding"] = "x" * max(missing - len('"_padding": "", '), 0)
+    return json.dumps(data).encode('utf-8')
+
+
+class PayloadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+
+        latency = float(query.get('latency', [self.server.latency])[0])
+        size = int(query.get('size', [self.server.size])[0])
+        payload = self.server.payload(name=parts.path.strip('/'), size=size)
+
+        if payload is None:
+            self.send_error(404)
+            return
+
+        if latency:
+            time.sleep(latency)
+
+        with self.server.lock:
+            self.server.hits += 1
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class PayloadServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, payloads=None, latency=0.0, size=0):
+        super().__init__((host, port), PayloadHandler)
+        self.payloads = payloads if payloads is not None else load_examples()
+        self.latency = latency
+        self.size = size
+        self.padded = {}
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def payload(self, name, size=0):
+        payload = self.payloads.get(name)
+        if payload is None or not size:
+            return payload
+
+        with self.lock:
+            padded = self.padded.get((name, size))
+            if padded is None:
+                padded = self.padded[(name, size)] = pad(payload, size)
+
+        return padded
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def url(self, name):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/{name}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='benchmark-http', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def serve(port, ready=None, latency=0.0, size=0):
+    """ Run a PayloadServer in the foreground, used to keep the server out of the measured process
+    """
+    server = PayloadServer(port=port, latency=latency, size=size)
+    if ready is not None:
+        ready.set()
+    server.serve_forever()
@@ -0,0 +1,36 @@
+""" An in-process stand-in for MQTTListener that counts messages instead of sending them
+"""
+import logging
+import threading
+import types
+
+from json2mqtt.settings import Settings
+
+
+def settings(**kwargs):
+    values = dict(Settings.schema, **Settings.defaults)
+    values.update(kwargs)
+    return types.SimpleNamespace(**values)
+
+
+class SinkClient(object):
+    def __init__(self, schemas, settings, logger=None):
+        self.settings = settings
+        self.schemas = schemas
+        self.logger = logger or logging.getLogger('json2mqtt.benchmark')
+        self.scheduler = None
+
+        self.lock = threading.Lock()
+        self.messages = 0
+
+    def topic(self, name, key, base_topic=None):
+        base = base_topic or self.settings.mqtt_topic
+        return f"{base}/{name}/{key}"
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self.lock:
+            self.messages += 1
+
+    def publish_many(self, messages, qos=0, retain=False):
+        with self.lock:
+            self.messages += len(messages)
@@ -2,3 +2,6 @@
 """
 
 __version__ = "0.0.2"
+
+# The log format of the daemon and its worker processes
+LOG_FORMAT = "[%(asctime)s] %(name)s | %(funcName)-20s | %(levelname)s | %(message)s"
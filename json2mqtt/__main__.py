@@ -3,10 +3,8 @@ import argparse
 import json2mqtt
 import logging
 import sys
+import time
 
-from pid import PidFile, PidFileAlreadyLockedError
-from json2mqtt.mqtt import MQTTListener
-from json2mqtt.schemas import Schemas
 from json2mqtt.settings import Settings, ConfigError
 
 
@@ -30,6 +28,22 @@ def parse_arguments():
         help="increase output verbosity"
     )
 
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=None,
+        help="spread the schemas over this amount of worker processes"
+    )
+
+    parser.add_argument(
+        "--check",
+        dest="check",
+        action="store_true",
+        help="validate the config file and the schemas and exit without connecting to the broker"
+    )
+
     return parser.parse_args()
 
 
@@ -43,25 +57,86 @@ def log(level):
 
     logging.basicConfig(
         level=loglevel,
-        format="[%(asctime)s] %(name)s | %(funcName)-20s | %(levelname)s | %(message)s"
+        format=json2mqtt.LOG_FORMAT
     )
     return logging.getLogger('json2mqtt')
 
 
+def load_schemas(settings, logger, write_cache=True):
+    # Only imported when needed, to keep the startup of the command line fast
+    from json2mqtt.codec import get_codec
+    from json2mqtt.schemas import Schemas
+
+    logger.info("Reading schema files from {}".format(settings.schema_dir))
+    schemas = Schemas(
+        logger=logger,
+        schema_dir=settings.schema_dir,
+        mqtt_topic=settings.mqtt_topic,
+        codec=get_codec(settings.json_codec),
+    )
+    schemas.import_all(write_cache=write_cache)
+
+    return schemas
+
+
+def check_settings(settings):
+    """ Raise a ConfigError for settings that are valid yaml, but would fail once the daemon starts
+    """
+    from importlib.util import find_spec
+    from json2mqtt.codec import get_codec
+
+    get_codec(settings.json_codec)
+
+    if settings.scheduler_engine == 'asyncio' and find_spec('aiohttp') is None:
+        raise ConfigError('The asyncio scheduler engine requires aiohttp: pip install json2mqtt[async]')
+
+
+def check(arguments, logger):
+    """ Validate the config file and all schema files, exits with 1 if any of them contains errors
+
+        Nothing is written, not even the validation cache in schema_dir.
+    """
+    start = time.perf_counter()
+
+    try:
+        settings = Settings(filename=arguments.filename)
+        check_settings(settings=settings)
+    except ConfigError as e:
+        logger.error("Config file contains errors: {}".format(e))
+        sys.exit(1)
+
+    schemas = load_schemas(settings=settings, logger=logger, write_cache=False)
+
+    for filename in schemas.invalid:
+        logger.error("Invalid schema file: {}".format(filename))
+
+    logger.warning("Checked {} in {:.3f}s: {} schemas, {} invalid schema files".format(
+        arguments.filename, time.perf_counter() - start, len(schemas), len(schemas.invalid),
+    ))
+    sys.exit(1 if schemas.invalid else 0)
+
+
 def main():
     arguments = parse_arguments()
     logger = log(arguments.loglevel)
 
+    if arguments.check:
+        check(arguments=arguments, logger=logger)
+
+    from pid import PidFile, PidFileAlreadyLockedError
+
     logger.warning('Starting json2mqtt')
 
     try:
         with PidFile('json2mqtt', piddir='/var/tmp'):
             logger.info("Reading configuration file {}".format(arguments.filename))
             settings = Settings(filename=arguments.filename)
+            if arguments.workers is not None:
+                settings.workers = arguments.workers
 
-            logger.info("Reading schema files {}".format(arguments.filename))
-            schemas = Schemas(logger=logger, schema_dir=settings.schema_dir)
-            schemas.import_all()
+            schemas = load_schemas(settings=settings, logger=logger)
+
+            from json2mqtt.mqtt import MQTTListener
 
             logger.info("Starting MQTT Listener server")
             server = MQTTListener(
@@ -78,3 +153,7 @@ def main():
     except PidFileAlreadyLockedError:
         logger.error("Another instance of this service is already running")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import asyncio
+import datetime
+import threading
+import time
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from json2mqtt.coalesce import ResponseCache
+from json2mqtt.scheduler import CHUNK_SIZE, Scheduler
+from json2mqtt.settings import ConfigError
+from json2mqtt.stream import Extractor
+from json2mqtt.timers import Runs, Schedule
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class AsyncTimer(object):
+    """ A MultiTimer look-alike that runs its function as a task on the scheduler's event loop
+
+        The function is called on every due time of the schedule, until count is reached or stop() is called.
+        What happens to a due run while the previous run is still busy depends on the overrun policy.
+    """
+    def __init__(self, loop, interval, function, kwargs=None, count=-1, phase=0.0, jitter=0.0, overrun="skip", limit=1):
+        self.loop = loop
+        self.interval = interval
+        self.function = function
+        self.kwargs = kwargs or {}
+        self.count = count
+        self.counter = 0
+        self.task = None
+        self.done = None
+        self.tasks = set()
+        self.schedule = Schedule(interval=interval, phase=phase, jitter=jitter)
+        self.runs = Runs(policy=overrun, limit=limit)
+
+    async def _execute(self):
+        while True:
+            start = self.loop.time()
+            self.runs.started(now=start)
+
+            try:
+                await self.function(**self.kwargs)
+            finally:
+                again = self.runs.finished(duration=self.loop.time() - start, interval=self.interval)
+
+            if not again:
+                return
+
+            self.counter += 1
+
+    async def _run(self):
+        self.counter = 0
+        due = self.schedule.reset(now=self.loop.time())
+
+        try:
+            while not 1 <= self.count <= self.counter:
+                await asyncio.sleep(max(0.0, due - self.loop.time()))
+                due = self.schedule.fired(now=self.loop.time())
+
+                if self.runs.due():
+                    self.counter += 1
+                    task = self.loop.create_task(self._execute())
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+
+            await asyncio.gather(*self.tasks)
+
+        except asyncio.CancelledError:
+            self.runs.cancel()
+            for task in self.tasks:
+                task.cancel()
+
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            raise
+
+    def _create(self, done):
+        self.task = self.loop.create_task(self._run())
+        self.task.add_done_callback(lambda task: done.set())
+
+    def _cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def start(self):
+        self.stop()
+        self.done = threading.Event()
+        self.loop.call_soon_threadsafe(self._create, self.done)
+
+    def stop(self):
+        if self.is_alive():
+            self.loop.call_soon_threadsafe(self._cancel)
+
+    def join(self, timeout=None):
+        """ Wait until the run and its tasks have finished, including cancelling them after stop()
+        """
+        if self.done is not None:
+            return self.done.wait(timeout=timeout)
+
+        return True
+
+    def is_alive(self):
+        return self.done is not None and not self.done.is_set()
+
+    def stats(self):
+        stats = dict(self.schedule.stats(), **self.runs.stats())
+        stats.update({"runs": self.counter, "missed": self.schedule.skipped + self.runs.missed})
+        return stats
+
+
+class AsyncScheduler(Scheduler):
+    """ Run every schema timer from a single asyncio event loop
+
+        The loop runs in one background thread and uses aiohttp for non-blocking requests.
+        The number of requests in flight is capped by the max_concurrency setting.
+    """
+    def __init__(self, client):
+        super().__init__(client=client)
+
+        if aiohttp is None:
+            raise ConfigError('The asyncio scheduler engine requires aiohttp: pip install json2mqtt[async]')
+
+        self.concurrency = self.settings.max_concurrency
+        self.limits = self.host_limits(semaphore=asyncio.Semaphore)
+        self.semaphore = None
+        self.session = None
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name='json2mqtt-asyncio', daemon=True)
+        self.thread.start()
+
+        asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _setup(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.settings.http_pool_size),
+        )
+
+    async def _close(self):
+        await self.session.close()
+
+    def close(self):
+        """ Close the http session and shut down the event loop
+        """
+        super().close()
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+        return True
+
+    @staticmethod
+    def response(result, content, elapsed):
+        """ Wrap an aiohttp result in a requests Response, so handle() and publish() work for both engines
+        """
+        response = Response()
+        response.status_code = result.status
+        response.reason = result.reason
+        response.url = str(result.url)
+        response.headers = CaseInsensitiveDict(result.headers)
+        response.encoding = result.charset
+        response.elapsed = datetime.timedelta(seconds=elapsed)
+        response._content = content
+
+        return response
+
+    @staticmethod
+    def response_cache():
+        return ResponseCache(lock=asyncio.Lock)
+
+    async def retrieve(self, schema):
+        key = self.response_key(schema=schema)
+        if self.schemas.plan(schema).stream is not None or not self.responses.shared(key):
+            return await self.request(schema=schema), None
+
+        async with self.responses.key_lock(key):
+            entry = self.responses.get(key=key, name=schema.get('name'))
+            if entry is not None:
+                self.logger.debug(f"Reusing response for {schema.get('name')} from {schema.get('url')}")
+                return entry.response, entry.data
+
+            response = await self.request(schema=schema)
+            data = self.decode(schema=schema, response=response)
+
+            if data is not None:
+                self.responses.put(key=key, name=schema.get('name'), response=response, data=data)
+
+        return response, data
+
+    def extract(self, plan, response):
+        return response.extractor.close()
+
+    async def request(self, schema):
+        plan = self.schemas.plan(schema)
+        extractor = None
+        limit = self.limits.limit(schema.get('url'))
+        queued = time.perf_counter()
+
+        if limit.semaphore is not None:
+            await limit.semaphore.acquire()
+
+        try:
+            if limit.bucket is not None:
+                await asyncio.sleep(limit.bucket.reserve())
+
+            async with self.semaphore:
+                start = time.perf_counter()
+
+                async with self.session.get(
+                        schema.get('url'),
+                        timeout=aiohttp.ClientTimeout(total=schema.get('timeout', 10)),
+                        headers=self.request_headers(schema=schema)) as result:
+
+                    if plan.stream is not None and result.status < 300:
+                        # Extract while the body arrives instead of buffering it
+                        extractor = Extractor(paths=plan.stream, loads=self.codec.loads)
+                        async for chunk in result.content.iter_chunked(CHUNK_SIZE):
+                            extractor.feed(chunk)
+                        content = b''
+                    else:
+                        content = await result.read()
+
+        finally:
+            limit.release()
+
+        response = self.response(result=result, content=content, elapsed=time.perf_counter() - start)
+        response.queue_delay = start - queued
+        response.extractor = extractor
+        self.metrics.observe("http_request_seconds", schema.get('name'), response.elapsed.total_seconds())
+        return response
+
+    # noinspection PyBroadException
+    async def fetch(self, *args, **kwargs):
+        schema = kwargs.get('schema')
+        circuit = self.breakers.circuit(schema.get('url'))
+
+        if not circuit.allow():
+            return self.blocked(schema=schema, circuit=circuit)
+
+        self.logger.debug(f"Fetching data for {schema.get('name')} from {schema.get('url')}")
+
+        try:
+            response, data = await self.retrieve(schema=schema)
+        except asyncio.CancelledError:
+            # A cancelled probe must not keep the circuit of the host half open forever
+            circuit.release()
+            raise
+        except Exception as e:
+            return self.failed(schema=schema, circuit=circuit, error=e)
+
+        return self.completed(schema=schema, circuit=circuit, response=response, data=data)
+
+    def create_timer(self, interval, schema, count=-1):
+        return AsyncTimer(
+            loop=self.loop,
+            interval=interval,
+            function=self.fetch,
+            kwargs=dict(schema=schema),
+            count=count,
+            phase=self.phase(schema=schema),
+            jitter=schema.get('jitter', 0),
+            overrun=schema.get('overrun', 'skip'),
+            limit=schema.get('max_concurrent', 1),
+        )
@@ -0,0 +1,111 @@
+import random
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+
+class Circuit(object):
+    """ Tracks failures of a single host
+
+        After threshold consecutive failures the circuit opens and no requests are sent to the host.
+        Once the backoff passed, a single probe is let through (half open): a success closes
+        the circuit again, a failure re-opens it with a doubled backoff, with jitter and up to maximum.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold=5, backoff=10, maximum=300, clock=time.monotonic):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.maximum = maximum
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.retry_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and self.clock() >= self.retry_at:
+                self.state = self.HALF_OPEN
+                self.probing = False
+
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+
+            return False
+
+    def success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened = 0
+            self.probing = False
+
+    def release(self):
+        """ Give up a probe that ended without a result, so the next run can probe again
+        """
+        with self.lock:
+            self.probing = False
+
+    def failure(self):
+        """ Record a failure, returns True if this failure opened the circuit
+        """
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+
+            if self.state == self.CLOSED and self.failures < self.threshold:
+                return False
+
+            delay = min(self.maximum, self.backoff * 2 ** self.opened)
+            self.retry_at = self.clock() + random.uniform(delay / 2, delay)
+            self.opened += 1
+
+            opening = self.state == self.CLOSED
+            self.state = self.OPEN
+
+        return opening
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in": round(max(0.0, self.retry_at - self.clock()), 3) if self.state == self.OPEN else 0,
+            }
+
+
+class Breakers(object):
+    """ A circuit per scheme and host, shared by all schemas polling that host
+    """
+    def __init__(self, threshold=5, backoff=10, maximum=300):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.maximum = maximum
+        self.circuits = {}
+        self.lock = threading.Lock()
+
+    def circuit(self, url):
+        parts = urlsplit(url)
+        host = parts.scheme, parts.netloc
+
+        with self.lock:
+            circuit = self.circuits.get(host, None)
+            if circuit is None:
+                circuit = self.circuits[host] = Circuit(
+                    threshold=self.threshold,
+                    backoff=self.backoff,
+                    maximum=self.maximum,
+                )
+
+        return circuit
@@ -0,0 +1,91 @@
+import threading
+
+from collections import OrderedDict
+
+
+def numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class ChangeCache(object):
+    """ A bounded cache of the last published value per field, used to only publish values that changed
+
+        The least recently seen fields are evicted when the cache is full,
+        an evicted field is published again the next time it is seen.
+    """
+    def __init__(self, size=10000):
+        self.size = size
+        self.values = OrderedDict()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def within_deadband(field, last, value):
+        if not numeric(last) or not numeric(value):
+            return False
+
+        difference = abs(value - last)
+
+        if field.deadband is not None and difference <= field.deadband:
+            return True
+
+        if field.deadband_percent is not None and difference <= abs(last) * field.deadband_percent / 100:
+            return True
+
+        return False
+
+    def check(self, counts, plan, field, topic, value):
+        key = (plan.name, topic)
+        entry = self.values.get(key, None)
+
+        if entry is not None:
+            self.values.move_to_end(key)
+            last, ticks = entry
+
+            unchanged = last == value or self.within_deadband(field=field, last=last, value=value)
+            heartbeat = plan.heartbeat and ticks + 1 >= plan.heartbeat
+
+            if unchanged and not heartbeat:
+                self.values[key] = (last, ticks + 1)
+                counts["suppressed"] += 1
+                return False
+
+        self.values[key] = (value, 0)
+        counts["published"] += 1
+        return True
+
+    def changed(self, plan, field, value):
+        """ Returns True if the value should be published, False if it is suppressed
+        """
+        return bool(self.changed_many(plan=plan, field=field, messages=[(field.topic, value)]))
+
+    def changed_many(self, plan, field, messages):
+        """ The (topic, value) messages of a field that should be published, checked under a single lock
+        """
+        with self.lock:
+            counts = self.counts.setdefault(plan.name, {"published": 0, "suppressed": 0})
+            changed = [
+                (topic, value) for topic, value in messages
+                if self.check(counts=counts, plan=plan, field=field, topic=topic, value=value)
+            ]
+
+            while len(self.values) > self.size:
+                self.values.popitem(last=False)
+
+        return changed
+
+    def forget(self, name):
+        """ Drop all cached values and counts of a schema
+        """
+        with self.lock:
+            for key in [key for key in self.values if key[0] == name]:
+                del self.values[key]
+            self.counts.pop(name, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "cached": len(self.values),
+                "size": self.size,
+                "schemas": {name: dict(counts) for name, counts in self.counts.items()},
+            }
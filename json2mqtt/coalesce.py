@@ -0,0 +1,84 @@
+import threading
+import time
+
+
+class Entry(object):
+    __slots__ = ('response', 'data', 'created', 'consumers')
+
+    def __init__(self, response, data, created, consumer):
+        self.response = response
+        self.data = data
+        self.created = created
+        self.consumers = {consumer}
+
+
+class ResponseCache(object):
+    """ Share one fetch and json decode between the schemas that poll the same url with the same headers
+
+        A response is reused by every other schema on the same key until it is older
+        than the smallest interval of those schemas. A schema never gets the same response twice.
+    """
+    def __init__(self, lock=threading.Lock, clock=time.monotonic):
+        self.entries = {}
+        self.intervals = {}
+        self.locks = {}
+        self.lock_factory = lock
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(url, headers):
+        return url, tuple(sorted(headers.items()))
+
+    def register(self, key, name, interval):
+        with self.lock:
+            self.intervals.setdefault(key, {}).update({name: interval})
+
+    def unregister(self, name):
+        with self.lock:
+            for key, intervals in list(self.intervals.items()):
+                intervals.pop(name, None)
+
+                if not intervals:
+                    del self.intervals[key]
+                    self.entries.pop(key, None)
+                    self.locks.pop(key, None)
+
+    def shared(self, key):
+        with self.lock:
+            return len(self.intervals.get(key, ())) > 1
+
+    def key_lock(self, key):
+        """ The lock to hold while fetching a key, so concurrent schemas wait for a single request
+        """
+        with self.lock:
+            lock = self.locks.get(key, None)
+            if lock is None:
+                lock = self.locks[key] = self.lock_factory()
+
+        return lock
+
+    def get(self, key, name):
+        now = self.clock()
+
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None or name in entry.consumers:
+                return None
+
+            ttl = min(self.intervals.get(key, {}).values(), default=0)
+            if now - entry.created >= ttl:
+                del self.entries[key]
+                return None
+
+            entry.consumers.add(name)
+
+        return entry
+
+    def put(self, key, name, response, data):
+        entry = Entry(response=response, data=data, created=self.clock(), consumer=name)
+
+        with self.lock:
+            self.entries[key] = entry
+
+        return entry
@@ -0,0 +1,66 @@
+import json
+
+from json2mqtt.settings import ConfigError
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JsonCodec(object):
+    """ Decodes and encodes json with the standard library
+    """
+    name = "json"
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(value):
+        return json.dumps(value)
+
+
+class OrjsonCodec(JsonCodec):
+    """ Decodes and encodes json with orjson, falling back to the standard library
+        for what orjson refuses, like NaN, integers over 64 bits and non string keys
+
+        orjson encodes compact json without escaping unicode, which is not byte for byte the same as the standard library.
+    """
+    name = "orjson"
+
+    @staticmethod
+    def loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(data)
+
+    @staticmethod
+    def dumps(value):
+        try:
+            return orjson.dumps(value).decode('utf-8')
+        except TypeError:
+            return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+CODECS = {
+    "json": JsonCodec,
+    "orjson": OrjsonCodec,
+}
+
+
+def get_codec(name="auto"):
+    """ The codec for a json_codec setting, auto picks orjson when it is installed
+    """
+    if name == "auto":
+        name = "json" if orjson is None else "orjson"
+
+    if name not in CODECS:
+        raise ConfigError(f'json_codec must be one of auto, {", ".join(CODECS)}')
+
+    if name == "orjson" and orjson is None:
+        raise ConfigError('The orjson codec requires orjson: pip install json2mqtt[fast]')
+
+    return CODECS[name]()
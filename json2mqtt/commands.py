@@ -1,7 +1,15 @@
+import json
 import os
+import queue
+import threading
 
 
 class CommandHandler(object):
+    """ Runs the commands received on the command topics and replies on the talkback topic
+
+        Commands run one at a time on a worker thread while holding lock, apart from the mqtt network loop.
+        Replies to commands with a correlation id are published as json on talkback/<id>.
+    """
     def __init__(self, client):
         self.client = client
         self.settings = self.client.settings
@@ -11,6 +19,15 @@ class CommandHandler(object):
 
         self.topic = f"{self.settings.mqtt_topic}/talkback"
 
+        self.queue = queue.Queue(maxsize=self.settings.command_queue_size)
+        self.thread = None
+        self.lock = threading.RLock()
+
+        # The command being run and its correlation id, commands run one at a time
+        self.command = None
+        self.correlation = None
+        self.replied = False
+
         self.routing = {
             # Handles base_topic/schema/+
             "schema": {
@@ -31,49 +48,116 @@ class CommandHandler(object):
                 "remove_timer": self.scheduler_remove_timer,
                 "pause_timer": self.scheduler_pause_timer,
                 "start_timer": self.scheduler_start_timer,
+                "changes": self.scheduler_changes,
+                "stats": self.scheduler_stats,
+                "queue": self.scheduler_queue,
             }
         }
 
-    def dispatcher(self, section, task, payload):
-        section = self.routing.get(section, {})
-        fn = section.get(task, None)
+    def dispatcher(self, section, task, payload, correlation=None):
+        fn = self.routing.get(section, {}).get(task, None)
+        if fn is None:
+            return
+
+        self.command = f"{section}/{task}"
+        self.correlation = correlation
+        self.replied = False
+
+        try:
+            with self.lock:
+                # noinspection PyArgumentList
+                fn(payload.decode('ascii'))
+
+        except Exception as e:
+            self.logger.error(f'Failed to run {self.command}: {e}')
+            self.reply(f"Failed to run {self.command}: {e}")
+
+        finally:
+            # Acknowledge correlated commands that have no output of their own
+            if correlation is not None and not self.replied:
+                self.reply(None)
+
+            self.command = self.correlation = None
+
+    def reply(self, value):
+        """ Publish the output of a command on the talkback topic,
+            or as json with the correlation id on talkback/<id> if the command had one
+        """
+        self.replied = True
+        topic = self.topic
+
+        if self.correlation is not None:
+            topic = f"{self.topic}/{self.correlation}"
+            value = json.dumps({"id": self.correlation, "command": self.command, "reply": value})
+        elif isinstance(value, (dict, list)):
+            value = json.dumps(value)
+
+        self.client.publish(topic=topic, payload=value)
+
+    def submit(self, section, task, payload, correlation=None):
+        """ Queue a command for the worker thread, returns False if the queue is full
+        """
+        try:
+            self.queue.put_nowait((section, task, payload, correlation))
+        except queue.Full:
+            self.logger.warning(f'Command queue is full, dropping {section}/{task}')
+            return False
+
+        return True
+
+    def work(self):
+        while True:
+            command = self.queue.get()
+            if command is None:
+                break
+
+            section, task, payload, correlation = command
+            self.dispatcher(section=section, task=task, payload=payload, correlation=correlation)
 
-        if fn is not None:
-            # noinspection PyArgumentList
-            fn(payload.decode('ascii'))
+    def start(self):
+        self.thread = threading.Thread(target=self.work, name='json2mqtt-commands', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=timeout)
+
+        return True
 
     def schema_list(self, payload):
         self.logger.debug('Running schema/list')
-        self.client.publish(topic=self.topic, payload="Schemas: " + ",".join(self.schemas.keys()))
+        self.reply("Schemas: " + ",".join(self.schemas.keys()))
 
     def schema_import(self, payload):
         self.logger.debug('Running schema/import')
 
         if self.schemas.import_all():
-            self.client.publish(topic=self.topic, payload="Imported all schemas from disk")
+            self.reply("Imported all schemas from disk")
         else:
-            self.client.publish(topic=self.topic, payload="Import failed")
+            self.reply("Import failed")
 
     def schema_dump(self, payload):
         self.logger.debug('Running schema/dump')
 
         if self.schemas.dump_all():
-            self.client.publish(topic=self.topic, payload="Saved all schemas to disk")
+            self.reply("Saved all schemas to disk")
         else:
-            self.client.publish(topic=self.topic, payload="Failed to save all schemas to disk")
+            self.reply("Failed to save all schemas to disk")
 
     def schema_add(self, payload):
         self.logger.debug('Running schema/add')
 
         data = self.schemas.load(payload)
         if not data:
-            self.client.publish(topic=self.topic, payload="Invalid json for schema!")
+            self.reply("Invalid json for schema!")
             return False
 
         if self.schemas.add_schema(schema=data):
-            self.client.publish(topic=self.topic, payload=f"Schema {data.get('name')} added to schemas")
+            self.reply(f"Schema {data.get('name')} added to schemas")
         else:
-            self.client.publish(topic=self.topic, payload="Failed to add payload to schemas")
+            self.reply("Failed to add payload to schemas")
 
     def schema_add_file(self, payload):
         self.logger.debug('Running schema/add_file')
@@ -81,50 +165,50 @@ class CommandHandler(object):
 
         if os.path.isfile(filename):
             if self.schemas.add_schema_file(filename=filename):
-                self.client.publish(topic=self.topic, payload=f"Schema {payload} loaded from file")
+                self.reply(f"Schema {payload} loaded from file")
             else:
-                self.client.publish(topic=self.topic, payload="Failed to load file from payload to schemas")
+                self.reply("Failed to load file from payload to schemas")
         else:
-            self.client.publish(topic=self.topic, payload="Schema file from payload not found")
+            self.reply("Schema file from payload not found")
 
     def schema_remove(self, payload):
         self.logger.debug('Running schema/remove')
 
         if self.schemas.remove_schema(name=payload):
-            self.client.publish(topic=self.topic, payload=f"Schema {payload} removed from schemas")
+            self.reply(f"Schema {payload} removed from schemas")
         else:
-            self.client.publish(topic=self.topic, payload="Schema from payload not found")
+            self.reply("Schema from payload not found")
 
     def scheduler_list(self, payload):
         self.logger.debug('Running scheduler/list')
-        self.client.publish(topic=self.topic, payload="Schedulers: " + ",".join(self.scheduler.timers.keys()))
+        self.reply("Schedulers: " + ",".join(self.scheduler.timers.keys()))
 
     def scheduler_stop(self, payload):
         self.logger.debug('Running scheduler/stop')
 
         if self.scheduler.stop():
-            self.client.publish(topic=self.topic, payload="Stopped all schema timers")
+            self.reply("Stopped all schema timers")
         else:
-            self.client.publish(topic=self.topic, payload="Failed to stop all schema timers")
+            self.reply("Failed to stop all schema timers")
 
     def scheduler_start(self, payload):
         self.logger.debug('Running scheduler/start')
 
         if self.scheduler.start():
-            self.client.publish(topic=self.topic, payload="Started all schema timers")
+            self.reply("Started all schema timers")
         else:
-            self.client.publish(topic=self.topic, payload="Failed to start all schema timers")
+            self.reply("Failed to start all schema timers")
 
     def scheduler_add_timer(self, payload):
         self.logger.debug('Running scheduler/add_timer')
 
         schema = self.schemas.get(payload)
         if not schema:
-            self.client.publish(topic=self.topic, payload="Failed to add timer: schema not found")
+            self.reply("Failed to add timer: schema not found")
             return False
 
         if schema.get('name') in self.scheduler.timers:
-            self.client.publish(topic=self.topic, payload="Failed to add timer: already exists!")
+            self.reply("Failed to add timer: already exists!")
             return False
 
         self.scheduler.add_timer(name=schema.get('name'))
@@ -134,7 +218,7 @@ class CommandHandler(object):
 
         schema = self.schemas.get(payload)
         if not schema:
-            self.client.publish(topic=self.topic, payload="Failed to add timer: schema not found")
+            self.reply("Failed to add timer: schema not found")
             return False
 
         self.scheduler.remove_timer(name=schema.get('name'))
@@ -144,7 +228,7 @@ class CommandHandler(object):
 
         schema = self.schemas.get(payload)
         if not schema:
-            self.client.publish(topic=self.topic, payload="Failed to add timer: schema not found")
+            self.reply("Failed to add timer: schema not found")
             return False
 
         self.scheduler.pause_timer(name=schema.get('name'))
@@ -154,7 +238,24 @@ class CommandHandler(object):
 
         schema = self.schemas.get(payload)
         if not schema:
-            self.client.publish(topic=self.topic, payload="Failed to start timer: schema not found")
+            self.reply("Failed to start timer: schema not found")
             return False
 
         self.scheduler.add_timer(name=schema.get('name'))
+
+    def scheduler_changes(self, payload):
+        self.logger.debug('Running scheduler/changes')
+        self.reply(self.scheduler.changes.stats())
+
+    def scheduler_stats(self, payload):
+        self.logger.debug('Running scheduler/stats')
+
+        self.reply(self.scheduler.stats())
+
+    def scheduler_queue(self, payload):
+        self.logger.debug('Running scheduler/queue')
+        stats = self.client.outbox.stats()
+        if self.client.spool is not None:
+            stats["spool"] = self.client.spool.stats()
+
+        self.reply(stats)
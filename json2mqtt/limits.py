@@ -0,0 +1,101 @@
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+
+class TokenBucket(object):
+    """ Allows rate requests per second on average, with bursts of up to burst requests
+
+        reserve() takes a token and returns how long to wait before it may be used, so coroutines can await it.
+        take() only takes a token that is available now, so a thread can try again later instead of sleeping.
+    """
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(max(burst, 1))
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = self.clock()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def take(self):
+        """ Take a token if one is available, returns 0.0 when taken or the seconds until one will be
+        """
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+
+            return (1 - self.tokens) / self.rate
+
+
+class HostLimit(object):
+    """ The max requests in flight and the max requests per second for a single host
+    """
+    # Seconds to wait before trying again while all requests in flight to the host are busy
+    retry = 0.05
+
+    def __init__(self, max_in_flight=0, rate=0, burst=1, semaphore=threading.BoundedSemaphore):
+        self.semaphore = semaphore(max_in_flight) if max_in_flight else None
+        self.bucket = TokenBucket(rate=rate, burst=burst) if rate else None
+
+    def try_acquire(self):
+        """ Take a request slot without blocking, returns 0.0 when the request may be sent now
+            or the seconds to wait before trying again
+        """
+        if self.semaphore is not None and not self.semaphore.acquire(blocking=False):
+            return self.retry
+
+        delay = self.bucket.take() if self.bucket is not None else 0.0
+        if delay and self.semaphore is not None:
+            self.semaphore.release()
+
+        return delay
+
+    def release(self):
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+
+class HostLimits(object):
+    """ The HostLimit per scheme and host, shared by all schemas polling that host
+
+        Hosts without an entry in hosts use the default max_in_flight and rate, 0 means unlimited.
+    """
+    def __init__(self, max_in_flight=0, rate=0, hosts=None, semaphore=threading.BoundedSemaphore):
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.hosts = hosts or {}
+        self.semaphore = semaphore
+        self.limits = {}
+        self.lock = threading.Lock()
+
+    def limit(self, url):
+        parts = urlsplit(url)
+        host = parts.scheme, parts.netloc
+
+        with self.lock:
+            limit = self.limits.get(host, None)
+            if limit is None:
+                config = self.hosts.get(parts.hostname, self.hosts.get(parts.netloc, {}))
+                limit = self.limits[host] = HostLimit(
+                    max_in_flight=config.get('max_in_flight', self.max_in_flight),
+                    rate=config.get('rate', self.rate),
+                    burst=config.get('burst', 1),
+                    semaphore=self.semaphore,
+                )
+
+        return limit
@@ -0,0 +1,198 @@
+import bisect
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HISTOGRAMS = {
+    "http_request_seconds": "Time spent on http requests",
+    "json_decode_seconds": "Time spent decoding json responses",
+    "process_seconds": "Time spent extracting and publishing fields",
+    "publish_seconds": "Time spent handing messages to the mqtt client per tick",
+}
+
+COUNTERS = {
+    "fetch_success_total": "Successfully processed responses",
+    "fetch_failure_total": "Failed requests, error responses and invalid json",
+    "type_mismatch_total": "Fields skipped because their value has the wrong type",
+    "skipped_fields_total": "Fields skipped because their path has no value",
+    "push_total": "Documents received on the push path",
+    "push_failure_total": "Documents received on the push path that were not valid json",
+    "stream_records_total": "Records received from stream sources",
+}
+
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics(object):
+    """ Histograms and counters per schema, exported as prometheus text or as a dictionary for mqtt
+    """
+    prefix = "json2mqtt_"
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, schema, value):
+        with self.lock:
+            histogram = self.histograms.get((name, schema), None)
+            if histogram is None:
+                histogram = self.histograms[(name, schema)] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, schema, amount=1):
+        if not amount:
+            return
+
+        with self.lock:
+            self.counters[(name, schema)] = self.counters.get((name, schema), 0) + amount
+
+    def gauge(self, name, function, description="", kind="gauge"):
+        """ Register a callable that returns the current value of a gauge,
+            or of a counter kept elsewhere with kind counter
+        """
+        self.gauges[name] = (function, description, kind)
+
+    def counter(self, name, function, description=""):
+        """ Register a callable that returns the current total of a counter kept elsewhere
+        """
+        self.gauge(name=name, function=function, description=description, kind="counter")
+
+    def state(self):
+        """ The raw histograms and counters, to merge them into the metrics of another process
+        """
+        with self.lock:
+            return {
+                "histograms": {key: (list(h.counts), h.sum, h.count) for key, h in self.histograms.items()},
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, state):
+        with self.lock:
+            for key, (counts, total, count) in state["histograms"].items():
+                histogram = self.histograms.get(key, None)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+            for key, value in state["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            schemas = {}
+
+            for (name, schema), histogram in self.histograms.items():
+                schemas.setdefault(schema, {})[name] = {
+                    "count": histogram.count,
+                    "mean": round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                }
+
+            for (name, schema), value in self.counters.items():
+                schemas.setdefault(schema, {})[name] = value
+
+        return {
+            "schemas": schemas,
+            "gauges": {name: function() for name, (function, _, _) in self.gauges.items()},
+        }
+
+    def prometheus(self):
+        lines = []
+
+        with self.lock:
+            for name, description in HISTOGRAMS.items():
+                lines.append(f"# HELP {self.prefix}{name} {description}")
+                lines.append(f"# TYPE {self.prefix}{name} histogram")
+
+                for (metric, schema), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+
+                    schema = label(schema)
+                    for bound, total in histogram.cumulative():
+                        lines.append(f'{self.prefix}{name}_bucket{{schema="{schema}",le="{bound}"}} {total}')
+                    lines.append(f'{self.prefix}{name}_sum{{schema="{schema}"}} {histogram.sum}')
+                    lines.append(f'{self.prefix}{name}_count{{schema="{schema}"}} {histogram.count}')
+
+            for name, description in COUNTERS.items():
+                lines.append(f"# HELP {self.prefix}{name} {description}")
+                lines.append(f"# TYPE {self.prefix}{name} counter")
+
+                for (metric, schema), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f'{self.prefix}{name}{{schema="{label(schema)}"}} {value}')
+
+        for name, (function, description, kind) in sorted(self.gauges.items()):
+            lines.append(f"# HELP {self.prefix}{name} {description}")
+            lines.append(f"# TYPE {self.prefix}{name} {kind}")
+            lines.append(f"{self.prefix}{name} {function()}")
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.prometheus().encode('utf-8')
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """ Serves the metrics in prometheus text format on /metrics
+    """
+    daemon_threads = True
+
+    def __init__(self, metrics, host="127.0.0.1", port=9100):
+        super().__init__((host, port), MetricsHandler)
+        self.metrics = metrics
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='json2mqtt-metrics', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        return True
@@ -1,11 +1,17 @@
 import os
 import socket
 import sys
+import threading
 import time
 import paho.mqtt.client as mqtt
 
 from json2mqtt.commands import CommandHandler
-from json2mqtt.scheduler import Scheduler
+from json2mqtt.metrics import MetricsServer
+from json2mqtt.outbox import Outbox
+from json2mqtt.push import PushServer
+from json2mqtt.scheduler import create_scheduler
+from json2mqtt.spool import Spool
+from json2mqtt.watcher import SchemaWatcher
 
 
 # noinspection PyMethodOverriding
@@ -16,11 +22,31 @@ class MQTTListener(mqtt.Client):
         self.schemas = schemas
         self.settings = settings
         self.scheduler = None
+        self.metrics_server = None
+        self.push_server = None
+        self.watcher = None
 
         self.online_topic = f"{self.settings.mqtt_topic}/online"
-        self.command_topic = f"{self.settings.mqtt_topic}/command/+/+"
+        self.command_topic = f"{self.settings.mqtt_topic}/command/#"
         self.command_handler = None
 
+        self.outbox = Outbox(
+            capacity=self.settings.publish_queue_size,
+            policy=self.settings.publish_queue_policy,
+            coalesce=self.settings.publish_coalesce,
+        )
+        self.online = threading.Event()
+        self.flusher = None
+
+        self.spool = None
+        if self.settings.spool_file:
+            self.spool = Spool(
+                filename=self.settings.spool_file,
+                max_messages=self.settings.spool_max_messages,
+                max_age=self.settings.spool_max_age,
+                logger=self.logger,
+            )
+
     def topic(self, name, key, base_topic=None):
         base = base_topic or self.settings.mqtt_topic
         return f"{base}/{name}/{key}"
@@ -28,15 +54,89 @@ class MQTTListener(mqtt.Client):
     def on_log(self, client, userdata, level, buffer):
         self.logger.debug(buffer)
 
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        """ Queue a message in the outbox, the flusher thread hands it to the broker once connected
+        """
+        return self.outbox.put(topic=topic, payload=payload, qos=qos, retain=retain)
+
+    def publish_many(self, messages, qos=0, retain=False):
+        """ Queue a batch of (topic, payload) messages in the outbox at once
+        """
+        return self.outbox.put_many(messages=messages, qos=qos, retain=retain)
+
+    def send(self, messages):
+        """ Hand messages to paho, returns the amount accepted before the connection was lost
+        """
+        sent = 0
+        for message in messages:
+            info = super().publish(topic=message.topic, payload=message.payload, qos=message.qos, retain=message.retain)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                break
+            sent += 1
+
+        # Let the network loop write the batch before handing over the next one
+        while self.want_write() and self.online.is_set():
+            time.sleep(0.005)
+
+        return sent
+
+    def replay(self):
+        """ Move queued messages to the spool while offline or while the spool is not empty,
+            and replay the spool in order at spool_replay_rate messages per second once connected
+        """
+        online = self.online.is_set()
+        self.spool.write(self.outbox.get(limit=1000, timeout=0 if online else 1))
+
+        if not online:
+            return
+
+        rate = self.settings.spool_replay_rate
+        batch = max(1, int(rate // 10)) if rate else 100
+
+        start = time.monotonic()
+        rows = self.spool.read(limit=batch)
+        sent = self.send([message for _, message in rows])
+        if sent:
+            self.spool.remove(last_id=rows[sent - 1][0])
+
+        if rate:
+            time.sleep(max(0.0, len(rows) / rate - (time.monotonic() - start)))
+
+    def forward(self):
+        if self.spool is not None and (len(self.spool) or not self.online.is_set()):
+            return self.replay()
+
+        if not self.online.wait(timeout=1):
+            return
+
+        messages = self.outbox.get(limit=100, timeout=1)
+        sent = self.send(messages)
+
+        if self.spool is not None and sent < len(messages):
+            self.spool.write(messages[sent:])
+
+    def flush(self):
+        while True:
+            self.forward()
+
+    def start_flusher(self):
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self.flush, name='json2mqtt-publish', daemon=True)
+            self.flusher.start()
+
     def on_connect(self, client, userdata, flags, rc):
+        self.online.set()
         self.logger.info("Sending to will topic we're online")
-        client.publish(topic=self.online_topic, payload=1)
+        super().publish(topic=self.online_topic, payload=1)
 
         self.logger.info("Subscribing to command topic...")
         client.subscribe(self.command_topic)
 
     def on_disconnect(self, client, userdata, rc):
-        self.logger.error("Disconnected from broker....")
+        self.online.clear()
+        self.logger.error(f"Disconnected from broker.... {len(self.outbox)} messages queued")
+        if self.spool is not None:
+            self.logger.warning(f"Spooling messages to {self.spool.filename} until the broker is back")
 
     def on_subscribe(self, client, userdata, mid, granted_qos):
         self.logger.info(f"Subscribed to: {self.command_topic}")
@@ -44,12 +144,16 @@ class MQTTListener(mqtt.Client):
     def on_message(self, client, userdata, message):
         self.logger.debug("Incoming message on {}: {}".format(message.topic, message.payload))
 
-        section, task = str(message.topic).split('/')[-2:]
+        # command/<section>/<task>, optionally followed by a correlation id for the reply
+        parts = str(message.topic)[len(self.command_topic) - 1:].split('/', 2)
+        if len(parts) < 2:
+            return
 
-        self.command_handler.dispatcher(
-            section=section,
-            task=task,
-            payload=message.payload
+        self.command_handler.submit(
+            section=parts[0],
+            task=parts[1],
+            payload=message.payload,
+            correlation=parts[2] if len(parts) > 2 else None,
         )
 
     def setup_listener(self):
@@ -81,13 +185,53 @@ class MQTTListener(mqtt.Client):
             keepalive=60
         )
 
+    def register_gauges(self, metrics):
+        metrics.gauge("publish_queue_depth", lambda: len(self.outbox), "Messages waiting to be sent to the broker")
+        metrics.counter("publish_coalesced_total", lambda: self.outbox.coalesced, "Queued messages replaced by a newer value")
+        metrics.counter("publish_dropped_total", lambda: self.outbox.dropped, "Messages dropped because the publish queue was full")
+
+        if self.spool is not None:
+            metrics.gauge("spool_depth", lambda: len(self.spool), "Messages in the spool waiting to be replayed")
+            metrics.counter("spool_dropped_total", lambda: self.spool.dropped, "Messages dropped from the spool by the size and age caps")
+
     def run(self):
         self.setup_listener()
 
-        self.scheduler = Scheduler(client=self)
+        self.start_flusher()
+
+        self.scheduler = create_scheduler(client=self)
+        self.register_gauges(metrics=self.scheduler.metrics)
         self.scheduler.start()
 
-        self.command_handler = CommandHandler(client=self)
+        if self.settings.metrics_port:
+            self.logger.info(f"Serving metrics on http://{self.settings.metrics_host}:{self.settings.metrics_port}/metrics")
+            self.metrics_server = MetricsServer(
+                metrics=self.scheduler.metrics,
+                host=self.settings.metrics_host,
+                port=self.settings.metrics_port,
+            ).start()
+
+        if self.settings.push_port:
+            self.logger.info(f"Receiving pushed data on http://{self.settings.push_host}:{self.settings.push_port}")
+            self.push_server = PushServer(
+                schemas=self.schemas,
+                scheduler=self.scheduler,
+                logger=self.logger,
+                host=self.settings.push_host,
+                port=self.settings.push_port,
+                max_body=self.settings.push_max_body,
+            ).start()
+
+        self.command_handler = CommandHandler(client=self).start()
+
+        if self.settings.watch_schemas:
+            self.watcher = SchemaWatcher(
+                schemas=self.schemas,
+                scheduler=self.scheduler,
+                logger=self.logger,
+                interval=self.settings.watch_interval,
+                lock=self.command_handler.lock,
+            ).start()
 
         while True:
             try:
@@ -97,6 +241,21 @@ class MQTTListener(mqtt.Client):
 
             except KeyboardInterrupt:
                 self.logger.warning("Ctrl+C Pressed! Quitting Listener.")
-                self.scheduler.stop()
-                self.disconnect()
+                self.shutdown()
                 sys.exit(1)
+
+    def shutdown(self):
+        self.command_handler.stop()
+
+        for service in (self.watcher, self.push_server):
+            if service is not None:
+                service.stop()
+
+        self.scheduler.close()
+
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.spool is not None:
+            self.spool.close()
+
+        self.disconnect()
@@ -0,0 +1,101 @@
+import collections
+import itertools
+import threading
+
+
+class Message(object):
+    __slots__ = ('topic', 'payload', 'qos', 'retain')
+
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class Outbox(object):
+    """ A bounded queue of messages waiting to be sent to the broker
+
+        Every message is sent by default. With coalesce, a message for a topic that is still queued
+        replaces the queued payload, so only the latest value per topic is sent. When the queue is full, drop_oldest drops
+        the message that waited longest and drop_newest refuses the new message.
+    """
+    policies = ("drop_oldest", "drop_newest")
+
+    def __init__(self, capacity=10000, policy="drop_oldest", coalesce=False):
+        self.capacity = max(int(capacity), 1)
+        self.policy = policy
+        self.coalesce = coalesce
+
+        self.messages = collections.OrderedDict()
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.sent = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def _put(self, message):
+        if self.coalesce and message.topic in self.messages:
+            self.messages[message.topic] = message
+            self.coalesced += 1
+            return True
+
+        if len(self.messages) >= self.capacity:
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return False
+            self.messages.popitem(last=False)
+
+        self.messages[message.topic if self.coalesce else next(self.sequence)] = message
+        self.queued += 1
+        return True
+
+    def put(self, topic, payload=None, qos=0, retain=False):
+        """ Queue a message, returns False if the message was dropped
+        """
+        with self.condition:
+            queued = self._put(Message(topic=topic, payload=payload, qos=qos, retain=retain))
+            self.condition.notify()
+
+        return queued
+
+    def put_many(self, messages, qos=0, retain=False):
+        """ Queue a batch of (topic, payload) messages at once, returns the amount that was not dropped
+        """
+        with self.condition:
+            queued = sum(self._put(Message(topic=topic, payload=payload, qos=qos, retain=retain)) for topic, payload in messages)
+            self.condition.notify()
+
+        return queued
+
+    def get(self, limit=100, timeout=None):
+        """ Take up to limit messages, oldest first, waiting up to timeout for the first one
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.messages, timeout=timeout):
+                return []
+
+            batch = []
+            while self.messages and len(batch) < limit:
+                batch.append(self.messages.popitem(last=False)[1])
+
+            self.sent += len(batch)
+
+        return batch
+
+    def stats(self):
+        with self.condition:
+            return {
+                "depth": len(self.messages),
+                "capacity": self.capacity,
+                "policy": self.policy,
+                "queued": self.queued,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "sent": self.sent,
+            }
@@ -0,0 +1,123 @@
+import re
+
+import jmespath
+
+from collections import namedtuple
+from json2mqtt.stream import simple_path
+
+# Characters that can't be part of a topic level
+TOPIC_UNSAFE = re.compile(r'[/+#\x00]')
+
+TYPES = {
+    "String": str,
+    "Integer": int,
+    "Float": float,
+    "Boolean": bool,
+    "None": None,
+    "List": list,
+    "Dictionary": dict,
+}
+
+
+def resolve(stringtype):
+    """ Map a type name from a schema to a python type, None maps to NoneType
+    """
+    ctype = TYPES.get(str(stringtype).title(), None)
+    return type(None) if ctype is None else ctype
+
+
+class FieldPlan(namedtuple('FieldPlan', (
+        'key', 'path', 'expression', 'type', 'cast', 'topic', 'deadband', 'deadband_percent', 'fanout', 'fanout_key',
+        'derive', 'window', 'window_seconds'))):
+    """ A single schema field, compiled: the jmespath expression, the type to match, the cast, the topic and deadbands
+    """
+    __slots__ = ()
+
+    @classmethod
+    def compile(cls, key, cfg, topic):
+        casttype = cfg.get('cast', None)
+        cast = TYPES.get(casttype.title(), None) if casttype else None
+
+        return cls(
+            key=key,
+            path=cfg.get('path'),
+            expression=jmespath.compile(cfg.get('path')),
+            type=resolve(cfg.get('type')),
+            cast=cast,
+            topic=topic,
+            deadband=cfg.get('deadband', None),
+            deadband_percent=cfg.get('deadband_percent', None),
+            fanout=cfg.get('fanout', False),
+            fanout_key=cfg.get('fanout_key', None),
+            derive=tuple(cfg.get('derive', ())),
+            window=cfg.get('window', 10),
+            window_seconds=cfg.get('window_seconds', None),
+        )
+
+    def convert(self, value):
+        """ Cast a value to the cast type of the field, values that can't be cast are kept as they are
+        """
+        if self.cast is None:
+            return value
+
+        try:
+            return self.cast(value)
+        except (ValueError, TypeError):
+            return value
+
+    def elements(self, value):
+        """ The topic level and value of every element of a list or dict, for fan-out fields
+
+            Elements are keyed by their fanout_key attribute, elements without it by their index or dict key.
+        """
+        items = value.items() if isinstance(value, dict) else enumerate(value)
+
+        for key, element in items:
+            if self.fanout_key is not None and isinstance(element, dict) and element.get(self.fanout_key) is not None:
+                key = element[self.fanout_key]
+
+            yield TOPIC_UNSAFE.sub('_', str(key)) or '_', element
+
+
+def stream_paths(schema):
+    """ The paths to extract while a response streams in, None when the schema needs the whole document
+    """
+    if not schema.get('stream', False) or schema.get('publish', 'fields') != 'fields':
+        return None
+
+    # Records of a stream source arrive whole
+    if schema.get('source', 'poll') != 'poll':
+        return None
+
+    paths = tuple(simple_path(cfg.get('path')) for cfg in schema.get('fields', {}).values())
+    return paths if paths and None not in paths else None
+
+
+class SchemaPlan(namedtuple('SchemaPlan', (
+        'name', 'url', 'base_topic', 'fields', 'on_change', 'heartbeat', 'publish_fields', 'document_topic', 'stream', 'push', 'source'))):
+    """ Everything _process needs from a schema that does not change between ticks
+    """
+    __slots__ = ()
+
+    @classmethod
+    def compile(cls, schema, mqtt_topic):
+        name = schema.get('name')
+        base_topic = schema.get('topic', None) or mqtt_topic
+        publish = schema.get('publish', 'fields')
+
+        return cls(
+            name=name,
+            url=schema.get('url'),
+            base_topic=base_topic,
+            fields=tuple(
+                FieldPlan.compile(key=key, cfg=cfg, topic=f"{base_topic}/{name}/{key}")
+                for key, cfg in schema.get('fields', {}).items()
+            ),
+            on_change=schema.get('on_change', False),
+            heartbeat=schema.get('heartbeat', 0),
+            publish_fields=publish in ('fields', 'both'),
+            document_topic=f"{base_topic}/{name}/document" if publish in ('document', 'both') else None,
+            stream=stream_paths(schema),
+            push=schema.get('push', None),
+            source=schema.get('source', 'poll'),
+        )
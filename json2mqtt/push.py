@@ -0,0 +1,206 @@
+import asyncio
+import threading
+
+from http import HTTPStatus
+from json import JSONDecodeError
+
+
+class HttpError(Exception):
+    def __init__(self, status, close=False):
+        super().__init__(status.phrase)
+        self.status = status
+        self.close = close
+
+
+class PushServer(object):
+    """ Receives json documents POSTed to the push paths of the schemas and processes them right away
+
+        A single asyncio event loop in a background thread serves every connection, keep-alive
+        and chunked bodies included, so many senders don't need a thread each.
+        Documents go through the same field extraction and publishing as fetched responses.
+    """
+    max_headers = 100
+
+    def __init__(self, schemas, scheduler, logger, host="127.0.0.1", port=8080, max_body=1048576):
+        self.schemas = schemas
+        self.scheduler = scheduler
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.tasks = set()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='json2mqtt-push', daemon=True)
+        self.thread.start()
+
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.connection, host=self.host, port=self.port), self.loop
+        ).result()
+
+        # With port 0 the os picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def _stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+        # Idle keep-alive connections are still waiting for a request
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        return True
+
+    def url(self, path):
+        return f"http://{self.host}:{self.port}{path}"
+
+    async def connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader=reader, writer=writer)
+                    if request is None:
+                        break
+
+                    method, path, headers, body, keep_alive = request
+                    status = self.handle(method=method, path=path, body=body)
+
+                except HttpError as e:
+                    status, keep_alive = e.status, not e.close
+
+                self.respond(writer=writer, status=status, keep_alive=keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, asyncio.CancelledError):
+            pass
+
+        finally:
+            writer.close()
+            self.tasks.discard(task)
+
+    async def read_request(self, reader, writer):
+        """ Read one request, returns None when the client closed the connection
+        """
+        line = await reader.readline()
+        if not line.strip():
+            return None
+
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, close=True)
+
+        headers = await self.read_headers(reader=reader)
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+        if headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        body = await self.read_body(reader=reader, headers=headers)
+        return method, target.split('?')[0], headers, body, keep_alive
+
+    async def read_headers(self, reader):
+        headers = {}
+
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+
+            if len(headers) >= self.max_headers:
+                raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, close=True)
+
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+    async def read_body(self, reader, headers):
+        """ Read a chunked body, or a body of content-length bytes
+        """
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            return await self.read_chunked(reader=reader)
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, close=True)
+
+        if length > self.max_body:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, close=True)
+
+        return await reader.readexactly(length)
+
+    async def read_chunked(self, reader):
+        body = bytearray()
+
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                break
+
+            if len(body) + size > self.max_body:
+                raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, close=True)
+
+            body += await reader.readexactly(size)
+            await reader.readline()
+
+        # Skip the trailer
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+
+        return bytes(body)
+
+    def handle(self, method, path, body):
+        name = self.schemas.routes.get(path, None)
+        if name is None or name not in self.schemas:
+            return HTTPStatus.NOT_FOUND
+
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED
+
+        try:
+            data = self.scheduler.codec.loads(body)
+        except (JSONDecodeError, UnicodeDecodeError):
+            self.logger.error(f'Invalid json pushed for {name} to {path}')
+            self.scheduler.metrics.increment("push_failure_total", name)
+            return HTTPStatus.BAD_REQUEST
+
+        # noinspection PyBroadException
+        try:
+            self.scheduler.push(name=name, data=data)
+        except Exception as e:
+            self.logger.error(f'Failed to process data pushed for {name}: {e}')
+            return HTTPStatus.INTERNAL_SERVER_ERROR
+
+        return HTTPStatus.ACCEPTED
+
+    @staticmethod
+    def respond(writer, status, keep_alive):
+        headers = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            "Content-Length: 0",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == HTTPStatus.METHOD_NOT_ALLOWED:
+            headers.append("Allow: POST")
+
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1'))
@@ -1,20 +1,19 @@
-import json
-import jmespath
-import multitimer
-import requests
+import threading
+import time
 
 from json import JSONDecodeError
-
-
-TYPES = {
-    "String": str,
-    "Integer": int,
-    "Float": float,
-    "Boolean": bool,
-    "None": None,
-    "List": list,
-    "Dictionary": dict,
-}
+from json2mqtt.breaker import Breakers
+from json2mqtt.changes import ChangeCache
+from json2mqtt.codec import get_codec
+from json2mqtt.coalesce import ResponseCache
+from json2mqtt.limits import HostLimits
+from json2mqtt.metrics import Metrics
+from json2mqtt.plan import TYPES  # noqa: F401
+from json2mqtt.sessions import SessionPool, Validators
+from json2mqtt.sources import StreamSource
+from json2mqtt.stream import CHUNK_SIZE, Extractor
+from json2mqtt.timers import Deferred, Dispatcher, Timer, phase
+from json2mqtt.windows import Windows
 
 
 class Scheduler(object):
@@ -25,98 +24,424 @@ class Scheduler(object):
         self.logger = self.client.logger
         self.timers = {}
 
-    @staticmethod
-    def _typematch(instance, stringtype):
-        ctype = TYPES.get(stringtype.title(), None)
-        return isinstance(instance, ctype)
+        self.sessions = SessionPool(pool_size=self.settings.http_pool_size)
+        self.validators = Validators()
+        self.changes = ChangeCache(size=self.settings.change_cache_size)
+        self.windows = Windows()
+        self.responses = self.response_cache()
+        self.limits = self.host_limits(semaphore=threading.BoundedSemaphore)
+        self.dispatcher = Dispatcher(workers=self.settings.max_concurrency)
+        self.queued = {}
+        self.breakers = Breakers(
+            threshold=self.settings.circuit_threshold,
+            backoff=self.settings.circuit_backoff,
+            maximum=self.settings.circuit_max_backoff,
+        )
+
+        self.codec = get_codec(self.settings.json_codec)
+        self.started = False
+        self.reporter = None
+        self.metrics = Metrics()
+        self.metrics.gauge("timers", lambda: len(self.timers), "Schema timers")
+        self.metrics.gauge("queue_depth", lambda: self.dispatcher.pending, "Runs waiting for a free worker thread")
 
-    def _process(self, data, schema):
-        name = schema.get('name')
-        url = schema.get('url')
+    @staticmethod
+    def response_cache():
+        return ResponseCache()
+
+    def host_limits(self, semaphore):
+        return HostLimits(
+            max_in_flight=self.settings.host_max_in_flight,
+            rate=self.settings.host_rate,
+            hosts=self.settings.host_limits,
+            semaphore=semaphore,
+        )
+
+    def _process(self, data, schema, request=None):
+        plan = self.schemas.plan(schema)
+        document = {} if plan.document_topic else None
+        skipped = mismatched = 0
+        publishing = 0.0
+
+        self.logger.debug(f'Processing data for {plan.name} from {plan.url}')
+
+        for field in plan.fields:
+            value = field.expression.search(data)
+
+            if value is None:
+                skipped += 1
+                continue
 
-        self.logger.debug(f'Processing data for {name} from {url}')
+            if not isinstance(value, field.type):
+                self.logger.debug(f"Incorrect type for {plan.name}: No {field.type.__name__}: Skipping values for {field.key}={value}")
+                mismatched += 1
+                continue
 
-        for key, cfg in schema.get('fields', {}).items():
-            self.logger.debug(f'Parsing field {key}')
+            value = field.convert(value)
 
-            value = jmespath.search(cfg.get('path'), data)
+            derived = self.windows.add(plan=plan, field=field, value=value) if field.derive else ()
 
-            stringtype = cfg.get('type')
-            if value is None or not self._typematch(instance=value, stringtype=stringtype):
-                self.logger.debug(f"Incorrect type for {name}: No {stringtype}: Skipping values for {key}={value}")
-                continue
+            if document is not None:
+                document[field.key] = value
+                document.update((f"{field.key}/{metric}", result) for metric, result in derived)
 
-            casttype = cfg.get('cast', None)
-            if casttype:
-                cast_to = TYPES.get(casttype.title(), None)
-                try:
-                    value = cast_to(value)
-                except ValueError:
-                    pass
-
-            topic = self.client.topic(
-                name=name,
-                key=key,
-                base_topic=schema.get('topic', None)
-            )
-            self.logger.debug(f'Sending data for {name}.{key}')
+            if plan.publish_fields:
+                publishing += self.publish_field(plan=plan, field=field, value=value)
+                publishing += self.publish_many(plan=plan, field=field, messages=[
+                    (f"{field.topic}/{metric}", result) for metric, result in derived
+                ])
 
-            if isinstance(value, list) or isinstance(value, dict):
-                value = json.dumps(value)
+        if document is not None:
+            start = time.perf_counter()
+            self.publish_document(plan=plan, request=request, fields=document)
+            publishing += time.perf_counter() - start
 
-            self.client.publish(topic=topic, payload=value)
+        self.metrics.increment("skipped_fields_total", plan.name, skipped)
+        self.metrics.increment("type_mismatch_total", plan.name, mismatched)
+        self.metrics.observe("publish_seconds", plan.name, publishing)
 
         return True
 
-    def publish(self, name, response, base_topic=None):
-        for postfix, payload in (
-                ("request/status_code", response.status_code),
-                ("request/reason", response.reason),
-                ("request/success", response.ok),
-                ("request/url", response.url),
-                ("request/elapsed", str(response.elapsed))):
+    def publish_field(self, plan, field, value):
+        """ Publish the value of a field, returns the time spent publishing
+        """
+        if field.fanout and isinstance(value, (list, dict)):
+            return self.fan_out(plan=plan, field=field, value=value)
+
+        if isinstance(value, (list, dict)):
+            value = self.codec.dumps(value)
+
+        if plan.on_change and not self.changes.changed(plan=plan, field=field, value=value):
+            return 0.0
+
+        start = time.perf_counter()
+        self.client.publish(topic=field.topic, payload=value)
+        return time.perf_counter() - start
+
+    def fan_out(self, plan, field, value):
+        """ Publish every element of a list or dict to a topic of its own, in a single batch
+        """
+        messages = [
+            (f"{field.topic}/{key}", self.codec.dumps(element) if isinstance(element, (list, dict)) else field.convert(element))
+            for key, element in field.elements(value)
+        ]
+
+        return self.publish_many(plan=plan, field=field, messages=messages)
+
+    def publish_many(self, plan, field, messages):
+        """ Publish the (topic, payload) messages of a field in a single batch, returns the time spent publishing
+        """
+        if messages and plan.on_change:
+            messages = self.changes.changed_many(plan=plan, field=field, messages=messages)
+
+        if not messages:
+            return 0.0
+
+        start = time.perf_counter()
+        self.client.publish_many(messages=messages)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def request_info(response):
+        return {
+            "status_code": response.status_code,
+            "reason": response.reason,
+            "success": response.ok,
+            "url": response.url,
+            "elapsed": str(response.elapsed),
+            "not_modified": response.status_code == 304,
+            "queue_delay": round(getattr(response, 'queue_delay', 0.0), 3),
+        }
+
+    def timer_info(self, name):
+        timer = self.timers.get(name, None)
+        if timer is None:
+            return {}
+
+        stats = timer.stats()
+        info = {"missed": stats["missed"], "actual_interval": stats["actual_interval"]}
+
+        # The configured schedule to compare them with, sources have no schedule of their own
+        if "interval" in stats:
+            info.update({"interval": stats["interval"], "overrun": stats["policy"]})
+
+        return info
 
-            topic = self.client.topic(name=name, key=postfix, base_topic=base_topic)
+    def publish(self, name, request, base_topic=None):
+        for key, payload in request.items():
+            topic = self.client.topic(name=name, key=f"request/{key}", base_topic=base_topic)
             self.client.publish(topic=topic, payload=payload)
 
         return True
 
-    # noinspection PyUnboundLocalVariable, PyBroadException
-    def fetch(self, *args, **kwargs):
-        schema = kwargs.get('schema')
-        name = schema.get('name')
-        url = schema.get('url')
-        topic = schema.get('topic', None)
-        timeout = schema.get('timeout', 10)
-        headers = {
-            key: value for key, value in schema.get('headers', {})
+    def publish_document(self, plan, request, fields=None):
+        document = {"request": request}
+        if fields is not None:
+            document.update({"fields": fields})
+
+        self.client.publish(topic=plan.document_topic, payload=self.codec.dumps(document))
+
+    @staticmethod
+    def headers(schema):
+        return {
+            header.get('key'): header.get('value') for header in schema.get('headers', [])
         }
 
-        self.logger.debug(f"Fetching data for {name} from {url}")
+    def request_headers(self, schema):
+        headers = self.headers(schema=schema)
+        headers.update(self.validators.headers(schema=schema))
+        return headers
+
+    def request(self, schema):
+        """ Send the request of a schema, or raise Deferred while the host limits do not allow it yet
+
+            Runs wait for their host on the heap of the dispatcher, so a slow host never holds the worker threads.
+        """
+        stream = self.schemas.plan(schema).stream is not None
+        limit = self.limits.limit(schema.get('url'))
+        now = time.monotonic()
+
+        wait = limit.try_acquire()
+        if wait:
+            self.queued.setdefault(schema.get('name'), now)
+            raise Deferred(delay=wait)
+
+        delay = now - self.queued.pop(schema.get('name'), now)
+
+        try:
+            response = self.sessions.get(
+                schema.get('url'),
+                timeout=schema.get('timeout', 10),
+                headers=self.request_headers(schema=schema),
+                stream=stream,
+            )
+        except BaseException:
+            limit.release()
+            raise
+
+        if stream and response.status_code >= 300:
+            response.close()
+
+        # The body of a streamed response is still downloading, its slot is released once the body was read
+        response.limit = limit if stream and response.status_code < 300 else None
+        if response.limit is None:
+            limit.release()
+
+        response.queue_delay = delay
+        self.metrics.observe("http_request_seconds", schema.get('name'), response.elapsed.total_seconds())
+        return response
+
+    @staticmethod
+    def release(response):
+        """ Release the host limit slot a streamed response still holds, if any
+        """
+        limit, response.limit = getattr(response, 'limit', None), None
+        if limit is not None:
+            limit.release()
+
+    def response_key(self, schema):
+        return ResponseCache.key(url=schema.get('url'), headers=self.headers(schema=schema))
+
+    def extract(self, plan, response):
+        """ Parse a streamed response while it arrives, keeping only the values at the paths of the plan
+        """
+        extractor = Extractor(paths=plan.stream, loads=self.codec.loads)
+        try:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                extractor.feed(chunk)
+        finally:
+            self.release(response=response)
+
+        return extractor.close()
+
+    def parse(self, schema, response):
+        plan = self.schemas.plan(schema)
+        start = time.perf_counter()
+
+        if plan.stream is None:
+            data = self.codec.loads(response.content)
+        else:
+            data = self.extract(plan=plan, response=response)
+
+        self.metrics.observe("json_decode_seconds", schema.get('name'), time.perf_counter() - start)
+
+        return data
+
+    def decode(self, schema, response):
+        """ Decode a response body to share it, failures are left for handle() to report
+        """
+        if response.status_code != 200:
+            return None
 
         try:
-            response = requests.get(url, timeout=timeout, headers=headers)
-            self.publish(name=name, response=response, base_topic=topic)
+            return self.parse(schema=schema, response=response)
+        except ValueError:
+            return None
+
+    def retrieve(self, schema):
+        """ Request the url of a schema, or reuse the response another schema on the same url just retrieved
+        """
+        key = self.response_key(schema=schema)
+        if self.schemas.plan(schema).stream is not None or not self.responses.shared(key):
+            return self.request(schema=schema), None
+
+        with self.responses.key_lock(key):
+            entry = self.responses.get(key=key, name=schema.get('name'))
+            if entry is not None:
+                self.logger.debug(f"Reusing response for {schema.get('name')} from {schema.get('url')}")
+                return entry.response, entry.data
+
+            response = self.request(schema=schema)
+            data = self.decode(schema=schema, response=response)
+
+            if data is not None:
+                self.responses.put(key=key, name=schema.get('name'), response=response, data=data)
+
+        return response, data
+
+    def handle(self, schema, response, data=None):
+        plan = self.schemas.plan(schema)
+        request = self.request_info(response=response)
+        request.update(self.timer_info(name=plan.name))
+        request.update({"circuit": self.breakers.circuit(plan.url).state})
+
+        if plan.publish_fields:
+            self.publish(name=plan.name, request=request, base_topic=schema.get('topic', None))
+
+        if plan.document_topic and (response.status_code == 304 or not response.ok):
+            self.publish_document(plan=plan, request=request)
+
+        if response.status_code == 304:
+            self.logger.debug(f"Not modified: {plan.name}: Skipping processing")
+            return True
+
+        response.raise_for_status()
+        if data is None:
+            data = self.parse(schema=schema, response=response)
+
+        start = time.perf_counter()
+        result = self._process(data=data, schema=schema, request=request)
+        self.metrics.observe("process_seconds", plan.name, time.perf_counter() - start)
+        self.metrics.increment("fetch_success_total", plan.name)
+
+        self.validators.update(schema=schema, response=response)
+        return result
+
+    def received(self, schema, data, source, counter):
+        """ Process a document that was not fetched by a timer, but pushed or read from a stream
+        """
+        plan = self.schemas.plan(schema)
+        self.logger.debug(f"Processing {source} data for {plan.name}")
+
+        start = time.perf_counter()
+        result = self._process(data=data, schema=schema, request={"source": source})
+        self.metrics.observe("process_seconds", plan.name, time.perf_counter() - start)
+        self.metrics.increment(counter, plan.name)
+
+        return result
+
+    def push(self, name, data):
+        """ Process a document pushed to the push path of a schema, as if it was fetched
+        """
+        schema = self.schemas.get(name, None)
+        if schema is None:
+            return False
+
+        return self.received(schema=schema, data=data, source="push", counter="push_total")
+
+    def blocked(self, schema, circuit):
+        """ Publish the circuit state for a tick that was skipped because its host is failing,
+            or because another request is probing it
+        """
+        plan = self.schemas.plan(schema)
+        request = {"circuit": circuit.state}
+
+        self.logger.debug(f"Circuit {circuit.state} for {plan.url}: Skipping {plan.name}")
+
+        if plan.publish_fields:
+            self.publish(name=plan.name, request=request, base_topic=schema.get('topic', None))
+        if plan.document_topic:
+            self.publish_document(plan=plan, request=request)
+
+    def trip(self, schema, circuit):
+        if circuit.failure():
+            self.logger.warning(f"Circuit opened for {schema.get('url')} after {circuit.failures} failures")
+
+    def failed(self, schema, circuit, error):
+        self.logger.error(f"Failed to retrieve for {schema.get('name')}: {schema.get('url')}: {error}")
+        self.metrics.increment("fetch_failure_total", schema.get('name'))
+        self.trip(schema=schema, circuit=circuit)
+
+    # noinspection PyBroadException
+    def completed(self, schema, circuit, response, data):
+        name = schema.get('name')
+        url = schema.get('url')
 
-            response.raise_for_status()
-            return self._process(data=response.json(), schema=schema)
+        if response.status_code >= 500:
+            self.trip(schema=schema, circuit=circuit)
+        else:
+            circuit.success()
+
+        try:
+            return self.handle(schema=schema, response=response, data=data)
 
         except JSONDecodeError:
             self.logger.error(f'Invalid json for {name} from url: {url}')
+            self.metrics.increment("fetch_failure_total", name)
 
         except Exception as e:
             self.logger.error(f'Failed to retrieve for {name}: {url}: {e}')
+            self.metrics.increment("fetch_failure_total", name)
+
+    # noinspection PyBroadException
+    def fetch(self, *args, **kwargs):
+        schema = kwargs.get('schema')
+        circuit = self.breakers.circuit(schema.get('url'))
+
+        if not circuit.allow():
+            return self.blocked(schema=schema, circuit=circuit)
+
+        self.logger.debug(f"Fetching data for {schema.get('name')} from {schema.get('url')}")
+
+        try:
+            response, data = self.retrieve(schema=schema)
+        except Deferred:
+            # The run is tried again later, the next one may probe the host
+            circuit.release()
+            raise
+        except Exception as e:
+            return self.failed(schema=schema, circuit=circuit, error=e)
+
+        try:
+            return self.completed(schema=schema, circuit=circuit, response=response, data=data)
+        finally:
+            # Responses that were never read still hold their slot
+            self.release(response=response)
+
+    def stats(self):
+        """ The schedule statistics per timer
+        """
+        return {name: timer.stats() for name, timer in list(self.timers.items())}
+
+    def report(self):
+        self.client.publish(topic=f"{self.settings.mqtt_topic}/stats", payload=self.codec.dumps(self.metrics.snapshot()))
 
     def start(self):
         self.logger.info('Starting schema crawlers')
+        self.started = True
         for name, schema in self.schemas.items():
             if name not in self.timers.keys():
                 self.add_timer(name=name)
 
+        if self.settings.metrics_interval and self.reporter is None:
+            self.reporter = Timer(dispatcher=self.dispatcher, interval=self.settings.metrics_interval, function=self.report)
+            self.reporter.start()
+
         return True
 
     def stop(self):
         self.logger.info('Stopping schema crawlers')
+        self.started = False
 
         for name, schema in self.schemas.items():
             self.logger.debug(f'Stopping schema crawlers for {name}')
@@ -124,25 +449,23 @@ class Scheduler(object):
 
         return True
 
+    def close(self):
+        self.stop()
+        self.stop_timer(timer=self.reporter)
+        self.dispatcher.close()
+        return self.sessions.close()
+
     def add_timer(self, name):
         schema = self.schemas.get(name, None)
         if not schema:
             return False
 
-        if name not in self.timers:
-            interval = schema.get('interval')
-            count = schema.get('count', -1)
-
-            self.logger.info(
-                f"Starting {name} {'for {} times'.format(count) if count > 0 else 'repeating'} every {interval}s"
-            )
+        if not schema.get('url'):
+            self.logger.debug(f"Not starting a timer for {name}: it only receives pushed data")
+            return False
 
-            timer = multitimer.MultiTimer(
-                interval=interval,
-                function=self.fetch,
-                kwargs=dict(schema=schema),
-                count=count,
-            )
+        if name not in self.timers:
+            timer = self.schedule(name=name, schema=schema)
             self.timers.update({name: timer})
         else:
             timer = self.timers.get(name)
@@ -151,9 +474,61 @@ class Scheduler(object):
 
         return True
 
+    def schedule(self, name, schema):
+        """ Create the timer for a polled schema, or the source that keeps a stream open
+        """
+        plan = self.schemas.plan(schema)
+
+        if plan.source != 'poll':
+            self.logger.info(f"Starting {name} reading the {plan.source} stream from {plan.url}")
+            return self.create_source(schema=schema)
+
+        interval = schema.get('interval')
+        count = schema.get('count', -1)
+
+        self.logger.info(
+            f"Starting {name} {'for {} times'.format(count) if count > 0 else 'repeating'} every {interval}s"
+        )
+
+        if schema.get('stream', False) and plan.stream is None:
+            self.logger.warning(f"Not streaming {name}: its fields or publish mode need the whole document")
+
+        # Streamed responses are only parsed for the paths of their own schema, so they are never shared
+        if self.settings.coalesce_requests and plan.stream is None:
+            self.responses.register(key=self.response_key(schema=schema), name=name, interval=interval)
+
+        return self.create_timer(interval=interval, schema=schema, count=count)
+
+    def phase(self, schema):
+        return phase(name=schema.get('name'), interval=schema.get('interval'), window=self.settings.phase_window)
+
+    def create_source(self, schema):
+        """ Stream sources read from a blocking connection in their own thread, for either engine
+        """
+        return StreamSource(scheduler=self, schema=schema)
+
+    def create_timer(self, interval, schema, count=-1):
+        return Timer(
+            dispatcher=self.dispatcher,
+            interval=interval,
+            function=self.fetch,
+            kwargs=dict(schema=schema),
+            count=count,
+            phase=self.phase(schema=schema),
+            jitter=schema.get('jitter', 0),
+            overrun=schema.get('overrun', 'skip'),
+            limit=schema.get('max_concurrent', 1),
+        )
+
     def remove_timer(self, name):
         self.logger.info(f'Removing schema {name}')
 
+        self.validators.remove(name=name)
+        self.changes.forget(name=name)
+        self.windows.forget(name=name)
+        self.responses.unregister(name=name)
+        self.queued.pop(name, None)
+
         timer = self.timers.pop(name, None)
         if timer:
             return self.stop_timer(timer=timer)
@@ -184,3 +559,18 @@ class Scheduler(object):
             timer.join()
 
         return True
+
+
+def create_scheduler(client):
+    """ Return the scheduler for the engine configured in scheduler_engine,
+        or a scheduler that spreads the schemas over worker processes if workers is more than 1
+    """
+    if client.settings.workers > 1:
+        from json2mqtt.shards import ShardedScheduler
+        return ShardedScheduler(client=client)
+
+    if client.settings.scheduler_engine == 'asyncio':
+        from json2mqtt.aio import AsyncScheduler
+        return AsyncScheduler(client=client)
+
+    return Scheduler(client=client)
@@ -1,10 +1,17 @@
+import collections
 import glob
+import hashlib
 import json
 import os
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONDecodeError
-from jsonschema import validate, SchemaError, ValidationError
-from json2mqtt.scheduler import TYPES
+from jmespath.exceptions import JMESPathError
+from json2mqtt.codec import get_codec
+from json2mqtt.plan import SchemaPlan, TYPES
+from json2mqtt.windows import DERIVED
 
 
 KEYS_PATTERN = f"^({'|'.join(TYPES.keys())})$"
@@ -28,12 +35,46 @@ JSONSCHEMA = {
         "timeout": {
             "type": "number"
         },
+        "jitter": {
+            "type": "number",
+            "minimum": 0
+        },
+        "overrun": {
+            "type": "string",
+            "enum": ["skip", "queue", "concurrent"]
+        },
+        "max_concurrent": {
+            "type": "integer",
+            "minimum": 1
+        },
         "topic": {
             "type": "string",
         },
         "enabled": {
           "type": "boolean"
         },
+        "on_change": {
+            "type": "boolean"
+        },
+        "heartbeat": {
+            "type": "integer",
+            "minimum": 0
+        },
+        "publish": {
+            "type": "string",
+            "enum": ["fields", "document", "both"]
+        },
+        "stream": {
+            "type": "boolean"
+        },
+        "push": {
+            "type": "string",
+            "pattern": "^/"
+        },
+        "source": {
+            "type": "string",
+            "enum": ["poll", "sse", "ndjson", "longpoll"]
+        },
         "headers": {
             "type": "array",
             "items": {
@@ -50,35 +91,103 @@ JSONSCHEMA = {
         },
         "fields": {
             "type": "object",
-            "properties": {
-                "path": {
-                    "type": "string"
-                },
-                "cast": {
-                    "type": "string",
-                    "pattern": KEYS_PATTERN,
+            "additionalProperties": {
+                "type": "object",
+                "properties": {
+                    "path": {
+                        "type": "string"
+                    },
+                    "cast": {
+                        "type": "string",
+                        "pattern": KEYS_PATTERN,
+                    },
+                    "type": {
+                        "type": "string",
+                        "pattern": KEYS_PATTERN,
+                    },
+                    "deadband": {
+                        "type": "number",
+                        "minimum": 0
+                    },
+                    "deadband_percent": {
+                        "type": "number",
+                        "minimum": 0
+                    },
+                    "fanout": {
+                        "type": "boolean"
+                    },
+                    "fanout_key": {
+                        "type": "string"
+                    },
+                    "derive": {
+                        "type": "array",
+                        "items": {"enum": list(DERIVED)},
+                        "uniqueItems": True
+                    },
+                    "window": {
+                        "type": "integer",
+                        "minimum": 2,
+                        "maximum": 100000
+                    },
+                    "window_seconds": {
+                        "type": "number",
+                        "exclusiveMinimum": 0
+                    }
                 },
-                "type": {
-                    "type": "string",
-                    "pattern": KEYS_PATTERN,
-                }
+                "required": [
+                    "path",
+                    "type",
+                ]
             }
         }
     },
     "required": [
         "name",
-        "url",
-        "interval",
         "fields",
+    ],
+    # Schemas are polled, read from a stream, pushed to, or both
+    "anyOf": [
+        {"required": ["url", "interval"]},
+        {"required": ["url", "source"], "properties": {"source": {"enum": ["sse", "ndjson", "longpoll"]}}},
+        {"required": ["push"]},
     ]
 }
 
 
+_validator = None
+
+# Hashes of schema files that passed validation, invalidated when JSONSCHEMA changes
+VALIDATION_CACHE = ".validated"
+VALIDATION_VERSION = hashlib.sha256(json.dumps(JSONSCHEMA, sort_keys=True).encode('utf-8')).hexdigest()
+
+# Plans of schema dicts that are no longer added, like the schema of a timer that is being replaced
+PLAN_CACHE_SIZE = 256
+
+
+def validator():
+    """ The compiled validator for JSONSCHEMA, jsonschema is only imported once a schema needs validation
+    """
+    global _validator
+
+    if _validator is None:
+        from jsonschema.validators import validator_for
+        _validator = validator_for(JSONSCHEMA)(JSONSCHEMA)
+
+    return _validator
+
+
 class Schemas(dict):
-    def __init__(self, logger, schema_dir="./schemas"):
+    def __init__(self, logger, schema_dir="./schemas", mqtt_topic="home/json2mqtt", codec=None):
         super().__init__()
         self.schema_dir = schema_dir
+        self.mqtt_topic = mqtt_topic
         self.logger = logger
+        self.codec = codec or get_codec()
+        self.plans = {}
+        self.compiled = collections.OrderedDict()
+        self.compiled_lock = threading.Lock()
+        self.routes = {}
+        self.invalid = []
 
         self.schema_files = [
             f for f in glob.glob(os.path.join(self.schema_dir, "*.json"))
@@ -92,7 +201,7 @@ class Schemas(dict):
 
     def reload(self):
         self.logger.debug('Reloading all schemas')
-        self.__init__(logger=self.logger)
+        self.__init__(logger=self.logger, schema_dir=self.schema_dir, mqtt_topic=self.mqtt_topic, codec=self.codec)
 
     def add_schema_file(self, filename):
         schema = self.read(filename=filename)
@@ -106,14 +215,14 @@ class Schemas(dict):
 
         schema.update({"filename": filename})
 
-        self.add_schema(schema=schema)
+        return self.add_schema(schema=schema)
 
-        return True
+    @staticmethod
+    def valid(schema):
+        return validator().is_valid(schema)
 
-    def add_schema(self, schema):
-        try:
-            validate(instance=schema, schema=JSONSCHEMA)
-        except (SchemaError, ValidationError):
+    def add_schema(self, schema, validated=False):
+        if not validated and not self.valid(schema):
             return False
 
         name = schema.get('name')
@@ -123,8 +232,48 @@ class Schemas(dict):
             self.logger.warning(f'Schema file {name} is disabled')
             return False
 
+        try:
+            plan = SchemaPlan.compile(schema=schema, mqtt_topic=self.mqtt_topic)
+        except JMESPathError as e:
+            self.logger.warning(f'Invalid field path in schema {name}: {e}')
+            return False
+
         self.logger.debug(f'Adding schema {name}')
+        self.unroute(name=name)
         self.update({name: schema})
+        self.plans.update({name: plan})
+        self.remember(schema=schema, plan=plan)
+
+        if plan.push:
+            self.routes.update({plan.push: name})
+
+        return True
+
+    def unroute(self, name):
+        plan = self.plans.get(name, None)
+        if plan is not None and self.routes.get(plan.push, None) == name:
+            self.routes.pop(plan.push)
+
+    def remember(self, schema, plan):
+        with self.compiled_lock:
+            self.compiled[id(schema)] = (schema, plan)
+            self.compiled.move_to_end(id(schema))
+
+            while len(self.compiled) > len(self) + PLAN_CACHE_SIZE:
+                self.compiled.popitem(last=False)
+
+    def plan(self, schema):
+        """ Return the compiled plan of this very schema dict, compiling it once if it was not added through add_schema
+        """
+        with self.compiled_lock:
+            entry = self.compiled.get(id(schema), None)
+            if entry is not None and entry[0] is schema:
+                self.compiled.move_to_end(id(schema))
+                return entry[1]
+
+        plan = SchemaPlan.compile(schema=schema, mqtt_topic=self.mqtt_topic)
+        self.remember(schema=schema, plan=plan)
+        return plan
 
     def remove_schema(self, name):
         schema = self.get(name, None)
@@ -133,7 +282,9 @@ class Schemas(dict):
             return False
 
         self.logger.info(f'Removing schema {name}')
+        self.unroute(name=name)
         self.pop(name)
+        self.plans.pop(name, None)
 
         filename = schema.get('filename', None)
         if filename and os.path.isfile(filename):
@@ -144,20 +295,111 @@ class Schemas(dict):
 
         return True
 
-    def import_all(self):
+    def discard(self, name, filename=True):
+        """ Forget a schema without touching its file, used when its file was changed or removed
+        """
+        self.unroute(name=name)
+        schema = self.pop(name, None)
+        self.plans.pop(name, None)
+
+        if filename and schema and schema.get('filename') in self.schema_files:
+            self.schema_files.remove(schema.get('filename'))
+
+        return schema is not None
+
+    def read_file(self, filename):
+        """ Read, hash and parse a schema file, runs in the import thread pool
+        """
+        try:
+            with open(filename, 'rb') as fh:
+                content = fh.read()
+        except OSError as e:
+            self.logger.warning(f'Unable to read schema file {filename}: {e}')
+            return None, None
+
+        return hashlib.sha256(content).hexdigest(), self.load(content=content)
+
+    def read_cache(self):
+        try:
+            with open(os.path.join(self.schema_dir, VALIDATION_CACHE), 'r') as fh:
+                cache = json.load(fh)
+        except (OSError, ValueError):
+            return set()
+
+        if not isinstance(cache, dict) or cache.get('version') != VALIDATION_VERSION:
+            return set()
+
+        return set(cache.get('valid', []))
+
+    def write_cache(self, digests):
+        try:
+            with open(os.path.join(self.schema_dir, VALIDATION_CACHE), 'w') as fh:
+                json.dump({"version": VALIDATION_VERSION, "valid": sorted(digests)}, fh)
+        except OSError as e:
+            self.logger.debug(f'Unable to write the validation cache to {self.schema_dir}: {e}')
+
+    def import_all(self, write_cache=True):
+        """ Read and parse all schema files in parallel, then validate and compile them
+
+            Files that passed validation before, with the same content, are not validated again.
+            Without write_cache, the validation cache in schema_dir is only read.
+        """
         self.logger.debug('Importing all schemas')
-        for filename in self.schema_files:
-            self.add_schema_file(filename=filename)
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(thread_name_prefix='json2mqtt-import') as pool:
+            files = list(zip(self.schema_files, pool.map(self.read_file, self.schema_files)))
+
+        reading = time.perf_counter() - start
+        validating = compiling = 0.0
+
+        cache = self.read_cache()
+        valid = set()
+        self.invalid = []
 
+        for filename, (digest, schema) in files:
+            if not schema:
+                self.logger.warning(f'Invalid schema file in {filename}')
+                self.invalid.append(filename)
+                continue
+
+            schema.update({"filename": filename})
+
+            begin = time.perf_counter()
+            validated = digest in cache or self.valid(schema)
+            validating += time.perf_counter() - begin
+
+            if not validated:
+                self.logger.warning(f'Schema file {filename} does not match the schema format')
+                self.invalid.append(filename)
+                continue
+
+            valid.add(digest)
+
+            begin = time.perf_counter()
+            if not self.add_schema(schema=schema, validated=True) and schema.get('enabled', True) is not False:
+                self.invalid.append(filename)
+            compiling += time.perf_counter() - begin
+
+        if write_cache and valid != cache:
+            self.write_cache(digests=valid)
+
+        self.logger.info(
+            f'Imported {len(self)} schemas from {len(files)} files in {time.perf_counter() - start:.3f}s: '
+            f'reading {reading:.3f}s, validating {validating:.3f}s ({len(valid & cache)} cached), compiling {compiling:.3f}s'
+        )
         return True
 
     def dump_all(self):
         self.logger.debug('Dumping all schemas to disk')
 
         for name, schema in self.items():
-            filename = schema.pop('filename')
+            filename = schema.get('filename', None)
+            if not filename:
+                continue
+
             self.logger.debug(f'Writing schema {name} to {filename}')
-            self.write(filename=filename, data=schema)
+            self.write(filename=filename, data={k: v for k, v in schema.items() if k != 'filename'})
 
         return True
 
@@ -172,9 +414,8 @@ class Schemas(dict):
 
         return True
 
-    @staticmethod
-    def load(content):
+    def load(self, content):
         try:
-            return json.loads(content)
+            return self.codec.loads(content)
         except JSONDecodeError:
             pass
@@ -0,0 +1,82 @@
+import threading
+import requests
+
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool(object):
+    """ Keep-alive requests sessions, one per scheme and host, each with its own connection pool
+    """
+    def __init__(self, pool_size=10):
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def host(url):
+        parts = urlsplit(url)
+        return parts.scheme, parts.netloc
+
+    def session(self, url):
+        host = self.host(url)
+
+        with self.lock:
+            session = self.sessions.get(host, None)
+
+            if session is None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions.update({host: session})
+
+        return session
+
+    def get(self, url, **kwargs):
+        return self.session(url).get(url, **kwargs)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+        return True
+
+
+class Validators(object):
+    """ Remember the ETag and Last-Modified validators per schema to send conditional requests
+
+        Validators are kept per schema and not per url, as a 304 for one schema
+        says nothing about whether another schema on the same url has seen the data.
+    """
+    def __init__(self):
+        self.validators = {}
+        self.lock = threading.Lock()
+
+    def headers(self, schema):
+        with self.lock:
+            etag, modified = self.validators.get(schema.get('name'), (None, None))
+
+        headers = {}
+        if etag:
+            headers.update({"If-None-Match": etag})
+        if modified:
+            headers.update({"If-Modified-Since": modified})
+
+        return headers
+
+    def update(self, schema, response):
+        etag = response.headers.get('ETag', None)
+        modified = response.headers.get('Last-Modified', None)
+
+        with self.lock:
+            if etag or modified:
+                self.validators.update({schema.get('name'): (etag, modified)})
+            else:
+                self.validators.pop(schema.get('name'), None)
+
+    def remove(self, name):
+        with self.lock:
+            self.validators.pop(name, None)
@@ -1,8 +1,5 @@
 import os
 
-from ruamel import yaml
-from ruamel.yaml.composer import ComposerError
-
 
 class ConfigError(RuntimeError):
     pass
@@ -20,6 +17,52 @@ class Settings(object):
         "mqtt_cert": "/etc/ssl/cert.pem",
     }
 
+    defaults = {
+        "scheduler_engine": "thread",
+        "max_concurrency": 50,
+        "http_pool_size": 10,
+        "change_cache_size": 10000,
+        "coalesce_requests": True,
+        "phase_window": 60,
+        "circuit_threshold": 5,
+        "circuit_backoff": 10,
+        "circuit_max_backoff": 300,
+        "host_max_in_flight": 0,
+        "host_rate": 0,
+        "host_limits": {},
+        "metrics_host": "127.0.0.1",
+        "metrics_port": 0,
+        "metrics_interval": 0,
+        "publish_queue_size": 10000,
+        "publish_queue_policy": "drop_oldest",
+        "publish_coalesce": False,
+        "spool_file": "",
+        "spool_max_messages": 100000,
+        "spool_max_age": 86400,
+        "spool_replay_rate": 100,
+        "watch_schemas": True,
+        "watch_interval": 2,
+        "workers": 0,
+        "json_codec": "auto",
+        "command_queue_size": 1000,
+        "push_host": "127.0.0.1",
+        "push_port": 0,
+        "push_max_body": 1048576,
+    }
+
+    engines = ("thread", "asyncio")
+    policies = ("drop_oldest", "drop_newest")
+
+    # The lowest value of the numeric settings
+    minimums = {
+        "max_concurrency": 1,
+        "http_pool_size": 1,
+        "workers": 0,
+        "publish_queue_size": 1,
+        "command_queue_size": 1,
+        "push_max_body": 1,
+    }
+
     __slots__ = [
         'filename',
         'yaml',
@@ -30,7 +73,37 @@ class Settings(object):
         'mqtt_password',
         'mqtt_topic',
         'mqtt_ssl',
-        'mqtt_cert'
+        'mqtt_cert',
+        'scheduler_engine',
+        'max_concurrency',
+        'http_pool_size',
+        'change_cache_size',
+        'coalesce_requests',
+        'phase_window',
+        'circuit_threshold',
+        'circuit_backoff',
+        'circuit_max_backoff',
+        'host_max_in_flight',
+        'host_rate',
+        'host_limits',
+        'metrics_host',
+        'metrics_port',
+        'metrics_interval',
+        'publish_queue_size',
+        'publish_queue_policy',
+        'publish_coalesce',
+        'spool_file',
+        'spool_max_messages',
+        'spool_max_age',
+        'spool_replay_rate',
+        'watch_schemas',
+        'watch_interval',
+        'workers',
+        'json_codec',
+        'command_queue_size',
+        'push_host',
+        'push_port',
+        'push_max_body',
     ]
 
     def __init__(self, filename="setting.yaml"):
@@ -45,10 +118,16 @@ class Settings(object):
             if not hasattr(self, key):
                 setattr(self, key, value)
 
+        for key, value in self.defaults.items():
+            if not hasattr(self, key):
+                setattr(self, key, value)
+
         self.verify()
 
     @staticmethod
     def _yaml():
+        from ruamel import yaml
+
         yml = yaml.YAML()
         yml.preserve_quotes = True
         yml.explicit_start = True
@@ -58,6 +137,8 @@ class Settings(object):
         return yml
 
     def read(self):
+        from ruamel.yaml.composer import ComposerError
+
         with open(self.filename, 'r') as fh:
             content = fh.read()
 
@@ -78,6 +159,16 @@ class Settings(object):
             if value is None or not hasattr(self, key):
                 raise ConfigError(f'{key} is required but not found in {self.filename}')
 
+        if self.scheduler_engine not in self.engines:
+            raise ConfigError(f'scheduler_engine must be one of {", ".join(self.engines)} in {self.filename}')
+
+        for key, minimum in self.minimums.items():
+            if int(getattr(self, key)) < minimum:
+                raise ConfigError(f'{key} must be at least {minimum} in {self.filename}')
+
+        if self.publish_queue_policy not in self.policies:
+            raise ConfigError(f'publish_queue_policy must be one of {", ".join(self.policies)} in {self.filename}')
+
         return True
 
     def create(self):
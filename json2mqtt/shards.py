@@ -0,0 +1,436 @@
+import itertools
+import json
+import logging
+import multiprocessing
+import threading
+import types
+import zlib
+
+from concurrent.futures import Future, TimeoutError
+from json2mqtt import LOG_FORMAT
+from json2mqtt.codec import get_codec
+from json2mqtt.metrics import Metrics
+from json2mqtt.outbox import Outbox
+from json2mqtt.settings import Settings
+from json2mqtt.timers import Dispatcher, Timer
+
+
+def shard(name, workers):
+    """ The worker a schema runs on, stable across restarts
+    """
+    return zlib.crc32(str(name).encode('utf-8')) % workers
+
+
+def share(limits, workers):
+    """ The part of the host limits every worker gets, so together the workers stay within the limits of a host
+
+        Rates are divided over the workers, requests in flight and bursts too with a minimum of 1 per worker.
+        A limit of 0 stays unlimited.
+    """
+    limits = dict(limits)
+
+    if limits.get('rate'):
+        limits['rate'] = limits['rate'] / workers
+
+    for key in ('max_in_flight', 'burst'):
+        if limits.get(key):
+            limits[key] = max(1, limits[key] // workers)
+
+    return limits
+
+
+class ShardClient(object):
+    """ The client of the scheduler in a worker process, sending its messages to the coordinator in batches
+    """
+    def __init__(self, settings, schemas, logger, connection):
+        self.settings = settings
+        self.schemas = schemas
+        self.logger = logger
+        self.connection = connection
+        self.scheduler = None
+
+        self.lock = threading.Lock()
+        self.outbox = Outbox(capacity=settings.publish_queue_size, policy=settings.publish_queue_policy, coalesce=False)
+        self.sender = threading.Thread(target=self.send, name='json2mqtt-shard-send', daemon=True)
+
+    def topic(self, name, key, base_topic=None):
+        base = base_topic or self.settings.mqtt_topic
+        return f"{base}/{name}/{key}"
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        return self.outbox.put(topic=topic, payload=payload, qos=qos, retain=retain)
+
+    def publish_many(self, messages, qos=0, retain=False):
+        return self.outbox.put_many(messages=messages, qos=qos, retain=retain)
+
+    def write(self, message):
+        with self.lock:
+            self.connection.send(message)
+
+    def send(self):
+        while True:
+            batch = self.outbox.get(limit=1000, timeout=1)
+            if batch:
+                self.write(("publish", [(m.topic, m.payload, m.qos, m.retain) for m in batch]))
+
+
+class Worker(object):
+    """ Fetches and extracts the schemas of one shard, controlled by the coordinator over a pipe
+    """
+    calls = ("start", "stop", "add_timer", "remove_timer", "pause_timer", "push", "timers", "stats", "changes", "metrics")
+
+    def __init__(self, index, settings, schemas, connection):
+        from json2mqtt.scheduler import create_scheduler
+        from json2mqtt.schemas import Schemas
+
+        self.logger = logging.getLogger(f'json2mqtt.shard.{index}')
+        self.connection = connection
+
+        self.schemas = Schemas(
+            logger=self.logger,
+            schema_dir=settings.schema_dir,
+            mqtt_topic=settings.mqtt_topic,
+            codec=get_codec(settings.json_codec),
+        )
+        for schema in schemas:
+            self.schemas.add_schema(schema=schema, validated=True)
+
+        self.client = ShardClient(settings=settings, schemas=self.schemas, logger=self.logger, connection=connection)
+        self.scheduler = self.client.scheduler = create_scheduler(client=self.client)
+
+    def start(self, schemas=()):
+        for schema in schemas:
+            self.schemas.add_schema(schema=schema, validated=True)
+
+        return self.scheduler.start()
+
+    def stop(self):
+        return self.scheduler.stop()
+
+    def add_timer(self, schema):
+        self.schemas.add_schema(schema=schema, validated=True)
+        return self.scheduler.add_timer(name=schema.get('name'))
+
+    def remove_timer(self, name):
+        return self.scheduler.remove_timer(name=name)
+
+    def pause_timer(self, name):
+        return self.scheduler.pause_timer(name=name)
+
+    def push(self, name, data):
+        return self.scheduler.push(name=name, data=data)
+
+    def timers(self):
+        return list(self.scheduler.timers.keys())
+
+    def stats(self):
+        return self.scheduler.stats()
+
+    def changes(self):
+        return self.scheduler.changes.stats()
+
+    def metrics(self):
+        return self.scheduler.metrics.state()
+
+    def run(self):
+        self.client.sender.start()
+
+        while True:
+            try:
+                _, number, method, kwargs = self.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            if method == "close":
+                break
+
+            try:
+                result = getattr(self, method)(**kwargs) if method in self.calls else None
+            except Exception as e:
+                self.logger.error(f'Failed to run {method} on shard: {e}')
+                result = None
+
+            self.client.write(("reply", number, result))
+
+        self.scheduler.close()
+
+
+def work(index, settings, schemas, connection, loglevel=logging.INFO):
+    """ The entry point of a worker process
+    """
+    logging.basicConfig(level=loglevel, format=LOG_FORMAT)
+
+    try:
+        Worker(index=index, settings=types.SimpleNamespace(**settings), schemas=schemas, connection=connection).run()
+    except KeyboardInterrupt:
+        pass
+
+
+class Shard(object):
+    """ A worker process and the pipe to it, as seen by the coordinator
+    """
+    def __init__(self, index, process, connection):
+        self.index = index
+        self.process = process
+        self.connection = connection
+        self.lock = threading.Lock()
+
+
+class ShardMetrics(Metrics):
+    """ The metrics of the coordinator, merged with the metrics of the workers when they are exported
+    """
+    def __init__(self, scheduler):
+        super().__init__()
+        self.scheduler = scheduler
+
+    def combined(self):
+        metrics = Metrics()
+        metrics.gauges = self.gauges
+        metrics.merge(self.state())
+
+        for state in self.scheduler.gather("metrics"):
+            metrics.merge(state)
+
+        return metrics
+
+    def snapshot(self):
+        return self.combined().snapshot()
+
+    def prometheus(self):
+        return self.combined().prometheus()
+
+
+class ShardChanges(object):
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    def stats(self):
+        stats = {"cached": 0, "size": 0, "schemas": {}}
+
+        for result in self.scheduler.gather("changes"):
+            stats["cached"] += result["cached"]
+            stats["size"] += result["size"]
+            stats["schemas"].update(result["schemas"])
+
+        return stats
+
+
+class ShardedScheduler(object):
+    """ Spreads the schemas over worker processes by a stable hash of their name
+
+        The workers fetch and extract, so json decoding and processing use more than one core.
+        The coordinator owns the mqtt connection: it publishes the messages the workers send back
+        and routes the scheduler commands to the worker that runs the schema.
+        Workers that die are restarted with their schemas.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.settings = self.client.settings
+        self.schemas = self.client.schemas
+        self.logger = self.client.logger
+
+        self.workers = self.settings.workers
+        self.codec = get_codec(self.settings.json_codec)
+        self.context = multiprocessing.get_context("spawn")
+        self.sequence = itertools.count()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        self.started = False
+        self.closing = False
+        self.reporter = None
+        self.dispatcher = Dispatcher(workers=1)
+
+        self.metrics = ShardMetrics(scheduler=self)
+        self.changes = ShardChanges(scheduler=self)
+        self.shards = [self.spawn(index=index) for index in range(self.workers)]
+
+    def worker_settings(self):
+        """ The settings for the workers, as plain values. Everything besides fetching stays with the coordinator
+        """
+        values = {key: getattr(self.settings, key) for key in list(Settings.schema) + list(Settings.defaults)}
+        values.update({"workers": 0, "metrics_interval": 0, "metrics_port": 0, "spool_file": "", "watch_schemas": False})
+
+        limits = share({"max_in_flight": values["host_max_in_flight"], "rate": values["host_rate"]}, workers=self.workers)
+        values.update({
+            "host_max_in_flight": limits["max_in_flight"],
+            "host_rate": limits["rate"],
+            "host_limits": {host: share(config, workers=self.workers) for host, config in (values["host_limits"] or {}).items()},
+        })
+        return json.loads(json.dumps(values))
+
+    def assigned(self, index):
+        return [schema for name, schema in list(self.schemas.items()) if shard(name, self.workers) == index]
+
+    def spawn(self, index):
+        parent, child = self.context.Pipe()
+
+        process = self.context.Process(
+            target=work,
+            name=f'json2mqtt-shard-{index}',
+            kwargs=dict(
+                index=index,
+                settings=self.worker_settings(),
+                schemas=self.assigned(index=index),
+                connection=child,
+                loglevel=self.logger.getEffectiveLevel(),
+            ),
+            daemon=True,
+        )
+        process.start()
+        child.close()
+
+        worker = Shard(index=index, process=process, connection=parent)
+        threading.Thread(target=self.receive, args=(worker,), name=f'json2mqtt-shard-{index}', daemon=True).start()
+
+        self.logger.info(f'Started worker {index} with pid {process.pid}')
+        return worker
+
+    def receive(self, worker):
+        while True:
+            try:
+                message = worker.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            if message[0] == "publish":
+                for topic, payload, qos, retain in message[1]:
+                    self.client.publish(topic=topic, payload=payload, qos=qos, retain=retain)
+
+            elif message[0] == "reply":
+                with self.lock:
+                    _, future = self.pending.pop(message[1], (None, None))
+                if future is not None:
+                    future.set_result(message[2])
+
+        self.lost(worker=worker)
+
+    def lost(self, worker):
+        with self.lock:
+            numbers = [number for number, (index, _) in self.pending.items() if index == worker.index]
+            futures = [self.pending.pop(number)[1] for number in numbers]
+
+        for future in futures:
+            future.set_result(None)
+
+        if self.closing:
+            return
+
+        self.logger.error(f'Worker {worker.index} stopped with exit code {worker.process.exitcode}, restarting it')
+        worker.process.join(timeout=1)
+        self.shards[worker.index] = self.spawn(index=worker.index)
+
+        if self.started:
+            self.call(index=worker.index, method="start")
+
+    def request(self, index, method, **kwargs):
+        worker = self.shards[index]
+        number = next(self.sequence)
+        future = Future()
+
+        with self.lock:
+            self.pending[number] = (index, future)
+
+        try:
+            with worker.lock:
+                worker.connection.send(("call", number, method, kwargs))
+        except (OSError, ValueError):
+            with self.lock:
+                self.pending.pop(number, None)
+            future.set_result(None)
+
+        return future
+
+    @staticmethod
+    def result(future, timeout=30):
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            return None
+
+    def call(self, index, method, **kwargs):
+        return self.result(self.request(index, method, **kwargs))
+
+    def gather(self, method, **kwargs):
+        """ Call a method on all workers at once, returns the results of the workers that answered
+        """
+        futures = [self.request(index, method, **kwargs) for index in range(self.workers)]
+        return [result for result in (self.result(future) for future in futures) if result is not None]
+
+    @property
+    def timers(self):
+        return {name: None for names in self.gather("timers") for name in names}
+
+    def stats(self):
+        stats = {}
+        for result in self.gather("stats"):
+            stats.update(result)
+
+        return stats
+
+    def report(self):
+        self.client.publish(topic=f"{self.settings.mqtt_topic}/stats", payload=self.codec.dumps(self.metrics.snapshot()))
+
+    def start(self):
+        self.logger.info(f'Starting schema crawlers on {self.workers} workers')
+        self.started = True
+
+        futures = [self.request(index, "start", schemas=self.assigned(index=index)) for index in range(self.workers)]
+        for future in futures:
+            self.result(future)
+
+        if self.settings.metrics_interval and self.reporter is None:
+            self.reporter = Timer(dispatcher=self.dispatcher, interval=self.settings.metrics_interval, function=self.report)
+            self.reporter.start()
+
+        return True
+
+    def stop(self):
+        self.logger.info('Stopping schema crawlers')
+        self.started = False
+        self.gather("stop")
+        return True
+
+    def close(self):
+        self.stop()
+        self.closing = True
+
+        if self.reporter is not None:
+            self.reporter.stop()
+        self.dispatcher.close()
+
+        for worker in self.shards:
+            try:
+                with worker.lock:
+                    worker.connection.send(("call", None, "close", {}))
+            except (OSError, ValueError):
+                pass
+
+        for worker in self.shards:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+        return True
+
+    def add_timer(self, name):
+        schema = self.schemas.get(name, None)
+        if not schema:
+            return False
+
+        return self.call(index=shard(name, self.workers), method="add_timer", schema=schema)
+
+    def remove_timer(self, name):
+        return self.call(index=shard(name, self.workers), method="remove_timer", name=name)
+
+    def pause_timer(self, name):
+        return self.call(index=shard(name, self.workers), method="pause_timer", name=name)
+
+    def push(self, name, data):
+        """ Hand a pushed document to the worker of its schema without waiting for it
+        """
+        if name not in self.schemas:
+            return False
+
+        self.request(index=shard(name, self.workers), method="push", name=name, data=data)
+        return True
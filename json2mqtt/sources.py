@@ -0,0 +1,308 @@
+import codecs
+import os
+import random
+import re
+import socket
+import threading
+import time
+
+from collections import namedtuple
+from json import JSONDecodeError
+from json2mqtt.stream import CHUNK_SIZE
+
+
+NEWLINE = re.compile(r'\r\n|\r|\n')
+
+Event = namedtuple('Event', ('name', 'data', 'id'))
+
+
+def chunks(response):
+    """ The body of a streamed response as it arrives, without waiting for a full chunk
+    """
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size=None)
+        return
+
+    while True:
+        chunk = read1(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+class Lines(object):
+    """ Splits newline delimited json into records, blank lines are ignored
+    """
+    def __init__(self):
+        self.buffer = b''
+
+    def feed(self, chunk):
+        *lines, self.buffer = (self.buffer + chunk).split(b'\n')
+        return [line for line in (line.strip() for line in lines) if line]
+
+
+class EventStream(object):
+    """ Parses a server-sent events stream into events, following the html event stream format
+
+        The id of the last event and the reconnection delay requested by the server are kept for reconnecting.
+    """
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.buffer = ''
+        self.name = ''
+        self.data = []
+        self.last_id = None
+        self.retry = None
+
+    def feed(self, chunk):
+        buffer = self.buffer + self.decoder.decode(chunk)
+        events = []
+        pos = 0
+
+        for match in NEWLINE.finditer(buffer):
+            # A \r at the end could be the start of a \r\n
+            if match.group() == '\r' and match.end() == len(buffer):
+                break
+
+            event = self.line(buffer[pos:match.start()])
+            pos = match.end()
+
+            if event is not None:
+                events.append(event)
+
+        self.buffer = buffer[pos:]
+        return events
+
+    def line(self, line):
+        if not line:
+            return self.dispatch()
+
+        if line.startswith(':'):
+            return None
+
+        field, _, value = line.partition(':')
+        if value.startswith(' '):
+            value = value[1:]
+
+        if field == 'data':
+            self.data.append(value)
+        elif field == 'event':
+            self.name = value
+        elif field == 'id' and '\0' not in value:
+            self.last_id = value
+        elif field == 'retry' and value.isdigit():
+            self.retry = int(value) / 1000
+
+        return None
+
+    def dispatch(self):
+        event = Event(name=self.name or 'message', data='\n'.join(self.data), id=self.last_id) if self.data else None
+        self.name = ''
+        self.data = []
+        return event
+
+
+class Backoff(object):
+    """ Exponential delays with jitter between reconnects, from delay up to maximum seconds
+    """
+    def __init__(self, delay=1, maximum=300):
+        self.delay = delay
+        self.maximum = maximum
+        self.attempts = 0
+
+    def next(self):
+        delay = min(self.maximum, self.delay * 2 ** self.attempts)
+        self.attempts += 1
+        return random.uniform(delay / 2, delay)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class StreamSource(object):
+    """ Keeps a connection open to the url of a schema and processes every record as soon as it arrives
+
+        sse: every server-sent event is a json document, reconnects send the Last-Event-ID
+        ndjson: every line is a json document
+        longpoll: every response is a json document, the next request is sent as soon as a response arrived
+
+        Lost connections are retried with an exponential backoff. Sources replace the timer of their schema,
+        so they are listed, paused and removed like timers.
+    """
+    kinds = ("sse", "ndjson", "longpoll")
+
+    def __init__(self, scheduler, schema, backoff=1, max_backoff=300):
+        self.scheduler = scheduler
+        self.schema = schema
+        self.kind = schema.get('source')
+        self.name = schema.get('name')
+        self.url = schema.get('url')
+        self.logger = scheduler.logger
+
+        self.backoff = Backoff(delay=backoff, maximum=max_backoff)
+        self.stopped = threading.Event()
+        self.thread = None
+        self.response = None
+        self.last_id = None
+
+        self.connected = False
+        self.records = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.last_record = None
+        self.interval = None
+
+    def start(self):
+        self.stop()
+        self.join()
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f'json2mqtt-source-{self.name}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.interrupt()
+
+    def join(self, timeout=5):
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def interrupt(self):
+        """ Unblock a read waiting for the next record by shutting the connection down
+        """
+        response = self.response
+        if response is None:
+            return
+
+        try:
+            # Shutting down a duplicate of the socket ends the read on the original
+            with socket.socket(fileno=os.dup(response.raw.fileno())) as sock:
+                sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def stats(self):
+        return {
+            "source": self.kind,
+            "connected": self.connected,
+            "records": self.records,
+            "failures": self.failures,
+            "reconnects": self.reconnects,
+            "missed": 0,
+            "actual_interval": self.interval,
+        }
+
+    def received(self):
+        now = time.monotonic()
+        if self.last_record is not None:
+            self.interval = round(now - self.last_record, 3)
+
+        self.last_record = now
+        self.records += 1
+
+    def record(self, data):
+        """ Process a single record from the stream
+        """
+        try:
+            document = self.scheduler.codec.loads(data)
+        except (JSONDecodeError, UnicodeDecodeError):
+            self.logger.error(f'Invalid json in stream {self.name} from {self.url}')
+            self.scheduler.metrics.increment("fetch_failure_total", self.name)
+            return False
+
+        self.received()
+        return self.scheduler.received(schema=self.schema, data=document, source=self.kind, counter="stream_records_total")
+
+    def headers(self):
+        headers = self.scheduler.headers(schema=self.schema)
+
+        if self.kind == "sse":
+            headers.update({"Accept": "text/event-stream", "Cache-Control": "no-cache"})
+            if self.last_id is not None:
+                headers.update({"Last-Event-ID": self.last_id})
+
+        return headers
+
+    def poll(self):
+        """ Send one long-poll request, returns True when the next one can be sent right away
+        """
+        circuit = self.scheduler.breakers.circuit(self.url)
+        response = self.scheduler.sessions.get(
+            self.url,
+            timeout=(10, self.schema.get('timeout', 60)),
+            headers=self.scheduler.request_headers(schema=self.schema),
+        )
+
+        # The server had nothing to send before its own timeout
+        if response.status_code == 204:
+            circuit.success()
+            return True
+
+        processed = bool(self.scheduler.completed(schema=self.schema, circuit=circuit, response=response, data=None))
+        if processed:
+            self.received()
+
+        return processed
+
+    def listen(self):
+        """ Process the records of one connection until the server closes it
+        """
+        parser = EventStream() if self.kind == "sse" else Lines()
+
+        self.response = self.scheduler.sessions.get(
+            self.url,
+            timeout=(10, self.schema.get('timeout', 60)),
+            headers=self.headers(),
+            stream=True,
+        )
+
+        with self.response as response:
+            response.raise_for_status()
+            self.connected = True
+            self.logger.info(f"Connected to {self.kind} stream {self.name} on {self.url}")
+
+            for chunk in chunks(response):
+                for record in parser.feed(chunk):
+                    if self.kind == "sse":
+                        self.last_id = record.id
+                        self.backoff.delay = parser.retry or self.backoff.delay
+                        record = record.data
+
+                    self.backoff.reset()
+                    self.record(data=record)
+
+                if self.stopped.is_set():
+                    break
+
+    # noinspection PyBroadException
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                if self.kind == "longpoll":
+                    if self.poll():
+                        self.backoff.reset()
+                        continue
+                else:
+                    self.listen()
+
+            except Exception as e:
+                if self.stopped.is_set():
+                    break
+
+                self.failures += 1
+                self.logger.warning(f"Stream {self.name} from {self.url} failed: {e}")
+                self.scheduler.metrics.increment("fetch_failure_total", self.name)
+
+            finally:
+                self.connected = False
+                self.response = None
+
+            if self.stopped.wait(self.backoff.next()):
+                break
+
+            self.reconnects += 1
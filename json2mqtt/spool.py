@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+
+from json2mqtt.outbox import Message
+
+
+class Spool(object):
+    """ Messages published while the broker is unreachable, kept in a sqlite database until they are replayed
+
+        Every write is committed, so a crash or restart loses nothing that was spooled.
+        The oldest messages are dropped once there are more than max_messages or they are older than max_age seconds,
+        0 disables a cap. A database that can't be opened is moved aside and replaced by an empty one.
+    """
+    def __init__(self, filename, max_messages=100000, max_age=86400, logger=None, clock=time.time):
+        self.filename = filename
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.logger = logger
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.count = 0
+        self.connection = None
+
+        try:
+            self.open()
+        except sqlite3.DatabaseError as e:
+            if self.logger is not None:
+                self.logger.error(f"Spool {self.filename} is corrupt, moving it aside: {e}")
+
+            self.close()
+            os.replace(self.filename, f"{self.filename}.corrupt")
+            self.open()
+
+        self.prune()
+
+    def open(self):
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL, topic TEXT, payload BLOB, qos INTEGER, retain INTEGER)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS messages_created ON messages (created)")
+        self.connection.execute("PRAGMA quick_check").fetchone()
+        self.count = self.connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def encode(payload):
+        """ The bytes paho would send for a payload
+        """
+        if payload is None or isinstance(payload, bytes):
+            return payload
+
+        if isinstance(payload, bytearray):
+            return bytes(payload)
+
+        return str(payload).encode('utf-8')
+
+    def write(self, messages):
+        if not messages:
+            return 0
+
+        now = self.clock()
+        rows = [(now, m.topic, self.encode(m.payload), m.qos, int(m.retain)) for m in messages]
+
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany("INSERT INTO messages (created, topic, payload, qos, retain) VALUES (?, ?, ?, ?, ?)", rows)
+            self.count += len(rows)
+
+        self.prune()
+        return len(rows)
+
+    def read(self, limit=100):
+        """ The oldest messages as (id, Message) pairs, they stay in the spool until remove() is called
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, topic, payload, qos, retain FROM messages ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+        return [(row[0], Message(topic=row[1], payload=row[2], qos=row[3], retain=bool(row[4]))) for row in rows]
+
+    def remove(self, last_id):
+        """ Remove all messages up to and including last_id
+        """
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                removed = self.connection.execute("DELETE FROM messages WHERE id <= ?", (last_id,)).rowcount
+            self.count -= removed
+
+        return removed
+
+    def prune(self):
+        removed = 0
+
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+
+                if self.max_age:
+                    removed += self.connection.execute(
+                        "DELETE FROM messages WHERE created < ?", (self.clock() - self.max_age,)
+                    ).rowcount
+
+                excess = self.count - removed - self.max_messages
+                if self.max_messages and excess > 0:
+                    removed += self.connection.execute(
+                        "DELETE FROM messages WHERE id IN (SELECT id FROM messages ORDER BY id LIMIT ?)", (excess,)
+                    ).rowcount
+
+            self.count -= removed
+            self.dropped += removed
+
+        if removed and self.logger is not None:
+            self.logger.warning(f"Dropped {removed} messages from spool {self.filename}")
+
+        return removed
+
+    def stats(self):
+        return {
+            "depth": self.count,
+            "dropped": self.dropped,
+            "max_messages": self.max_messages,
+            "max_age": self.max_age,
+        }
@@ -0,0 +1,314 @@
+import codecs
+import json
+import re
+
+import jmespath
+
+from jmespath.exceptions import JMESPathError
+
+
+# Bytes read at a time from streamed responses
+CHUNK_SIZE = 65536
+
+STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+LITERAL = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null')
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+CONTENT = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+DELIMITER = re.compile(r'[ \t\n\r,\]}]')
+
+# What the parser expects next
+VALUE, KEY, COLON, NEXT, END = range(5)
+
+# A trie leaf: keep the whole value at this position
+CAPTURE = True
+
+
+def steps(node):
+    kind = node['type']
+
+    if kind == 'field':
+        return (node['value'],)
+
+    if kind == 'subexpression':
+        result = ()
+        for child in node['children']:
+            child = steps(child)
+            if child is None:
+                return None
+            result += child
+
+        return result
+
+    if kind == 'index_expression':
+        result = () if node['children'][0]['type'] == 'identity' else steps(node['children'][0])
+
+        for child in node['children'][1:]:
+            if result is None or child['type'] != 'index' or child['value'] < 0:
+                return None
+            result += (child['value'],)
+
+        return result
+
+    return None
+
+
+def simple_path(path):
+    """ The keys and indexes of a jmespath expression like a.b[0].c, or None for anything that needs the whole document
+    """
+    try:
+        result = steps(jmespath.compile(path).parsed)
+    except (JMESPathError, TypeError):
+        return None
+
+    return result or None
+
+
+def trie(paths):
+    """ Nest the paths into dicts of keys and indexes, with CAPTURE for the values to keep
+    """
+    root = {}
+    for path in paths:
+        node = root
+        for step in path[:-1]:
+            node = node.setdefault(step, {})
+            if node is CAPTURE:
+                break
+        else:
+            node[path[-1]] = CAPTURE
+
+    return root
+
+
+class Extractor(object):
+    """ Parses a json document as it arrives in chunks, keeping only the values at the given paths
+
+        Everything else is scanned for its end but never decoded or kept, so memory depends on the
+        extracted values and not on the size of the document. The result only contains the extracted
+        values, at the same place as in the full document, so the schema's jmespath expressions find
+        the same values in it.
+
+        Parse errors are raised as JSONDecodeError by close(), feeding after an error is ignored.
+    """
+    def __init__(self, paths, loads=json.loads):
+        self.loads = loads
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+
+        self.buffer = ''
+        self.pos = 0
+        self.offset = 0
+        self.error = None
+
+        # Frames of the containers on the path to the current value: [container, trie node, key or index]
+        self.stack = []
+        self.expect = VALUE
+        self.target = trie(paths)
+        self.result = None
+
+        self.skipping = 0
+        self.capture = None
+
+    def fail(self, message):
+        raise json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def feed(self, chunk):
+        if self.error is not None:
+            return
+
+        try:
+            self.buffer += self.decoder.decode(chunk)
+            self.parse(final=False)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.error = e
+
+        # Keep the unparsed tail and the value being captured, drop the rest
+        keep = self.pos if self.capture is None else self.capture
+        self.buffer = self.buffer[keep:]
+        self.offset += keep
+        self.pos -= keep
+        if self.capture is not None:
+            self.capture = 0
+
+    def close(self):
+        """ Returns the extracted document
+        """
+        if self.error is None:
+            try:
+                self.buffer += self.decoder.decode(b'', final=True)
+                self.parse(final=True)
+
+                if self.expect != END:
+                    self.fail("Unexpected end of document")
+
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                self.error = e
+
+        if self.error is not None:
+            if isinstance(self.error, json.JSONDecodeError):
+                raise json.JSONDecodeError(self.error.msg, '', self.offset + self.error.pos)
+            raise json.JSONDecodeError(str(self.error), '', self.offset)
+
+        return self.result
+
+    def assign(self, value):
+        if not self.stack:
+            self.result = value
+            return
+
+        container, _, key = self.stack[-1]
+        if isinstance(container, dict):
+            container[key] = value
+        else:
+            container.extend([None] * (key + 1 - len(container)))
+            container[key] = value
+
+    def element(self):
+        """ Move on to the next element of the current array
+        """
+        frame = self.stack[-1]
+        frame[2] += 1
+        self.target = frame[1].get(frame[2], None)
+        self.expect = VALUE
+
+    def ended(self, end):
+        if self.capture is not None:
+            self.assign(self.loads(self.buffer[self.capture:end]))
+            self.capture = None
+
+        self.pos = end
+        self.expect = NEXT if self.stack else END
+
+    def skip(self):
+        """ Scan for the end of the skipped or captured container, returns False when more data is needed
+        """
+        buffer = self.buffer
+        size = len(buffer)
+        pos = self.pos
+        depth = self.skipping
+
+        while True:
+            # Jump over everything up to the next bracket, strings included
+            pos = CONTENT.match(buffer, pos).end()
+            if pos >= size or buffer[pos] == '"':
+                self.pos, self.skipping = pos, depth
+                return False
+
+            depth += 1 if buffer[pos] in '{[' else -1
+            pos += 1
+
+            if not depth:
+                self.skipping = 0
+                self.ended(end=pos)
+                return True
+
+    def value(self, char, final):
+        buffer = self.buffer
+        target = self.target
+
+        if char in '{[':
+            if isinstance(target, dict):
+                container = {} if char == '{' else []
+                self.assign(container)
+                self.stack.append([container, target, None if char == '{' else -1])
+                self.pos += 1
+
+                if char == '{':
+                    self.expect = KEY
+                else:
+                    self.element()
+                return True
+
+            self.capture = self.pos if target is CAPTURE else None
+            self.skipping = 1
+            self.pos += 1
+            return True
+
+        if char == ']' and self.stack and isinstance(self.stack[-1][0], list):
+            return self.close_container(char)
+
+        if char == '"':
+            match = STRING.match(buffer, self.pos)
+            if match is None:
+                return False
+        else:
+            # A number or literal is only complete once the delimiter after it arrived
+            if not final and DELIMITER.search(buffer, self.pos) is None:
+                return False
+
+            match = LITERAL.match(buffer, self.pos)
+            if match is None:
+                self.fail("Expecting value")
+
+        if target is CAPTURE:
+            self.capture = self.pos
+
+        self.ended(end=match.end())
+        return True
+
+    def close_container(self, char):
+        container = self.stack.pop()[0]
+        if (char == '}') != isinstance(container, dict):
+            self.fail(f"Unexpected '{char}'")
+
+        self.pos += 1
+        self.expect = NEXT if self.stack else END
+        return True
+
+    def key(self, char, final):
+        if char == '}':
+            return self.close_container(char)
+
+        if char != '"':
+            self.fail("Expecting property name enclosed in double quotes")
+
+        match = STRING.match(self.buffer, self.pos)
+        if match is None:
+            return False
+
+        key = match.group()
+        self.stack[-1][2] = key[1:-1] if '\\' not in key else json.loads(key)
+        self.pos = match.end()
+        self.expect = COLON
+        return True
+
+    def colon(self, char, final):
+        if char != ':':
+            self.fail("Expecting ':' delimiter")
+
+        frame = self.stack[-1]
+        self.target = frame[1].get(frame[2], None)
+        self.pos += 1
+        self.expect = VALUE
+        return True
+
+    def next(self, char, final):
+        if char in '}]':
+            return self.close_container(char)
+
+        if char != ',':
+            self.fail("Expecting ',' delimiter")
+
+        self.pos += 1
+        if isinstance(self.stack[-1][0], dict):
+            self.expect = KEY
+        else:
+            self.element()
+        return True
+
+    def end(self, char, final):
+        self.fail("Extra data")
+
+    def parse(self, final):
+        states = (self.value, self.key, self.colon, self.next, self.end)
+
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos >= len(self.buffer):
+                return
+
+            if self.skipping:
+                done = self.skip()
+            else:
+                done = states[self.expect](self.buffer[self.pos], final=final)
+
+            if not done:
+                return
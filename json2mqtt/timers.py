@@ -0,0 +1,365 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def phase(name, interval, window=60):
+    """ A stable offset for a schema, so schemas with the same interval do not all fire at once
+
+        The offset is derived from the schema name and lies within the interval and the window.
+    """
+    span = min(interval, window)
+    if span <= 0:
+        return 0.0
+
+    return zlib.crc32(str(name).encode('utf-8')) / 2 ** 32 * span
+
+
+class Deferred(Exception):
+    """ Raised by the function of a timer that cannot run yet, to be run again after delay seconds
+        without holding a worker thread while it waits
+    """
+    def __init__(self, delay):
+        super().__init__(f"Deferred for {delay:.3f}s")
+        self.delay = delay
+
+
+class Schedule(object):
+    """ The ideal run times of a timer: every interval after a phase offset, plus optional random jitter
+
+        Boundaries that already passed when a run starts are skipped,
+        the difference between the due time and the actual start of a run is tracked as drift.
+    """
+    def __init__(self, interval, phase=0.0, jitter=0.0):
+        self.interval = interval
+        self.phase = phase
+        self.jitter = jitter
+
+        self.origin = 0.0
+        self.tick = 0
+        self.due = 0.0
+        self.skipped = 0
+        self.drift = 0.0
+        self.max_drift = 0.0
+
+    def _jitter(self):
+        return random.uniform(0, self.jitter) if self.jitter else 0.0
+
+    def reset(self, now):
+        self.origin = now + self.phase
+        self.tick = 0
+        self.due = self.origin + self._jitter()
+        return self.due
+
+    def fired(self, now):
+        """ Record a run starting at now and return the next due time
+        """
+        self.drift = now - self.due
+        self.max_drift = max(self.max_drift, self.drift)
+
+        tick = max(self.tick + 1, int((now - self.origin) // self.interval) + 1)
+        self.skipped += tick - self.tick - 1
+        self.tick = tick
+
+        self.due = self.origin + self.tick * self.interval + self._jitter()
+        return self.due
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "phase": round(self.phase, 3),
+            "drift": round(self.drift, 6),
+            "max_drift": round(self.max_drift, 6),
+            "skipped": self.skipped,
+        }
+
+
+class Runs(object):
+    """ Decides what happens to a due run while earlier runs of the same timer are still busy
+
+        skip:       the due run is dropped and counted as missed
+        queue:      at most one due run is kept and started as soon as the busy run finishes
+        concurrent: up to limit runs are started next to each other, others are dropped
+    """
+    policies = ("skip", "queue", "concurrent")
+
+    def __init__(self, policy="skip", limit=1):
+        self.policy = policy
+        self.limit = limit if policy == "concurrent" else 1
+
+        self.active = 0
+        self.pending = False
+        self.missed = 0
+        self.overruns = 0
+        self.last_start = None
+        self.actual_interval = 0.0
+
+    def due(self):
+        """ Returns True if the due run should start now
+        """
+        if self.active < self.limit:
+            self.active += 1
+            return True
+
+        if self.policy == "queue" and not self.pending:
+            self.pending = True
+        else:
+            self.missed += 1
+
+        return False
+
+    def started(self, now):
+        if self.last_start is not None:
+            self.actual_interval = now - self.last_start
+        self.last_start = now
+
+    def finished(self, duration, interval):
+        """ Returns True if a queued run should start now
+        """
+        if duration > interval:
+            self.overruns += 1
+
+        if self.pending:
+            self.pending = False
+            return True
+
+        self.active -= 1
+        return False
+
+    def cancel(self):
+        self.pending = False
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "active": self.active,
+            "pending": self.pending,
+            "overruns": self.overruns,
+            "actual_interval": round(self.actual_interval, 3),
+        }
+
+
+class Call(object):
+    """ A function on the heap of a dispatcher, submitted to the worker pool once it is due
+    """
+    def __init__(self, dispatcher, function, args):
+        self.dispatcher = dispatcher
+        self.function = function
+        self.args = args
+
+    def dispatch(self, generation, now):
+        self.dispatcher.submit(self.function, *self.args)
+
+
+class Dispatcher(object):
+    """ A single thread that keeps the due times of all timers in a heap,
+        handing every due run to a bounded pool of worker threads
+    """
+    def __init__(self, workers=50, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='json2mqtt-fetch')
+        self.thread = None
+        self.running = False
+        self.closed = False
+        self.pending = 0
+
+    def schedule(self, timer, generation, due):
+        with self.condition:
+            if self.closed:
+                return
+
+            heapq.heappush(self.heap, (due, next(self.sequence), timer, generation))
+            self.condition.notify()
+
+            if not self.running:
+                self.running = True
+                self.thread = threading.Thread(target=self.run, name='json2mqtt-dispatcher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+
+                    wait = self.heap[0][0] - self.clock()
+                    if wait <= 0:
+                        break
+
+                    self.condition.wait(timeout=wait)
+
+                if not self.running:
+                    return
+
+                due, _, timer, generation = heapq.heappop(self.heap)
+
+            timer.dispatch(generation=generation, now=self.clock())
+
+    def later(self, delay, function, *args):
+        """ Run a function on the worker pool after delay seconds, without holding a worker meanwhile
+        """
+        self.schedule(timer=Call(dispatcher=self, function=function, args=args), generation=None, due=self.clock() + delay)
+
+    def _start(self, function, *args, **kwargs):
+        with self.condition:
+            self.pending -= 1
+
+        return function(*args, **kwargs)
+
+    def submit(self, function, *args, **kwargs):
+        """ Run a function on the worker pool, pending counts the runs waiting for a free worker
+        """
+        with self.condition:
+            self.pending += 1
+
+        return self.pool.submit(self._start, function, *args, **kwargs)
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.closed = True
+            self.heap.clear()
+            self.condition.notify()
+
+        self.pool.shutdown(wait=True)
+        return True
+
+
+class Timer(object):
+    """ A MultiTimer look-alike that is run by a Dispatcher instead of its own thread
+
+        The function is called on every due time of the schedule, until count is reached or stop() is called.
+        What happens to a due run while the previous run is still busy depends on the overrun policy.
+        A run whose function raises Deferred stays busy and is run again later from the heap of the dispatcher.
+    """
+    def __init__(self, dispatcher, interval, function, kwargs=None, count=-1, phase=0.0, jitter=0.0, overrun="skip", limit=1):
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self.function = function
+        self.kwargs = kwargs or {}
+        self.count = count
+        self.counter = 0
+
+        self.schedule = Schedule(interval=interval, phase=phase, jitter=jitter)
+        self.runs = Runs(policy=overrun, limit=limit)
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.started = False
+        self.deferred = 0
+
+    def start(self):
+        with self.condition:
+            self.generation += 1
+            self.drop_deferred()
+            self.counter = 0
+            self.started = True
+            generation = self.generation
+            due = self.schedule.reset(now=self.dispatcher.clock())
+
+        self.dispatcher.schedule(timer=self, generation=generation, due=due)
+
+    def stop(self):
+        with self.condition:
+            self.generation += 1
+            self.started = False
+            self.runs.cancel()
+            self.drop_deferred()
+
+    def drop_deferred(self):
+        """ Deferred runs of an earlier generation will not run again, so they are no longer busy
+        """
+        self.runs.active -= self.deferred
+        self.deferred = 0
+        self.condition.notify_all()
+
+    def join(self, timeout=None):
+        """ Wait for the current runs to finish, if any
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.runs.active == 0, timeout=timeout)
+
+    def is_alive(self):
+        return self.started or self.runs.active > 0
+
+    def dispatch(self, generation, now):
+        with self.condition:
+            if generation != self.generation or not self.started:
+                return
+
+            due = self.schedule.fired(now=now)
+            run = self.runs.due()
+            if run:
+                self.counter += 1
+
+            if 1 <= self.count <= self.counter:
+                self.started = False
+            else:
+                self.dispatcher.schedule(timer=self, generation=generation, due=due)
+
+        if run:
+            self.dispatcher.submit(self._run, generation)
+
+    def _resume(self, generation):
+        with self.condition:
+            if generation != self.generation:
+                return
+
+            self.deferred -= 1
+
+        self._run(generation=generation, resumed=True)
+
+    def _run(self, generation, resumed=False):
+        while True:
+            start = self.dispatcher.clock()
+            if not resumed:
+                with self.condition:
+                    self.runs.started(now=start)
+
+            try:
+                self.function(**self.kwargs)
+            except Deferred as deferred:
+                with self.condition:
+                    if generation == self.generation:
+                        self.deferred += 1
+                        self.dispatcher.later(deferred.delay, self._resume, generation)
+                        return
+
+                again = self.finish(start=start)
+            except BaseException:
+                self.finish(start=start)
+                raise
+            else:
+                again = self.finish(start=start)
+
+            if not again:
+                return
+
+            resumed = False
+
+    def finish(self, start):
+        """ Record the end of a run, returns True if a queued run should start now
+        """
+        with self.condition:
+            again = self.runs.finished(duration=self.dispatcher.clock() - start, interval=self.interval)
+            if again:
+                self.counter += 1
+            self.condition.notify_all()
+
+        return again
+
+    def stats(self):
+        with self.condition:
+            stats = dict(self.schedule.stats(), **self.runs.stats())
+            stats.update({"runs": self.counter, "missed": self.schedule.skipped + self.runs.missed})
+
+        return stats
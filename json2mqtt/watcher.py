@@ -0,0 +1,207 @@
+import ctypes
+import ctypes.util
+import glob
+import hashlib
+import os
+import select
+import threading
+
+
+class Inotify(object):
+    """ A minimal ctypes binding for watching a single directory with inotify
+
+        Raises OSError when inotify is not available, for example on other platforms than linux.
+    """
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+
+    mask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), self.mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Unable to watch {path}")
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self, timeout=None):
+        """ Returns True if something changed in the directory before the timeout
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+
+        self.drain()
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SchemaWatcher(object):
+    """ Applies changes to the schema files in schema_dir to the running schemas and timers
+
+        Files are compared by content hash, only re-hashing files with a new mtime or size.
+        Added, changed and removed files only restart their own timers, other schemas keep running.
+        Uses inotify when available and polls every interval seconds otherwise.
+        Changes are applied while holding lock, pass the lock of the command handler to run them between commands.
+    """
+    def __init__(self, schemas, scheduler, logger, interval=2, debounce=0.2, lock=None):
+        self.schemas = schemas
+        self.scheduler = scheduler
+        self.logger = logger
+        self.interval = interval
+        self.debounce = debounce
+
+        self.files = {}
+        self.lock = lock or threading.RLock()
+        self.stopped = threading.Event()
+        self.inotify = None
+        self.thread = None
+
+        self.scan()
+
+    @staticmethod
+    def digest(filename):
+        with open(filename, 'rb') as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+
+    def scan(self):
+        """ Compare the schema files to the previous scan, returns the added, changed and removed files
+        """
+        current = {}
+        for filename in glob.glob(os.path.join(self.schemas.schema_dir, "*.json")):
+            try:
+                stat = os.stat(filename)
+                key = stat.st_mtime_ns, stat.st_size
+
+                known = self.files.get(filename, None)
+                current[filename] = known if known and known[0] == key else (key, self.digest(filename))
+            except OSError:
+                continue
+
+        added = sorted(f for f in current if f not in self.files)
+        changed = sorted(f for f in current if f in self.files and current[f][1] != self.files[f][1])
+        removed = sorted(f for f in self.files if f not in current)
+
+        self.files = current
+        return added, changed, removed
+
+    @staticmethod
+    def same(schema, other):
+        return {k: v for k, v in schema.items() if k != 'filename'} == {k: v for k, v in other.items() if k != 'filename'}
+
+    def remove(self, name):
+        self.scheduler.remove_timer(name=name)
+        self.schemas.discard(name=name)
+
+    def load(self, filename, name=None):
+        schema = self.schemas.read(filename=filename)
+        if not schema:
+            self.logger.warning(f'Invalid schema file in {filename}, keeping the running schema')
+            return False
+
+        current = self.schemas.get(name, None) if name else None
+        if current is not None and self.same(schema, current):
+            return False
+
+        if schema.get('enabled', True) is False and name:
+            self.logger.info(f'Schema file {filename} is disabled')
+            self.remove(name=name)
+            return True
+
+        running = name in self.scheduler.timers if name else self.scheduler.started
+        if not self.schemas.add_schema_file(filename=filename):
+            self.logger.warning(f'Invalid schema file in {filename}, keeping the running schema')
+            return False
+
+        new = schema.get('name')
+        if name and name != new:
+            self.scheduler.remove_timer(name=name)
+            self.schemas.discard(name=name, filename=False)
+
+        if new in self.scheduler.timers:
+            self.scheduler.remove_timer(name=new)
+            running = True
+
+        if running:
+            self.scheduler.add_timer(name=new)
+
+        return True
+
+    def apply(self, added, changed, removed):
+        names = {schema.get('filename'): name for name, schema in list(self.schemas.items())}
+
+        for filename in removed:
+            if filename in names:
+                self.logger.info(f'Schema file {filename} was removed')
+                self.remove(name=names[filename])
+
+        for filename in changed + added:
+            if self.load(filename=filename, name=names.get(filename, None)):
+                self.logger.info(f'Schema file {filename} was {"changed" if filename in changed else "added"}')
+
+    def sync(self):
+        with self.lock:
+            added, changed, removed = self.scan()
+            if added or changed or removed:
+                self.logger.debug(f'Schema files: {len(added)} added, {len(changed)} changed, {len(removed)} removed')
+                self.apply(added=added, changed=changed, removed=removed)
+
+        return added, changed, removed
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.inotify is not None:
+                if not self.inotify.wait(timeout=1):
+                    continue
+
+                # Editors write files in several steps, wait for them to finish
+                self.stopped.wait(self.debounce)
+                self.inotify.drain()
+
+            elif self.stopped.wait(self.interval):
+                break
+
+            try:
+                self.sync()
+            except Exception as e:
+                self.logger.error(f'Failed to apply schema changes: {e}')
+
+    def start(self):
+        try:
+            self.inotify = Inotify(path=self.schemas.schema_dir)
+            self.logger.info(f'Watching {self.schemas.schema_dir} for schema changes')
+        except OSError as e:
+            self.logger.info(f'Polling {self.schemas.schema_dir} for schema changes every {self.interval}s: {e}')
+
+        self.thread = threading.Thread(target=self.run, name='json2mqtt-watcher', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.inotify is not None:
+            self.inotify.close()
+
+        return True
@@ -0,0 +1,126 @@
+import collections
+import threading
+import time
+
+from array import array
+from json2mqtt.changes import numeric
+
+
+DERIVED = ("mean", "min", "max", "rate", "delta")
+
+
+class Window(object):
+    """ The last samples of a numeric field in fixed size arrays used as a ring buffer
+
+        Adding a sample costs O(1): the sum is kept up to date as samples enter and leave the window,
+        the min and max come from monotonic queues of sample numbers. Memory is fixed by the size.
+    """
+    __slots__ = ('size', 'seconds', 'values', 'times', 'first', 'count', 'total', 'lows', 'highs')
+
+    def __init__(self, size, seconds=None):
+        self.size = size
+        self.seconds = seconds
+        self.values = array('d', bytes(8 * size))
+        self.times = array('d', bytes(8 * size))
+
+        # Sample numbers, the sample n is at n % size
+        self.first = 0
+        self.count = 0
+        self.total = 0.0
+
+        self.lows = collections.deque()
+        self.highs = collections.deque()
+
+    def __len__(self):
+        return self.count - self.first
+
+    def value(self, sample):
+        return self.values[sample % self.size]
+
+    def drop(self):
+        self.total -= self.value(self.first)
+
+        if self.lows[0] == self.first:
+            self.lows.popleft()
+        if self.highs[0] == self.first:
+            self.highs.popleft()
+
+        self.first += 1
+
+    def add(self, value, now):
+        if len(self) == self.size:
+            self.drop()
+
+        while self.seconds is not None and len(self) and self.times[self.first % self.size] < now - self.seconds:
+            self.drop()
+
+        if not len(self):
+            # Start from a clean sum instead of carrying rounding errors along
+            self.total = 0.0
+
+        index = self.count % self.size
+        self.values[index] = value
+        self.times[index] = now
+        self.total += value
+
+        while self.lows and self.value(self.lows[-1]) >= value:
+            self.lows.pop()
+        while self.highs and self.value(self.highs[-1]) <= value:
+            self.highs.pop()
+
+        self.lows.append(self.count)
+        self.highs.append(self.count)
+        self.count += 1
+
+    def derive(self, metric):
+        """ The derived value over the samples in the window, None for a rate or delta of a single sample
+        """
+        first, last = self.first % self.size, (self.count - 1) % self.size
+
+        if metric == "mean":
+            return self.total / len(self)
+        if metric == "min":
+            return self.value(self.lows[0])
+        if metric == "max":
+            return self.value(self.highs[0])
+        if len(self) < 2:
+            return None
+        if metric == "delta":
+            return self.values[last] - self.values[first]
+
+        elapsed = self.times[last] - self.times[first]
+        return (self.values[last] - self.values[first]) / elapsed if elapsed > 0 else None
+
+
+class Windows(object):
+    """ The windows of the fields with derived metrics, per schema
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def add(self, plan, field, value):
+        """ Add a sample and return the (metric, value) of every derived metric of the field
+        """
+        if not numeric(value):
+            return []
+
+        key = (plan.name, field.key)
+
+        with self.lock:
+            window = self.windows.get(key, None)
+            if window is None or window.size != field.window or window.seconds != field.window_seconds:
+                window = self.windows[key] = Window(size=field.window, seconds=field.window_seconds)
+
+            window.add(value=value, now=self.clock())
+            derived = [(metric, window.derive(metric)) for metric in field.derive]
+
+        return [(metric, value) for metric, value in derived if value is not None]
+
+    def forget(self, name):
+        """ Drop all windows of a schema
+        """
+        with self.lock:
+            for key in [key for key in self.windows if key[0] == name]:
+                del self.windows[key]
@@ -1,7 +1,9 @@
 import logging
 import mock
+import types
 
 from unittest import TestCase as TestClass
+from json2mqtt.settings import Settings
 
 
 class TestCase(TestClass):
@@ -12,6 +14,20 @@ class TestCase(TestClass):
         self.addCleanup(patcher.stop)
         return patcher.start()
 
+    def setup_client(self, schemas=None, **settings):
+        values = dict(Settings.schema, **Settings.defaults)
+        values.update(settings)
+
+        client = mock.Mock()
+        client.settings = types.SimpleNamespace(**values)
+        client.schemas = schemas if schemas is not None else {}
+        client.logger = logging.getLogger('json2mqtt.tests')
+        client.topic.side_effect = lambda name, key, base_topic=None: f"{base_topic or values['mqtt_topic']}/{name}/{key}"
+        return client
+
+    def published(self, client):
+        return {c.kwargs['topic']: c.kwargs['payload'] for c in client.publish.call_args_list}
+
     def setUp(self):
         super().setUp()
         logging.disable(logging.CRITICAL)
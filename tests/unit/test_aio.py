@@ -0,0 +1,134 @@
+import asyncio
+import concurrent.futures
+import logging
+import mock
+import tempfile
+import threading
+import time
+
+from tests.testsuite import TestCase
+from benchmarks.server import PayloadServer
+from json2mqtt.aio import AsyncScheduler, AsyncTimer
+from json2mqtt.scheduler import create_scheduler
+from json2mqtt.schemas import Schemas
+
+
+class TestAsyncTimer(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.addCleanup(self.thread.join)
+        self.addCleanup(self.loop.call_soon_threadsafe, self.loop.stop)
+
+    def test_timer_runs_count_times(self):
+        calls = []
+
+        async def function(**kwargs):
+            calls.append(kwargs)
+
+        timer = AsyncTimer(loop=self.loop, interval=0.01, function=function, kwargs={"schema": 1}, count=3)
+        timer.start()
+        timer.join(timeout=2)
+
+        self.assertEqual(calls, [{"schema": 1}] * 3)
+        self.assertFalse(timer.is_alive())
+
+    def test_stop_cancels_a_running_timer(self):
+        async def function():
+            pass
+
+        timer = AsyncTimer(loop=self.loop, interval=10, function=function)
+        timer.start()
+        time.sleep(0.05)
+        self.assertTrue(timer.is_alive())
+
+        timer.stop()
+        timer.join(timeout=2)
+        self.assertFalse(timer.is_alive())
+        self.assertEqual(timer.counter, 1)
+
+    def test_join_waits_for_cancelled_runs_to_finish(self):
+        started, finished = threading.Event(), []
+
+        async def function():
+            try:
+                started.set()
+                await asyncio.sleep(10)
+            finally:
+                await asyncio.sleep(0.1)
+                finished.append(True)
+
+        timer = AsyncTimer(loop=self.loop, interval=10, function=function)
+        timer.start()
+        self.assertTrue(started.wait(timeout=2))
+
+        timer.stop()
+        self.assertTrue(timer.join(timeout=2))
+        self.assertEqual(finished, [True])
+
+
+class TestAsyncScheduler(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.setup_client(scheduler_engine='asyncio', max_concurrency=2)
+        self.scheduler = create_scheduler(client=self.client)
+        self.addCleanup(self.scheduler.close)
+
+    def test_create_scheduler_selects_asyncio(self):
+        self.assertIsInstance(self.scheduler, AsyncScheduler)
+        self.assertEqual(self.scheduler.semaphore._value, 2)
+
+    def test_cancelled_probes_release_the_circuit(self):
+        schema = {"name": "usage", "url": "http://localhost/usage", "interval": 60, "fields": {}}
+        circuit = self.scheduler.breakers.circuit(schema["url"])
+        circuit.state, circuit.retry_at = circuit.OPEN, 0.0
+
+        async def retrieve(schema):
+            raise asyncio.CancelledError()
+
+        self.scheduler.retrieve = retrieve
+        with self.assertRaises(concurrent.futures.CancelledError):
+            asyncio.run_coroutine_threadsafe(self.scheduler.fetch(schema=schema), self.scheduler.loop).result(timeout=5)
+
+        self.assertFalse(circuit.probing)
+        self.assertTrue(circuit.allow())
+
+    def test_response_wraps_aiohttp_result(self):
+        result = mock.Mock(status=200, reason="OK", url="http://localhost/x", headers={}, charset="utf-8")
+
+        response = AsyncScheduler.response(result=result, content=b'{"a": 1}', elapsed=0.25)
+
+        self.assertTrue(response.ok)
+        self.assertEqual(response.json(), {"a": 1})
+        self.assertEqual(response.elapsed.total_seconds(), 0.25)
+
+
+class TestAsyncStreaming(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = PayloadServer().start()
+        self.addCleanup(self.server.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.schemas = Schemas(logger=logging.getLogger('json2mqtt.tests'), schema_dir=directory.name)
+        self.schemas.add_schema(schema={
+            "name": "usage",
+            "url": self.server.url("current_usage?size=200000"),
+            "interval": 60,
+            "stream": True,
+            "fields": {"result": {"type": "String", "path": "result"}},
+        })
+
+        self.client = self.setup_client(schemas=self.schemas, scheduler_engine='asyncio')
+        self.scheduler = create_scheduler(client=self.client)
+        self.addCleanup(self.scheduler.close)
+
+    def test_streaming_schemas_extract_while_the_response_arrives(self):
+        fetch = self.scheduler.fetch(schema=self.schemas["usage"])
+        asyncio.run_coroutine_threadsafe(fetch, self.scheduler.loop).result(timeout=10)
+
+        self.assertEqual(self.published(self.client)["home/json2mqtt/usage/result"], "ok")
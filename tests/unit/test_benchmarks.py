@@ -0,0 +1,60 @@
+import json
+import urllib.request
+
+from tests.testsuite import TestCase
+from benchmarks import codec, pipeline
+from benchmarks.server import PayloadServer
+from benchmarks.sink import SinkClient, settings
+
+
+class TestPayloadServer(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = PayloadServer().start()
+        self.addCleanup(self.server.stop)
+
+    def get(self, path):
+        with urllib.request.urlopen(self.server.url(path), timeout=5) as response:
+            return response.read()
+
+    def test_payloads_are_padded_to_the_requested_size(self):
+        payload = self.get("current_usage?size=4096")
+
+        self.assertGreaterEqual(len(payload), 4000)
+        self.assertEqual(json.loads(payload)["result"], "ok")
+
+
+class TestSinkClient(TestCase):
+    def test_batches_count_every_message(self):
+        client = SinkClient(schemas={}, settings=settings())
+
+        client.publish(topic="home/json2mqtt/usage/result", payload="ok")
+        client.publish_many(messages=[("home/json2mqtt/usage/rooms/0", 1), ("home/json2mqtt/usage/rooms/1", 2)])
+
+        self.assertEqual(client.messages, 3)
+
+
+class TestPipeline(TestCase):
+    def test_schemas_cycle_through_the_examples(self):
+        schemas = list(pipeline.generate(count=6, port=8000, interval=1))
+
+        self.assertEqual(len({schema["url"] for schema in schemas}), 6)
+        self.assertEqual(schemas[0]["fields"]["boilerSetpoint"], {"type": "Integer", "path": "boilerSetpoint"})
+
+    def test_run_reports_throughput(self):
+        server = PayloadServer().start()
+        self.addCleanup(server.stop)
+
+        result = pipeline.run(count=5, port=server.server_address[1], interval=0.2, duration=1)
+
+        self.assertGreater(result["fetches"], 0)
+        self.assertGreater(result["messages_per_sec"], 0)
+        self.assertLessEqual(result["tick_latency_p50"], result["tick_latency_p99"])
+
+
+class TestCodecBenchmark(TestCase):
+    def test_run_reports_every_codec(self):
+        results = codec.run(sizes=[512], rounds=2)
+
+        self.assertEqual({result["codec"] for result in results}, {"json", "orjson"})
+        self.assertTrue(all(result["decode_us"] > 0 for result in results))
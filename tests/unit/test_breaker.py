@@ -0,0 +1,69 @@
+from tests.testsuite import TestCase
+from json2mqtt.breaker import Breakers, Circuit
+
+
+class TestCircuit(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+        self.circuit = Circuit(threshold=3, backoff=10, maximum=40, clock=lambda: self.now)
+
+    def open(self):
+        for _ in range(3):
+            self.circuit.failure()
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        self.assertFalse(self.circuit.failure())
+        self.assertFalse(self.circuit.failure())
+        self.assertTrue(self.circuit.failure())
+
+        self.assertEqual(self.circuit.state, Circuit.OPEN)
+        self.assertFalse(self.circuit.allow())
+
+    def test_success_resets_the_failure_count(self):
+        self.circuit.failure()
+        self.circuit.failure()
+        self.circuit.success()
+
+        self.assertFalse(self.circuit.failure())
+        self.assertTrue(self.circuit.allow())
+
+    def test_half_open_lets_a_single_probe_through(self):
+        self.open()
+        self.now += 10
+
+        self.assertTrue(self.circuit.allow())
+        self.assertEqual(self.circuit.state, Circuit.HALF_OPEN)
+        self.assertFalse(self.circuit.allow())
+
+        self.circuit.success()
+        self.assertEqual(self.circuit.state, Circuit.CLOSED)
+
+    def test_released_probes_let_the_next_probe_through(self):
+        self.open()
+        self.now += 10
+
+        self.assertTrue(self.circuit.allow())
+        self.circuit.release()
+
+        self.assertEqual(self.circuit.state, Circuit.HALF_OPEN)
+        self.assertTrue(self.circuit.allow())
+
+    def test_failed_probes_back_off_exponentially_up_to_the_maximum(self):
+        self.open()
+
+        for maximum in (20, 40, 40):
+            self.now = self.circuit.retry_at
+            self.assertTrue(self.circuit.allow())
+            self.circuit.failure()
+
+            self.assertEqual(self.circuit.state, Circuit.OPEN)
+            self.assertTrue(maximum / 2 <= self.circuit.retry_at - self.now <= maximum)
+
+
+class TestBreakers(TestCase):
+    def test_circuits_are_shared_per_host(self):
+        breakers = Breakers()
+
+        self.assertIs(breakers.circuit("http://toon.local/a"), breakers.circuit("http://toon.local/b?x=1"))
+        self.assertIsNot(breakers.circuit("http://toon.local/a"), breakers.circuit("http://boiler.local/a"))
@@ -0,0 +1,62 @@
+from tests.testsuite import TestCase
+from json2mqtt.changes import ChangeCache
+from json2mqtt.plan import SchemaPlan
+
+
+def plan(heartbeat=0, **field):
+    return SchemaPlan.compile(schema={
+        "name": "usage",
+        "url": "http://localhost/usage",
+        "on_change": True,
+        "heartbeat": heartbeat,
+        "fields": {"power": dict({"type": "Integer", "path": "power"}, **field)},
+    }, mqtt_topic="base")
+
+
+class TestChangeCache(TestCase):
+    def publishes(self, cache, plan, values):
+        return [cache.changed(plan=plan, field=plan.fields[0], value=value) for value in values]
+
+    def test_only_changed_values_are_published(self):
+        cache = ChangeCache()
+        self.assertEqual(self.publishes(cache, plan(), [1, 1, 2, 2, "2"]), [True, False, True, False, True])
+        self.assertEqual(cache.stats()["schemas"]["usage"], {"published": 3, "suppressed": 2})
+
+    def test_absolute_deadband(self):
+        cache = ChangeCache()
+        self.assertEqual(self.publishes(cache, plan(deadband=5), [100, 104, 105.5, 106, 94]), [True, False, True, False, True])
+
+    def test_percent_deadband(self):
+        cache = ChangeCache()
+        self.assertEqual(self.publishes(cache, plan(deadband_percent=10), [100, 109, 111, 100]), [True, False, True, False])
+
+    def test_heartbeat_republishes_unchanged_values(self):
+        cache = ChangeCache()
+        self.assertEqual(self.publishes(cache, plan(heartbeat=3), [1] * 7), [True, False, False, True, False, False, True])
+
+    def test_cache_is_bounded(self):
+        cache = ChangeCache(size=1)
+        usage = plan()
+
+        self.assertEqual(self.publishes(cache, usage, [1, 1]), [True, False])
+        self.assertTrue(cache.changed(plan=usage, field=usage.fields[0]._replace(topic="base/usage/other"), value=1))
+        self.assertEqual(self.publishes(cache, usage, [1]), [True])
+        self.assertEqual(cache.stats()["cached"], 1)
+
+    def test_forget_drops_a_schema(self):
+        cache = ChangeCache()
+        self.publishes(cache, plan(), [1])
+        cache.forget(name="usage")
+
+        self.assertEqual(self.publishes(cache, plan(), [1]), [True])
+
+    def test_batches_only_keep_changed_messages(self):
+        cache = ChangeCache()
+        usage = plan()
+        field = usage.fields[0]
+
+        cache.changed_many(plan=usage, field=field, messages=[("base/usage/power/a", 1), ("base/usage/power/b", 2)])
+        changed = cache.changed_many(plan=usage, field=field, messages=[("base/usage/power/a", 1), ("base/usage/power/b", 3)])
+
+        self.assertEqual(changed, [("base/usage/power/b", 3)])
+        self.assertEqual(cache.stats()["schemas"]["usage"], {"published": 3, "suppressed": 1})
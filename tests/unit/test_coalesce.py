@@ -0,0 +1,37 @@
+from tests.testsuite import TestCase
+from json2mqtt.coalesce import ResponseCache
+
+
+class TestResponseCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 100.0
+        self.cache = ResponseCache(clock=lambda: self.now)
+        self.key = ResponseCache.key(url="http://localhost/usage", headers={"b": "2", "a": "1"})
+
+        self.cache.register(key=self.key, name="fast", interval=10)
+        self.cache.register(key=self.key, name="slow", interval=60)
+
+    def test_keys_ignore_header_order(self):
+        self.assertEqual(self.key, ResponseCache.key(url="http://localhost/usage", headers={"a": "1", "b": "2"}))
+
+    def test_responses_are_shared_once_per_schema(self):
+        self.assertTrue(self.cache.shared(self.key))
+        self.cache.put(key=self.key, name="fast", response="response", data={"a": 1})
+
+        self.assertIsNone(self.cache.get(key=self.key, name="fast"))
+        self.assertEqual(self.cache.get(key=self.key, name="slow").data, {"a": 1})
+        self.assertIsNone(self.cache.get(key=self.key, name="slow"))
+
+    def test_responses_expire_after_the_smallest_interval(self):
+        self.cache.put(key=self.key, name="fast", response="response", data={"a": 1})
+        self.now += 10
+
+        self.assertIsNone(self.cache.get(key=self.key, name="slow"))
+
+    def test_unregister_drops_unused_keys(self):
+        self.cache.unregister(name="fast")
+        self.assertFalse(self.cache.shared(self.key))
+
+        self.cache.unregister(name="slow")
+        self.assertEqual(self.cache.intervals, {})
@@ -0,0 +1,52 @@
+import json
+import math
+import mock
+
+from tests.testsuite import TestCase
+from json2mqtt import codec
+from json2mqtt.codec import JsonCodec, OrjsonCodec, get_codec
+from json2mqtt.settings import ConfigError
+
+
+class TestCodec(TestCase):
+    def test_auto_prefers_orjson(self):
+        self.assertIsInstance(get_codec("auto"), OrjsonCodec)
+
+    def test_auto_falls_back_to_the_standard_library(self):
+        with mock.patch.object(codec, 'orjson', None):
+            self.assertIsInstance(get_codec("auto"), JsonCodec)
+            self.assertNotIsInstance(get_codec("auto"), OrjsonCodec)
+
+    def test_orjson_without_orjson_is_a_config_error(self):
+        with mock.patch.object(codec, 'orjson', None):
+            with self.assertRaises(ConfigError):
+                get_codec("orjson")
+
+    def test_unknown_codec_is_a_config_error(self):
+        with self.assertRaises(ConfigError):
+            get_codec("yaml")
+
+    def test_codecs_encode_the_same_document(self):
+        document = {"name": "Zoë", "values": [1, 2.5, None, True], "nested": {"a": "b"}}
+
+        self.assertEqual(json.loads(JsonCodec().dumps(document)), json.loads(OrjsonCodec().dumps(document)))
+        self.assertEqual(OrjsonCodec().dumps(document), '{"name":"Zoë","values":[1,2.5,null,true],"nested":{"a":"b"}}')
+
+    def test_the_standard_library_codec_keeps_the_default_format(self):
+        document = {"name": "Zoë", "values": [1, None]}
+
+        self.assertEqual(JsonCodec().dumps(document), json.dumps(document))
+
+    def test_codecs_decode_bytes_and_str(self):
+        for instance in (JsonCodec(), OrjsonCodec()):
+            self.assertEqual(instance.loads(b'{"a": [1, 2]}'), {"a": [1, 2]})
+            self.assertEqual(instance.loads('{"a": [1, 2]}'), {"a": [1, 2]})
+
+    def test_orjson_falls_back_for_what_it_refuses(self):
+        self.assertTrue(math.isnan(OrjsonCodec().loads(b'{"a": NaN}')["a"]))
+        self.assertEqual(OrjsonCodec().dumps({1: 2 ** 70}), json.dumps({1: 2 ** 70}, separators=(',', ':')))
+
+    def test_invalid_json_raises_a_decode_error(self):
+        for instance in (JsonCodec(), OrjsonCodec()):
+            with self.assertRaises(json.JSONDecodeError):
+                instance.loads(b'{"a": ')
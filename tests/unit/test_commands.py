@@ -0,0 +1,110 @@
+import json
+import threading
+
+from tests.testsuite import TestCase
+from json2mqtt.commands import CommandHandler
+from json2mqtt.outbox import Outbox
+
+
+class TestCommandHandler(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.setup_client()
+        self.handler = CommandHandler(client=self.client)
+
+    def test_unknown_commands_are_ignored(self):
+        self.handler.dispatcher(section="scheduler", task="unknown", payload=b"")
+        self.client.publish.assert_not_called()
+
+    def test_scheduler_stats_publishes_timer_stats(self):
+        self.client.scheduler.stats.return_value = {"usage": {"missed": 2}}
+
+        self.handler.dispatcher(section="scheduler", task="stats", payload=b"")
+
+        payload = self.published(self.client)["home/json2mqtt/talkback"]
+        self.assertEqual(json.loads(payload), {"usage": {"missed": 2}})
+
+    def test_stats_are_published_as_json(self):
+        self.client.scheduler.changes.stats.return_value = {"cached": 1}
+
+        self.handler.dispatcher(section="scheduler", task="changes", payload=b"")
+
+        self.assertEqual(self.published(self.client)["home/json2mqtt/talkback"], '{"cached": 1}')
+
+    def test_replies_carry_the_correlation_id(self):
+        self.client.schemas = {"usage": {}}
+        self.handler = CommandHandler(client=self.client)
+
+        self.handler.dispatcher(section="schema", task="list", payload=b"", correlation="42")
+
+        payload = json.loads(self.published(self.client)["home/json2mqtt/talkback/42"])
+        self.assertEqual(payload, {"id": "42", "command": "schema/list", "reply": "Schemas: usage"})
+
+    def test_correlated_commands_without_output_are_acknowledged(self):
+        self.client.schemas = {"usage": {"name": "usage"}}
+        self.client.scheduler.timers = {}
+        self.handler = CommandHandler(client=self.client)
+
+        self.handler.dispatcher(section="scheduler", task="add_timer", payload=b"usage", correlation="7")
+
+        payload = json.loads(self.published(self.client)["home/json2mqtt/talkback/7"])
+        self.assertEqual(payload, {"id": "7", "command": "scheduler/add_timer", "reply": None})
+
+    def test_failing_commands_reply_with_the_error(self):
+        self.client.scheduler.stop.side_effect = RuntimeError("busy")
+
+        self.handler.dispatcher(section="scheduler", task="stop", payload=b"", correlation="1")
+
+        payload = json.loads(self.published(self.client)["home/json2mqtt/talkback/1"])
+        self.assertEqual(payload["reply"], "Failed to run scheduler/stop: busy")
+
+    def test_submitted_commands_run_on_the_worker_thread(self):
+        running, release = threading.Event(), threading.Event()
+
+        def stop():
+            running.set()
+            release.wait(timeout=5)
+            return True
+
+        outbox = Outbox()
+        self.client.publish = outbox.put
+        self.client.scheduler.stop.side_effect = stop
+        self.handler.start()
+        self.addCleanup(self.handler.stop)
+
+        self.assertTrue(self.handler.submit(section="scheduler", task="stop", payload=b"", correlation="0"))
+        for correlation in range(1, 5):
+            self.assertTrue(self.handler.submit(section="scheduler", task="list", payload=b"", correlation=str(correlation)))
+        self.assertTrue(running.wait(timeout=5))
+        self.assertEqual(len(outbox), 0)
+
+        release.set()
+        self.handler.stop()
+
+        # Queued replies to correlated commands do not replace each other
+        replies = [json.loads(message.payload) for message in outbox.get(timeout=0)]
+        self.assertEqual([reply["id"] for reply in replies], ["0", "1", "2", "3", "4"])
+        self.assertEqual(outbox.coalesced, 0)
+
+    def test_uncorrelated_commands_all_get_a_reply(self):
+        self.client.schemas = {"usage": {}}
+        self.client.scheduler.stats.return_value = {"usage": {"missed": 0}}
+        outbox = Outbox(coalesce=self.client.settings.publish_coalesce)
+        self.client.publish = outbox.put
+        self.handler = CommandHandler(client=self.client)
+
+        self.handler.dispatcher(section="schema", task="list", payload=b"")
+        self.handler.dispatcher(section="scheduler", task="stats", payload=b"")
+
+        replies = [(message.topic, message.payload) for message in outbox.get(timeout=0)]
+        self.assertEqual(replies, [
+            ("home/json2mqtt/talkback", "Schemas: usage"),
+            ("home/json2mqtt/talkback", '{"usage": {"missed": 0}}'),
+        ])
+
+    def test_submit_refuses_commands_when_the_queue_is_full(self):
+        self.client.settings.command_queue_size = 1
+        self.handler = CommandHandler(client=self.client)
+
+        self.assertTrue(self.handler.submit(section="schema", task="list", payload=b""))
+        self.assertFalse(self.handler.submit(section="schema", task="list", payload=b""))
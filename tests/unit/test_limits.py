@@ -0,0 +1,65 @@
+from tests.testsuite import TestCase
+from json2mqtt.limits import HostLimit, HostLimits, TokenBucket
+
+
+class TestTokenBucket(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+
+    def test_reservations_are_spaced_by_the_rate(self):
+        bucket = TokenBucket(rate=2, clock=lambda: self.now)
+
+        self.assertEqual([bucket.reserve(), bucket.reserve(), bucket.reserve()], [0.0, 0.5, 1.0])
+
+    def test_tokens_refill_up_to_the_burst(self):
+        bucket = TokenBucket(rate=1, burst=2, clock=lambda: self.now)
+        bucket.reserve()
+        bucket.reserve()
+
+        self.now += 10
+        self.assertEqual([bucket.reserve(), bucket.reserve(), bucket.reserve()], [0.0, 0.0, 1.0])
+
+    def test_take_only_takes_available_tokens(self):
+        bucket = TokenBucket(rate=2, clock=lambda: self.now)
+
+        self.assertEqual([bucket.take(), bucket.take(), bucket.take()], [0.0, 0.5, 0.5])
+
+        self.now += 0.5
+        self.assertEqual([bucket.take(), bucket.take()], [0.0, 0.5])
+
+
+class TestHostLimits(TestCase):
+    def test_limits_are_shared_per_host_with_overrides(self):
+        limits = HostLimits(max_in_flight=4, hosts={"toon.local": {"max_in_flight": 1, "rate": 5}})
+
+        toon = limits.limit("http://toon.local/happ_thermstat?action=getThermostatInfo")
+        self.assertIs(toon, limits.limit("http://toon.local/hdrv_zwave?action=getDevices.json"))
+        self.assertEqual(toon.semaphore._value, 1)
+        self.assertEqual(toon.bucket.rate, 5)
+
+        other = limits.limit("http://boiler.local/boilervalues")
+        self.assertEqual(other.semaphore._value, 4)
+        self.assertIsNone(other.bucket)
+
+    def test_unlimited_hosts_never_wait(self):
+        limit = HostLimit()
+
+        self.assertEqual(limit.try_acquire(), 0.0)
+        limit.release()
+
+    def test_max_in_flight_defers_until_released(self):
+        limit = HostLimit(max_in_flight=1)
+        self.assertEqual(limit.try_acquire(), 0.0)
+
+        self.assertEqual(limit.try_acquire(), limit.retry)
+        limit.release()
+        self.assertEqual(limit.try_acquire(), 0.0)
+
+    def test_rate_limited_hosts_keep_their_slot_free_while_deferred(self):
+        limit = HostLimit(max_in_flight=1, rate=1)
+        self.assertEqual(limit.try_acquire(), 0.0)
+        limit.release()
+
+        self.assertGreater(limit.try_acquire(), 0.0)
+        self.assertEqual(limit.semaphore._value, 1)
@@ -0,0 +1,58 @@
+import urllib.request
+
+from tests.testsuite import TestCase
+from json2mqtt.metrics import Histogram, Metrics, MetricsServer
+
+
+class TestHistogram(TestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram()
+        for value in (0.0001, 0.003, 0.003, 20):
+            histogram.observe(value)
+
+        buckets = dict(histogram.cumulative())
+        self.assertEqual(buckets[0.0005], 1)
+        self.assertEqual(buckets[0.005], 3)
+        self.assertEqual(buckets[10.0], 3)
+        self.assertEqual(buckets["+Inf"], 4)
+        self.assertEqual(histogram.count, 4)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.metrics = Metrics()
+        self.metrics.observe("http_request_seconds", "usage", 0.2)
+        self.metrics.increment("fetch_success_total", "usage")
+        self.metrics.increment("fetch_success_total", "usage", 2)
+        self.metrics.increment("fetch_failure_total", "usage", 0)
+        self.metrics.gauge("queue_depth", lambda: 3, "Runs waiting")
+        self.metrics.counter("publish_dropped_total", lambda: 5, "Messages dropped")
+
+    def test_snapshot_groups_metrics_per_schema(self):
+        snapshot = self.metrics.snapshot()
+
+        self.assertEqual(snapshot["schemas"]["usage"]["fetch_success_total"], 3)
+        self.assertEqual(snapshot["schemas"]["usage"]["http_request_seconds"], {"count": 1, "mean": 0.2})
+        self.assertNotIn("fetch_failure_total", snapshot["schemas"]["usage"])
+        self.assertEqual(snapshot["gauges"], {"queue_depth": 3, "publish_dropped_total": 5})
+
+    def test_prometheus_text_format(self):
+        text = self.metrics.prometheus()
+
+        self.assertIn("# TYPE json2mqtt_http_request_seconds histogram", text)
+        self.assertIn('json2mqtt_http_request_seconds_bucket{schema="usage",le="0.25"} 1', text)
+        self.assertIn('json2mqtt_http_request_seconds_count{schema="usage"} 1', text)
+        self.assertIn('json2mqtt_fetch_success_total{schema="usage"} 3', text)
+        self.assertIn("# TYPE json2mqtt_queue_depth gauge", text)
+        self.assertIn("json2mqtt_queue_depth 3", text)
+        self.assertIn("# TYPE json2mqtt_publish_dropped_total counter", text)
+        self.assertIn("json2mqtt_publish_dropped_total 5", text)
+
+    def test_server_exposes_metrics(self):
+        server = MetricsServer(metrics=self.metrics, port=0).start()
+        self.addCleanup(server.stop)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as response:
+            self.assertEqual(response.status, 200)
+            self.assertIn(b"json2mqtt_fetch_success_total", response.read())
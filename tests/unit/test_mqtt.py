@@ -0,0 +1,67 @@
+import logging
+import mock
+import os
+import tempfile
+
+import paho.mqtt.client as mqtt
+
+from tests.testsuite import TestCase
+from benchmarks.sink import settings
+from json2mqtt.mqtt import MQTTListener
+
+
+class TestMQTTListener(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.listener = MQTTListener(
+            settings=settings(spool_file=os.path.join(directory.name, "spool.db"), spool_replay_rate=0),
+            schemas={},
+            logger=logging.getLogger('json2mqtt.tests'),
+        )
+        self.addCleanup(self.listener.spool.close)
+
+        patcher = mock.patch.object(mqtt.Client, 'publish', return_value=mock.Mock(rc=mqtt.MQTT_ERR_SUCCESS))
+        self.paho = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent(self):
+        return [call.kwargs['payload'] for call in self.paho.call_args_list]
+
+    def test_messages_are_spooled_while_offline_and_replayed_in_order(self):
+        for value in range(3):
+            self.listener.publish(topic=f"home/json2mqtt/usage/{value}", payload=value)
+
+        self.listener.replay()
+        self.assertEqual(len(self.listener.spool), 3)
+        self.paho.assert_not_called()
+
+        self.listener.online.set()
+        self.listener.publish(topic="home/json2mqtt/usage/3", payload=3)
+        while len(self.listener.spool) or len(self.listener.outbox):
+            self.listener.replay()
+
+        self.assertEqual(self.sent(), [b"0", b"1", b"2", b"3"])
+
+    def test_messages_refused_by_paho_are_spooled(self):
+        self.paho.return_value = mock.Mock(rc=mqtt.MQTT_ERR_NO_CONN)
+        self.listener.online.set()
+        self.listener.publish(topic="home/json2mqtt/usage/power", payload=1)
+
+        self.listener.forward()
+
+        self.assertEqual(len(self.listener.outbox), 0)
+        self.assertEqual(len(self.listener.spool), 1)
+
+    def test_commands_are_queued_with_their_correlation_id(self):
+        self.listener.command_handler = mock.Mock()
+
+        for topic in ("home/json2mqtt/command/scheduler/stop", "home/json2mqtt/command/schema/list/req-1", "home/json2mqtt/command/x"):
+            self.listener.on_message(client=None, userdata=None, message=mock.Mock(topic=topic, payload=b"0"))
+
+        self.assertEqual(self.listener.command_handler.submit.call_args_list, [
+            mock.call(section="scheduler", task="stop", payload=b"0", correlation=None),
+            mock.call(section="schema", task="list", payload=b"0", correlation="req-1"),
+        ])
@@ -0,0 +1,65 @@
+import threading
+
+from tests.testsuite import TestCase
+from json2mqtt.outbox import Outbox
+
+
+class TestOutbox(TestCase):
+    def test_only_the_latest_value_per_topic_is_kept(self):
+        outbox = Outbox(coalesce=True)
+        outbox.put(topic="home/json2mqtt/usage/power", payload=1)
+        outbox.put(topic="home/json2mqtt/usage/result", payload="ok")
+        outbox.put(topic="home/json2mqtt/usage/power", payload=2)
+
+        batch = outbox.get(timeout=0)
+        self.assertEqual([(message.topic, message.payload) for message in batch], [
+            ("home/json2mqtt/usage/power", 2),
+            ("home/json2mqtt/usage/result", "ok"),
+        ])
+        self.assertEqual(outbox.stats()["coalesced"], 1)
+
+    def test_without_coalescing_every_message_is_kept(self):
+        outbox = Outbox()
+        outbox.put(topic="power", payload=1)
+        outbox.put(topic="power", payload=2)
+
+        self.assertEqual([message.payload for message in outbox.get(timeout=0)], [1, 2])
+
+    def test_batches_are_queued_at_once(self):
+        outbox = Outbox(capacity=2, policy="drop_newest")
+
+        self.assertEqual(outbox.put_many(messages=[("a", 1), ("b", 2), ("c", 3)]), 2)
+        self.assertEqual([(message.topic, message.payload) for message in outbox.get(timeout=0)], [("a", 1), ("b", 2)])
+
+    def test_drop_oldest_makes_room_for_new_messages(self):
+        outbox = Outbox(capacity=2)
+        for number in range(3):
+            self.assertTrue(outbox.put(topic=f"topic/{number}", payload=number))
+
+        self.assertEqual([message.payload for message in outbox.get(timeout=0)], [1, 2])
+        self.assertEqual(outbox.stats()["dropped"], 1)
+
+    def test_drop_newest_refuses_new_messages(self):
+        outbox = Outbox(capacity=2, policy="drop_newest")
+        outbox.put(topic="topic/0", payload=0)
+        outbox.put(topic="topic/1", payload=1)
+
+        self.assertFalse(outbox.put(topic="topic/2", payload=2))
+        self.assertEqual([message.payload for message in outbox.get(timeout=0)], [0, 1])
+        self.assertEqual(outbox.stats()["dropped"], 1)
+
+    def test_get_waits_for_messages(self):
+        outbox = Outbox()
+        self.assertEqual(outbox.get(timeout=0.01), [])
+
+        threading.Timer(0.05, outbox.put, kwargs=dict(topic="power", payload=1)).start()
+        self.assertEqual(len(outbox.get(timeout=2)), 1)
+
+    def test_batches_are_limited(self):
+        outbox = Outbox()
+        for number in range(5):
+            outbox.put(topic=f"topic/{number}", payload=number)
+
+        self.assertEqual(len(outbox.get(limit=3, timeout=0)), 3)
+        self.assertEqual(outbox.stats()["depth"], 2)
+        self.assertEqual(outbox.stats()["sent"], 3)
@@ -0,0 +1,96 @@
+import http.client
+import json
+import logging
+import socket
+import tempfile
+import urllib.error
+import urllib.request
+
+from tests.testsuite import TestCase
+from json2mqtt.push import PushServer
+from json2mqtt.scheduler import Scheduler
+from json2mqtt.schemas import Schemas
+
+
+SCHEMA = {
+    "name": "meter",
+    "push": "/push/meter",
+    "fields": {
+        "power": {"type": "Integer", "path": "power.value"},
+    },
+}
+
+
+class TestPushServer(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.schemas = Schemas(logger=logging.getLogger('json2mqtt.tests'), schema_dir=directory.name)
+        self.assertTrue(self.schemas.add_schema(schema=SCHEMA))
+
+        self.client = self.setup_client(schemas=self.schemas)
+        self.scheduler = Scheduler(client=self.client)
+        self.addCleanup(self.scheduler.close)
+
+        self.server = PushServer(schemas=self.schemas, scheduler=self.scheduler, logger=self.client.logger, port=0).start()
+        self.addCleanup(self.server.stop)
+
+    def post(self, path, body, method="POST"):
+        request = urllib.request.Request(self.server.url(path), data=body, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def test_pushed_documents_are_published_right_away(self):
+        self.assertEqual(self.post("/push/meter", b'{"power": {"value": 42}}'), 202)
+
+        self.assertEqual(self.published(self.client)["home/json2mqtt/meter/power"], 42)
+        self.assertEqual(self.scheduler.metrics.snapshot()["schemas"]["meter"]["push_total"], 1)
+
+    def test_requests_are_checked(self):
+        self.assertEqual(self.post("/push/other", b'{}'), 404)
+        self.assertEqual(self.post("/push/meter", None, method="GET"), 405)
+        self.assertEqual(self.post("/push/meter", b'{"power": '), 400)
+
+        self.server.max_body = 10
+        self.assertEqual(self.post("/push/meter", b'{"power": {"value": 42}}'), 413)
+
+        self.client.publish.assert_not_called()
+
+    def test_connections_are_kept_alive(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        self.addCleanup(connection.close)
+
+        for value in range(3):
+            connection.request("POST", "/push/meter", body=json.dumps({"power": {"value": value}}))
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 202)
+
+        self.assertEqual(self.client.publish.call_count, 3)
+
+    def test_chunked_bodies_are_accepted(self):
+        with socket.create_connection(("127.0.0.1", self.server.port), timeout=5) as sock:
+            sock.sendall(
+                b"POST /push/meter HTTP/1.1\r\nHost: localhost\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+                b"a\r\n{\"power\": \r\n0e\r\n{\"value\": 7}}\r\n0\r\n\r\n"
+            )
+            self.assertTrue(sock.recv(1024).startswith(b"HTTP/1.1 202"))
+
+        self.assertEqual(self.published(self.client)["home/json2mqtt/meter/power"], 7)
+
+    def test_routes_follow_schema_changes(self):
+        self.schemas.add_schema(schema=dict(SCHEMA, push="/push/moved"))
+        self.assertEqual(self.post("/push/meter", b'{}'), 404)
+        self.assertEqual(self.post("/push/moved", b'{}'), 202)
+
+        self.schemas.discard(name="meter")
+        self.assertEqual(self.post("/push/moved", b'{}'), 404)
+
+    def test_push_only_schemas_get_no_timer(self):
+        self.assertFalse(self.scheduler.add_timer(name="meter"))
+        self.assertEqual(self.scheduler.timers, {})
@@ -0,0 +1,273 @@
+import datetime
+import json
+import logging
+import mock
+import tempfile
+
+from tests.testsuite import TestCase
+from json2mqtt.scheduler import Scheduler, create_scheduler
+from json2mqtt.timers import Deferred
+from json2mqtt.schemas import Schemas
+
+
+SCHEMA = {
+    "name": "usage",
+    "url": "http://localhost/usage",
+    "interval": 60,
+    "headers": [
+        {"key": "User-Agent", "value": "Json2MQTT"},
+    ],
+    "fields": {
+        "result": {"type": "String", "path": "result"},
+        "power": {"type": "String", "cast": "Integer", "path": "power.value"},
+        "missing": {"type": "Integer", "path": "does.not.exist"},
+    }
+}
+
+
+def response(data, status_code=200, headers=None):
+    result = mock.Mock()
+    result.headers = headers or {}
+    result.status_code = status_code
+    result.reason = "OK"
+    result.ok = status_code < 400
+    result.url = SCHEMA['url']
+    result.elapsed = datetime.timedelta(seconds=0.5)
+    result.json.return_value = data
+    result.content = json.dumps(data).encode('utf-8')
+    return result
+
+
+class TestScheduler(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.schemas = Schemas(logger=logging.getLogger('json2mqtt.tests'), schema_dir=directory.name)
+        self.schemas.add_schema(schema=SCHEMA)
+
+        self.client = self.setup_client(schemas=self.schemas)
+        self.scheduler = Scheduler(client=self.client)
+        self.requests = self.scheduler.sessions = mock.Mock()
+
+    def test_headers_are_built_from_key_value_pairs(self):
+        self.assertEqual(self.scheduler.headers(schema=SCHEMA), {"User-Agent": "Json2MQTT"})
+
+    def test_fetch_publishes_request_status_and_fields(self):
+        self.requests.get.return_value = response({"result": "ok", "power": {"value": "42"}})
+
+        self.assertTrue(self.scheduler.fetch(schema=SCHEMA))
+
+        self.requests.get.assert_called_once_with(SCHEMA['url'], timeout=10, headers={"User-Agent": "Json2MQTT"}, stream=False)
+        published = self.published(self.client)
+        self.assertEqual(published["home/json2mqtt/usage/request/status_code"], 200)
+        self.assertEqual(published["home/json2mqtt/usage/result"], "ok")
+        self.assertEqual(published["home/json2mqtt/usage/power"], 42)
+        self.assertNotIn("home/json2mqtt/usage/missing", published)
+
+    def test_fetch_skips_processing_on_http_errors(self):
+        self.requests.get.return_value = response({}, status_code=500)
+        self.requests.get.return_value.raise_for_status.side_effect = Exception("500 Server Error")
+
+        self.assertIsNone(self.scheduler.fetch(schema=SCHEMA))
+        self.assertNotIn("home/json2mqtt/usage/result", self.published(self.client))
+
+    def test_not_modified_responses_skip_processing(self):
+        self.requests.get.return_value = response({"result": "ok"}, headers={"ETag": '"abc"'})
+        self.scheduler.fetch(schema=SCHEMA)
+
+        self.requests.get.return_value = response(None, status_code=304)
+        self.client.publish.reset_mock()
+
+        self.assertTrue(self.scheduler.fetch(schema=SCHEMA))
+
+        self.assertEqual(self.requests.get.call_args.kwargs['headers']['If-None-Match'], '"abc"')
+        self.requests.get.return_value.json.assert_not_called()
+        published = self.published(self.client)
+        self.assertTrue(published["home/json2mqtt/usage/request/not_modified"])
+        self.assertNotIn("home/json2mqtt/usage/result", published)
+
+    def test_document_mode_publishes_a_single_message(self):
+        self.schemas.add_schema(schema=dict(SCHEMA, publish="document"))
+        self.requests.get.return_value = response({"result": "ok", "power": {"value": "42"}})
+
+        self.assertTrue(self.scheduler.fetch(schema=self.schemas["usage"]))
+
+        self.assertEqual(self.client.publish.call_count, 1)
+        document = json.loads(self.published(self.client)["home/json2mqtt/usage/document"])
+        self.assertEqual(document["fields"], {"result": "ok", "power": 42})
+        self.assertEqual(document["request"]["status_code"], 200)
+
+    def test_both_mode_publishes_fields_and_document(self):
+        self.schemas.add_schema(schema=dict(SCHEMA, publish="both"))
+        self.requests.get.return_value = response({"result": "ok", "power": {"value": "42"}})
+
+        self.scheduler.fetch(schema=self.schemas["usage"])
+
+        published = self.published(self.client)
+        self.assertIn("home/json2mqtt/usage/document", published)
+        self.assertIn("home/json2mqtt/usage/request/status_code", published)
+        self.assertEqual(published["home/json2mqtt/usage/power"], 42)
+
+    def test_fanout_fields_publish_every_element_to_its_own_topic(self):
+        self.schemas.add_schema(schema=dict(SCHEMA, on_change=True, fields={
+            "devices": {"type": "List", "path": "devices[*]", "fanout": True, "fanout_key": "id"},
+            "rooms": {"type": "Dictionary", "path": "rooms", "fanout": True, "cast": "Integer"},
+        }))
+        devices = [{"id": "dev/1", "power": 5}, {"id": "dev_2", "power": 7}, {"power": 9}]
+        self.requests.get.return_value = response({"devices": devices, "rooms": {"hall": "20", "attic": "17"}})
+
+        self.assertTrue(self.scheduler.fetch(schema=self.schemas["usage"]))
+
+        published = dict(message for call in self.client.publish_many.call_args_list for message in call.kwargs["messages"])
+        self.assertEqual(published, {
+            "home/json2mqtt/usage/devices/dev_1": '{"id":"dev/1","power":5}',
+            "home/json2mqtt/usage/devices/dev_2": '{"id":"dev_2","power":7}',
+            "home/json2mqtt/usage/devices/2": '{"power":9}',
+            "home/json2mqtt/usage/rooms/hall": 20,
+            "home/json2mqtt/usage/rooms/attic": 17,
+        })
+        self.assertNotIn("home/json2mqtt/usage/devices", self.published(self.client))
+
+        devices[1]["power"] = 8
+        self.requests.get.return_value = response({"devices": devices, "rooms": {"hall": "20", "attic": "17"}})
+        self.client.publish_many.reset_mock()
+        self.scheduler.fetch(schema=self.schemas["usage"])
+
+        self.client.publish_many.assert_called_once_with(messages=[
+            ("home/json2mqtt/usage/devices/dev_2", '{"id":"dev_2","power":8}'),
+        ])
+
+    def test_derived_fields_publish_their_window_metrics(self):
+        self.schemas.add_schema(schema=dict(SCHEMA, publish="both", fields={
+            "power": {"type": "String", "cast": "Integer", "path": "power.value", "derive": ["mean", "max"], "window": 2},
+        }))
+
+        for value in ("10", "30", "20"):
+            self.requests.get.return_value = response({"power": {"value": value}})
+            self.scheduler.fetch(schema=self.schemas["usage"])
+
+        self.client.publish_many.assert_called_with(messages=[
+            ("home/json2mqtt/usage/power/mean", 25), ("home/json2mqtt/usage/power/max", 30),
+        ])
+        document = json.loads(self.published(self.client)["home/json2mqtt/usage/document"])
+        self.assertEqual(document["fields"], {"power": 20, "power/mean": 25, "power/max": 30})
+
+    def test_schemas_on_the_same_url_share_one_request(self):
+        self.schemas.add_schema(schema=dict(SCHEMA, name="other"))
+        for name in ("usage", "other"):
+            self.scheduler.responses.register(key=self.scheduler.response_key(schema=SCHEMA), name=name, interval=60)
+
+        self.requests.get.return_value = response({"result": "ok", "power": {"value": "42"}})
+
+        with mock.patch.object(self.scheduler.codec, 'loads', wraps=self.scheduler.codec.loads) as loads:
+            self.scheduler.fetch(schema=self.schemas["usage"])
+            self.scheduler.fetch(schema=self.schemas["other"])
+
+        self.assertEqual(self.requests.get.call_count, 1)
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual(self.published(self.client)["home/json2mqtt/other/power"], 42)
+
+    def test_open_circuits_skip_requests_and_publish_their_state(self):
+        self.requests.get.side_effect = ConnectionError("unreachable")
+
+        for _ in range(self.client.settings.circuit_threshold + 2):
+            self.scheduler.fetch(schema=SCHEMA)
+
+        self.assertEqual(self.requests.get.call_count, self.client.settings.circuit_threshold)
+        self.assertEqual(self.published(self.client)["home/json2mqtt/usage/request/circuit"], "open")
+
+    def test_timer_stats_are_published_next_to_the_configured_schedule(self):
+        self.requests.get.return_value = response({"result": "ok", "power": {"value": "42"}})
+        self.scheduler.timers["usage"] = timer = mock.Mock()
+        timer.stats.return_value = {"interval": 60, "policy": "skip", "missed": 2, "actual_interval": 61.5}
+
+        self.scheduler.fetch(schema=SCHEMA)
+
+        published = self.published(self.client)
+        self.assertEqual(published["home/json2mqtt/usage/request/interval"], 60)
+        self.assertEqual(published["home/json2mqtt/usage/request/overrun"], "skip")
+        self.assertEqual(published["home/json2mqtt/usage/request/missed"], 2)
+
+    def test_skipped_ticks_publish_the_half_open_state_while_probing(self):
+        circuit = self.scheduler.breakers.circuit(SCHEMA['url'])
+        circuit.state, circuit.retry_at = circuit.OPEN, 0.0
+        self.assertTrue(circuit.allow())
+
+        self.scheduler.fetch(schema=SCHEMA)
+
+        self.requests.get.assert_not_called()
+        self.assertEqual(self.published(self.client)["home/json2mqtt/usage/request/circuit"], "half_open")
+
+    def test_busy_hosts_defer_the_run_instead_of_waiting(self):
+        self.requests.get.return_value = response({"result": "ok", "power": {"value": "42"}})
+        limit = self.scheduler.limits.limit(SCHEMA['url'])
+        limit.semaphore = mock.Mock()
+        limit.semaphore.acquire.return_value = False
+
+        circuit = self.scheduler.breakers.circuit(SCHEMA['url'])
+        circuit.state, circuit.retry_at = circuit.OPEN, 0.0
+
+        with self.assertRaises(Deferred):
+            self.scheduler.fetch(schema=SCHEMA)
+
+        self.requests.get.assert_not_called()
+        self.assertFalse(circuit.probing)
+
+        limit.semaphore.acquire.return_value = True
+        self.assertTrue(self.scheduler.fetch(schema=SCHEMA))
+        self.assertGreaterEqual(self.published(self.client)["home/json2mqtt/usage/request/queue_delay"], 0.0)
+        self.assertNotIn("usage", self.scheduler.queued)
+
+    def test_streaming_schemas_extract_while_the_response_arrives(self):
+        self.schemas.add_schema(schema=dict(SCHEMA, stream=True))
+        self.requests.get.return_value = result = response({})
+        content = json.dumps({"result": "ok", "power": {"value": "42"}, "history": list(range(1000))}).encode('utf-8')
+        result.iter_content.return_value = [content[start:start + 100] for start in range(0, len(content), 100)]
+
+        self.assertTrue(self.scheduler.fetch(schema=self.schemas["usage"]))
+
+        self.assertTrue(self.requests.get.call_args.kwargs['stream'])
+        self.assertEqual(self.published(self.client)["home/json2mqtt/usage/power"], 42)
+
+    def test_streamed_responses_hold_their_host_slot_until_the_body_was_read(self):
+        self.client.settings.host_max_in_flight = 1
+        self.scheduler = Scheduler(client=self.client)
+        self.requests = self.scheduler.sessions = mock.Mock()
+        limit = self.scheduler.limits.limit(SCHEMA['url'])
+
+        held = []
+
+        def chunks(chunk_size):
+            for chunk in (b'{"result": "ok", ', b'"power": {"value": "42"}}'):
+                held.append(limit.semaphore._value == 0)
+                yield chunk
+
+        self.schemas.add_schema(schema=dict(SCHEMA, stream=True))
+        self.requests.get.return_value = result = response({})
+        result.iter_content.side_effect = chunks
+
+        self.assertTrue(self.scheduler.fetch(schema=self.schemas["usage"]))
+
+        self.assertEqual(held, [True, True])
+        self.assertEqual(limit.semaphore._value, 1)
+        self.assertEqual(self.published(self.client)["home/json2mqtt/usage/power"], 42)
+
+    def test_fetches_are_counted_in_metrics(self):
+        self.requests.get.return_value = response({"result": "ok", "power": {"value": 42}})
+        self.scheduler.fetch(schema=SCHEMA)
+
+        self.requests.get.return_value = response({}, status_code=500)
+        self.requests.get.return_value.raise_for_status.side_effect = Exception("500 Server Error")
+        self.scheduler.fetch(schema=SCHEMA)
+
+        metrics = self.scheduler.metrics.snapshot()["schemas"]["usage"]
+        self.assertEqual(metrics["fetch_success_total"], 1)
+        self.assertEqual(metrics["fetch_failure_total"], 1)
+        self.assertEqual(metrics["type_mismatch_total"], 1)
+        self.assertEqual(metrics["skipped_fields_total"], 1)
+        self.assertEqual(metrics["http_request_seconds"]["count"], 2)
+
+    def test_create_scheduler_defaults_to_threads(self):
+        self.assertIsInstance(create_scheduler(client=self.client), Scheduler)
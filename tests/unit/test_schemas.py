@@ -0,0 +1,114 @@
+import json
+import logging
+import mock
+import os
+import tempfile
+
+from tests.testsuite import TestCase
+from json2mqtt.codec import JsonCodec
+from json2mqtt.plan import SchemaPlan
+from json2mqtt.schemas import Schemas
+
+
+SCHEMA = {
+    "name": "version",
+    "url": "http://localhost/version",
+    "interval": 60,
+    "fields": {
+        "mmb": {"type": "String", "cast": "Boolean", "path": "mmb"},
+        "version": {"type": "String", "path": "\"dev_2.1\".version"},
+        "nothing": {"type": "None", "path": "nothing"},
+    }
+}
+
+
+class TestSchemas(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.directory = directory.name
+        self.schemas = Schemas(logger=logging.getLogger('json2mqtt.tests'), schema_dir=directory.name, mqtt_topic="base")
+
+    def reimport(self, files):
+        for name, data in files.items():
+            with open(os.path.join(self.directory, f"{name}.json"), 'w') as fh:
+                fh.write(data if isinstance(data, str) else json.dumps(data))
+
+        schemas = Schemas(logger=self.schemas.logger, schema_dir=self.directory, mqtt_topic="base")
+        with mock.patch.object(Schemas, 'valid', wraps=Schemas.valid) as valid:
+            schemas.import_all()
+
+        return schemas, valid.call_count
+
+    def test_schema_files_are_decoded_with_the_configured_codec(self):
+        codec = mock.Mock(wraps=JsonCodec())
+        schemas = Schemas(logger=self.schemas.logger, schema_dir=self.directory, codec=codec)
+
+        self.assertEqual(schemas.load(content='{"name": "usage"}'), {"name": "usage"})
+        codec.loads.assert_called_once_with('{"name": "usage"}')
+
+    def test_add_schema_compiles_a_plan(self):
+        self.assertTrue(self.schemas.add_schema(schema=SCHEMA))
+
+        plan = self.schemas.plans["version"]
+        self.assertIsInstance(plan, SchemaPlan)
+        self.assertEqual([f.topic for f in plan.fields], ["base/version/mmb", "base/version/version", "base/version/nothing"])
+        self.assertEqual(plan.fields[0].cast, bool)
+        self.assertEqual(plan.fields[1].expression.search({"dev_2.1": {"version": "1.0"}}), "1.0")
+        self.assertEqual(plan.fields[2].type, type(None))
+
+    def test_plans_are_immutable(self):
+        self.schemas.add_schema(schema=SCHEMA)
+
+        with self.assertRaises(AttributeError):
+            self.schemas.plans["version"].fields[0].topic = "other"
+
+    def test_topic_override_is_used_in_the_plan(self):
+        self.schemas.add_schema(schema=dict(SCHEMA, topic="other"))
+        self.assertEqual(self.schemas.plans["version"].fields[0].topic, "other/version/mmb")
+
+    def test_plans_of_other_schema_dicts_are_compiled_once(self):
+        schema = dict(SCHEMA, name="other")
+
+        with mock.patch.object(SchemaPlan, 'compile', wraps=SchemaPlan.compile) as compile:
+            plan = self.schemas.plan(schema)
+            self.assertIs(self.schemas.plan(schema), plan)
+
+        self.assertEqual(compile.call_count, 1)
+
+    def test_replaced_schemas_keep_their_own_plan(self):
+        old = dict(SCHEMA)
+        self.schemas.add_schema(schema=old)
+        self.schemas.add_schema(schema=dict(SCHEMA, topic="other"))
+
+        self.assertEqual(self.schemas.plan(old).fields[0].topic, "base/version/mmb")
+        self.assertEqual(self.schemas.plan(self.schemas["version"]).fields[0].topic, "other/version/mmb")
+
+    def test_invalid_paths_and_fields_are_rejected(self):
+        self.assertFalse(self.schemas.add_schema(schema=dict(SCHEMA, fields={"a": {"type": "String", "path": "a..b"}})))
+        self.assertFalse(self.schemas.add_schema(schema=dict(SCHEMA, fields={"a": {"type": "String"}})))
+        self.assertNotIn("version", self.schemas.plans)
+
+    def test_remove_schema_drops_the_plan(self):
+        self.schemas.add_schema(schema=SCHEMA)
+        self.assertTrue(self.schemas.remove_schema(name="version"))
+        self.assertNotIn("version", self.schemas.plans)
+
+    def test_import_all_skips_invalid_files(self):
+        schemas, _ = self.reimport({"version": SCHEMA, "broken": "{", "incomplete": {"name": "incomplete"}})
+
+        self.assertEqual(list(schemas.keys()), ["version"])
+        self.assertEqual(schemas["version"]["filename"], os.path.join(self.directory, "version.json"))
+
+    def test_unchanged_files_are_not_validated_again(self):
+        _, validated = self.reimport({"version": SCHEMA})
+        self.assertEqual(validated, 1)
+
+        schemas, validated = self.reimport({})
+        self.assertEqual(validated, 0)
+        self.assertIn("version", schemas.plans)
+
+        _, validated = self.reimport({"version": dict(SCHEMA, interval=30)})
+        self.assertEqual(validated, 1)
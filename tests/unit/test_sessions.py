@@ -0,0 +1,47 @@
+import mock
+
+from tests.testsuite import TestCase
+from json2mqtt.sessions import SessionPool, Validators
+
+
+class TestSessionPool(TestCase):
+    def test_sessions_are_shared_per_host(self):
+        pool = SessionPool(pool_size=4)
+        self.addCleanup(pool.close)
+
+        first = pool.session("http://toon.local/happ_pwrusage?action=GetCurrentUsage")
+        second = pool.session("http://toon.local/hdrv_zwave?action=getDevices.json")
+        other = pool.session("https://toon.local/hdrv_zwave?action=getDevices.json")
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertEqual(first.get_adapter("http://toon.local/")._pool_maxsize, 4)
+
+    def test_close_empties_the_pool(self):
+        pool = SessionPool()
+        pool.session("http://toon.local/")
+
+        self.assertTrue(pool.close())
+        self.assertEqual(pool.sessions, {})
+
+
+class TestValidators(TestCase):
+    def test_validators_are_tracked_per_schema(self):
+        validators = Validators()
+        validators.update(
+            schema={"name": "a"},
+            response=mock.Mock(headers={"ETag": '"1"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"}),
+        )
+
+        self.assertEqual(validators.headers(schema={"name": "a"}), {
+            "If-None-Match": '"1"',
+            "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT",
+        })
+        self.assertEqual(validators.headers(schema={"name": "b"}), {})
+
+    def test_responses_without_validators_forget_them(self):
+        validators = Validators()
+        validators.update(schema={"name": "a"}, response=mock.Mock(headers={"ETag": '"1"'}))
+        validators.update(schema={"name": "a"}, response=mock.Mock(headers={}))
+
+        self.assertEqual(validators.headers(schema={"name": "a"}), {})
@@ -0,0 +1,92 @@
+import logging
+import tempfile
+import time
+
+from tests.testsuite import TestCase
+from benchmarks.server import PayloadServer
+from json2mqtt.scheduler import create_scheduler
+from json2mqtt.schemas import Schemas
+from json2mqtt.shards import ShardedScheduler, shard, share
+
+
+class TestShard(TestCase):
+    def test_shards_are_stable_and_spread(self):
+        names = [f"schema_{number}" for number in range(100)]
+
+        self.assertEqual([shard(name, 4) for name in names], [shard(name, 4) for name in names])
+        self.assertEqual(set(shard(name, 4) for name in names), {0, 1, 2, 3})
+
+    def test_host_limits_are_divided_over_the_workers(self):
+        self.assertEqual(share({"max_in_flight": 4, "rate": 2, "burst": 3}, workers=4), {"max_in_flight": 1, "rate": 0.5, "burst": 1})
+        self.assertEqual(share({"max_in_flight": 1, "rate": 0}, workers=4), {"max_in_flight": 1, "rate": 0})
+
+
+class TestShardedScheduler(TestCase):
+    def setUp(self):
+        super().setUp()
+        server = PayloadServer().start()
+        self.addCleanup(server.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.schemas = Schemas(logger=logging.getLogger('json2mqtt.tests'), schema_dir=directory.name)
+        for number in range(4):
+            self.schemas.add_schema(schema={
+                "name": f"usage_{number}",
+                "url": server.url("current_usage"),
+                "interval": 0.2,
+                "fields": {"result": {"type": "String", "path": "result"}},
+            })
+
+        self.client = self.setup_client(schemas=self.schemas, workers=2, phase_window=0)
+        self.scheduler = create_scheduler(client=self.client)
+        self.addCleanup(self.scheduler.close)
+
+    def wait(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        return condition()
+
+    def test_workers_get_their_part_of_the_host_limits(self):
+        self.client.settings.host_rate = 10
+        self.client.settings.host_limits = {"toon.local": {"max_in_flight": 4, "rate": 2}}
+
+        settings = self.scheduler.worker_settings()
+
+        self.assertEqual(settings["host_rate"], 5)
+        self.assertEqual(settings["host_limits"], {"toon.local": {"max_in_flight": 2, "rate": 1}})
+
+    def test_workers_fetch_and_the_coordinator_publishes(self):
+        self.assertIsInstance(self.scheduler, ShardedScheduler)
+        self.scheduler.start()
+
+        self.assertTrue(self.wait(lambda: len(self.published(self.client)) >= 4 * 8))
+        self.assertEqual(self.published(self.client)["home/json2mqtt/usage_3/result"], "ok")
+
+        self.assertEqual(sorted(self.scheduler.timers), ["usage_0", "usage_1", "usage_2", "usage_3"])
+        self.assertEqual(sorted(self.scheduler.stats()), ["usage_0", "usage_1", "usage_2", "usage_3"])
+        self.assertEqual(
+            sorted(self.scheduler.metrics.snapshot()["schemas"]),
+            ["usage_0", "usage_1", "usage_2", "usage_3"],
+        )
+
+    def test_timer_commands_are_routed_to_the_shard(self):
+        self.scheduler.start()
+
+        self.assertTrue(self.scheduler.remove_timer(name="usage_1"))
+        self.assertNotIn("usage_1", self.scheduler.timers)
+
+        self.assertTrue(self.scheduler.add_timer(name="usage_1"))
+        self.assertIn("usage_1", self.scheduler.timers)
+
+    def test_dead_workers_are_restarted(self):
+        self.scheduler.start()
+
+        pid = self.scheduler.shards[0].process.pid
+        self.scheduler.shards[0].process.kill()
+
+        self.assertTrue(self.wait(lambda: self.scheduler.shards[0].process.pid != pid))
+        self.assertTrue(self.wait(lambda: len(self.scheduler.timers) == 4))
@@ -0,0 +1,188 @@
+import http.server
+import logging
+import tempfile
+import threading
+import time
+
+from tests.testsuite import TestCase
+from json2mqtt.scheduler import Scheduler
+from json2mqtt.schemas import Schemas
+from json2mqtt.sources import Backoff, Event, EventStream, Lines, StreamSource
+
+
+class TestEventStream(TestCase):
+    def test_events_are_split_on_blank_lines(self):
+        stream = EventStream()
+
+        self.assertEqual(stream.feed(b'data: {"a": 1}\n\nevent: update\nid: 7\ndata: {"a":\ndata: 2}\n'), [
+            Event(name="message", data='{"a": 1}', id=None),
+        ])
+        self.assertEqual(stream.feed(b'\n'), [Event(name="update", data='{"a":\n2}', id="7")])
+        self.assertEqual(stream.last_id, "7")
+
+    def test_lines_and_characters_may_be_split_over_chunks(self):
+        stream = EventStream()
+        events = []
+
+        for chunk in (b'data: "Zo', b'\xc3', b'\xab"\r', b'\n\r', b'\n', b': comment\r\rretry: 2500\n'):
+            events.extend(stream.feed(chunk))
+
+        self.assertEqual(events, [Event(name="message", data='"Zoë"', id=None)])
+        self.assertEqual(stream.retry, 2.5)
+
+    def test_events_without_data_are_not_dispatched(self):
+        self.assertEqual(EventStream().feed(b'event: ping\n\n: keep-alive\n\n'), [])
+
+
+class TestLines(TestCase):
+    def test_records_are_split_on_newlines(self):
+        lines = Lines()
+
+        self.assertEqual(lines.feed(b'{"a": 1}\r\n\n{"a"'), [b'{"a": 1}'])
+        self.assertEqual(lines.feed(b': 2}\n'), [b'{"a": 2}'])
+
+
+class TestBackoff(TestCase):
+    def test_delays_grow_up_to_the_maximum(self):
+        backoff = Backoff(delay=1, maximum=4)
+        delays = [backoff.next() for _ in range(5)]
+
+        for delay, limit in zip(delays, (1, 2, 4, 4, 4)):
+            self.assertTrue(limit / 2 <= delay <= limit)
+
+        backoff.reset()
+        self.assertLessEqual(backoff.next(), 1)
+
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+
+        body = server.responses.pop(0) if server.responses else b''
+        self.send_response(200)
+        self.send_header("Content-Type", server.content_type)
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        self.wfile.write(body)
+        self.wfile.flush()
+
+        # Keep the last connection open like a stream that has nothing to send
+        if not server.responses and server.content_type != "application/json":
+            server.done.wait(5)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestStreamSource(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StreamHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.responses = []
+        self.server.done = threading.Event()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.server.done.set)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.schemas = Schemas(logger=logging.getLogger('json2mqtt.tests'), schema_dir=directory.name)
+
+        self.client = self.setup_client(schemas=self.schemas)
+        self.scheduler = Scheduler(client=self.client)
+        self.addCleanup(self.scheduler.close)
+
+    def source(self, kind, content_type, responses):
+        self.server.content_type = content_type
+        self.server.responses = list(responses)
+
+        self.assertTrue(self.schemas.add_schema(schema={
+            "name": "meter",
+            "url": f"http://127.0.0.1:{self.server.server_address[1]}/events",
+            "source": kind,
+            "fields": {"power": {"type": "Integer", "path": "power"}},
+        }))
+
+        source = StreamSource(scheduler=self.scheduler, schema=self.schemas.get("meter"), backoff=0.01)
+        self.addCleanup(source.join)
+        self.addCleanup(source.stop)
+        return source
+
+    def wait_for(self, source, records):
+        deadline = time.monotonic() + 5
+        while source.records < records and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(source.records, records)
+
+    def powers(self):
+        return [
+            call.kwargs["payload"] for call in self.client.publish.call_args_list
+            if call.kwargs["topic"] == "home/json2mqtt/meter/power"
+        ]
+
+    def test_events_are_processed_and_resumed_after_a_reconnect(self):
+        source = self.source(kind="sse", content_type="text/event-stream", responses=[
+            b'id: 1\ndata: {"power": 1}\n\n',
+            b'id: 2\ndata: {"power": 2}\n\ndata: {"power": 3}\n\n',
+        ])
+        source.start()
+        self.wait_for(source, records=3)
+
+        self.assertEqual(self.powers(), [1, 2, 3])
+        self.assertEqual(self.server.requests[0]["Accept"], "text/event-stream")
+        self.assertNotIn("Last-Event-ID", self.server.requests[0])
+        self.assertEqual(self.server.requests[1]["Last-Event-ID"], "1")
+        self.assertEqual(source.reconnects, 1)
+        self.assertEqual(self.scheduler.metrics.snapshot()["schemas"]["meter"]["stream_records_total"], 3)
+
+    def test_lines_are_processed_and_invalid_lines_skipped(self):
+        source = self.source(kind="ndjson", content_type="application/x-ndjson", responses=[
+            b'{"power": 1}\n{"power": \n{"power": 2}\n',
+        ])
+        source.start()
+        self.wait_for(source, records=2)
+
+        self.assertEqual(self.powers(), [1, 2])
+        self.assertEqual(self.scheduler.metrics.snapshot()["schemas"]["meter"]["fetch_failure_total"], 1)
+
+    def test_long_polls_are_sent_one_after_another(self):
+        source = self.source(kind="longpoll", content_type="application/json", responses=[
+            b'{"power": 1}', b'{"power": 2}',
+        ])
+        source.start()
+        self.wait_for(source, records=2)
+        source.stop()
+
+        self.assertEqual(self.powers()[:2], [1, 2])
+
+    def test_stopping_interrupts_a_waiting_stream(self):
+        source = self.source(kind="ndjson", content_type="application/x-ndjson", responses=[b'{"power": 1}\n'])
+        source.start()
+        self.wait_for(source, records=1)
+        self.assertTrue(source.connected)
+
+        start = time.monotonic()
+        source.stop()
+        source.join()
+
+        self.assertFalse(source.is_alive())
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_sources_replace_the_timer_of_their_schema(self):
+        self.source(kind="ndjson", content_type="application/x-ndjson", responses=[b'{"power": 1}\n'])
+
+        self.assertTrue(self.scheduler.add_timer(name="meter"))
+        timer = self.scheduler.timers["meter"]
+        self.assertIsInstance(timer, StreamSource)
+
+        self.wait_for(timer, records=1)
+        self.assertTrue(self.scheduler.remove_timer(name="meter"))
+        self.assertFalse(timer.is_alive())
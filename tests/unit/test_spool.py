@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+from tests.testsuite import TestCase
+from json2mqtt.outbox import Message
+from json2mqtt.spool import Spool
+
+
+class TestSpool(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.filename = os.path.join(directory.name, "spool.db")
+        self.now = 1000.0
+
+    def spool(self, **kwargs):
+        spool = Spool(filename=self.filename, clock=lambda: self.now, **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    @staticmethod
+    def messages(*payloads):
+        return [Message(topic="home/json2mqtt/usage/power", payload=payload) for payload in payloads]
+
+    def test_messages_are_read_in_order_until_removed(self):
+        spool = self.spool()
+        spool.write(self.messages(1, 2.5, "three", None))
+
+        rows = spool.read(limit=3)
+        self.assertEqual([message.payload for _, message in rows], [b"1", b"2.5", b"three"])
+
+        spool.remove(last_id=rows[1][0])
+        self.assertEqual(len(spool), 2)
+        self.assertEqual([message.payload for _, message in spool.read()], [b"three", None])
+
+    def test_messages_survive_a_restart(self):
+        spool = self.spool()
+        spool.write(self.messages(1, 2))
+        spool.close()
+
+        self.assertEqual([message.payload for _, message in self.spool().read()], [b"1", b"2"])
+
+    def test_size_cap_drops_the_oldest_messages(self):
+        spool = self.spool(max_messages=2)
+        spool.write(self.messages(1, 2, 3))
+
+        self.assertEqual([message.payload for _, message in spool.read()], [b"2", b"3"])
+        self.assertEqual(spool.stats()["dropped"], 1)
+
+    def test_age_cap_drops_expired_messages(self):
+        spool = self.spool(max_age=60)
+        spool.write(self.messages(1))
+
+        self.now += 120
+        spool.write(self.messages(2))
+
+        self.assertEqual([message.payload for _, message in spool.read()], [b"2"])
+
+    def test_corrupt_spools_are_moved_aside(self):
+        with open(self.filename, 'wb') as fh:
+            fh.write(b"not a database" * 100)
+
+        spool = self.spool()
+        spool.write(self.messages(1))
+
+        self.assertEqual(len(spool), 1)
+        self.assertTrue(os.path.isfile(f"{self.filename}.corrupt"))
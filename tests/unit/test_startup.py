@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from tests.testsuite import TestCase
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HEAVY = ("paho", "requests", "jsonschema", "jmespath", "ruamel", "aiohttp", "pid")
+
+
+def python(code, *args):
+    result = subprocess.run(
+        [sys.executable, "-c", code, *args], cwd=ROOT, capture_output=True, text=True, timeout=60,
+    )
+    return result.returncode, result.stdout
+
+
+class TestStartup(TestCase):
+    def test_entry_point_imports_no_heavy_modules(self):
+        code = "import sys, json, json2mqtt.__main__; print(json.dumps(sorted(set(m.split('.')[0] for m in sys.modules))))"
+        _, output = python(code)
+
+        self.assertEqual([module for module in HEAVY if module in json.loads(output)], [])
+
+    def config(self, directory, extra=""):
+        config = os.path.join(directory, "settings.yaml")
+        with open(config, 'w') as fh:
+            fh.write(f"---\nschema_dir: {directory}\nmqtt_host: localhost\nmqtt_port: 1883\n"
+                     f"mqtt_username: ''\nmqtt_password: ''\nmqtt_topic: home/json2mqtt\nmqtt_ssl: false\n"
+                     f"mqtt_cert: /etc/ssl/cert.pem\n{extra}...\n")
+
+        return config
+
+    def test_check_validates_without_connecting(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = self.config(directory=directory.name)
+
+        with open(os.path.join(directory.name, "usage.json"), 'w') as fh:
+            json.dump({"name": "usage", "url": "http://localhost/usage", "interval": 60, "fields": {}}, fh)
+
+        code = (
+            "import sys; from json2mqtt.__main__ import main\n"
+            "try:\n    main()\nexcept SystemExit as e:\n    print(e.code, 'paho.mqtt.client' in sys.modules)"
+        )
+        self.assertEqual(python(code, "-c", config, "--check")[1].split(), ["0", "False"])
+        self.assertEqual(sorted(os.listdir(directory.name)), ["settings.yaml", "usage.json"])
+
+        with open(os.path.join(directory.name, "broken.json"), 'w') as fh:
+            fh.write("{")
+
+        self.assertEqual(python(code, "-c", config, "--check")[1].split(), ["1", "False"])
+
+    def test_check_validates_the_json_codec(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = self.config(directory=directory.name, extra="json_codec: yaml\n")
+
+        code = "from json2mqtt.__main__ import main\ntry:\n    main()\nexcept SystemExit as e:\n    print(e.code)"
+        self.assertEqual(python(code, "-c", config, "--check")[1].split(), ["1"])
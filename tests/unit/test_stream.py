@@ -0,0 +1,82 @@
+import json
+import jmespath
+
+from tests.testsuite import TestCase
+from json2mqtt.plan import stream_paths
+from json2mqtt.stream import Extractor, simple_path
+
+
+DOCUMENT = {
+    "result": "ok",
+    "meta": {"version": 3, "tags": ["a", "b"]},
+    "items": [{"id": n, "name": f"item {n}", "text": "x,]}{[\"\\"} for n in range(50)],
+    "total": -2.5e3,
+    "escaped \"key\"": True,
+}
+
+PATHS = ["result", "meta.version", "meta.tags", "items[3].name", "items[0]", '"escaped \\"key\\""', "missing.value"]
+
+
+def extract(paths, text, size):
+    extractor = Extractor(paths=[simple_path(path) for path in paths])
+    for start in range(0, len(text), size):
+        extractor.feed(text[start:start + size])
+
+    return extractor.close()
+
+
+class TestSimplePath(TestCase):
+    def test_keys_and_indexes_are_split_into_steps(self):
+        self.assertEqual(simple_path("a.b[0][2].c"), ("a", "b", 0, 2, "c"))
+        self.assertEqual(simple_path('"x.y".z'), ("x.y", "z"))
+        self.assertEqual(simple_path("[1].a"), (1, "a"))
+
+    def test_expressions_that_need_the_whole_document_are_not_simple(self):
+        for path in ("a[*].b", "a[-1]", "a || b", "length(a)", "@", "a[?b > `1`]", "a[0:2]"):
+            self.assertIsNone(simple_path(path), path)
+
+
+class TestExtractor(TestCase):
+    def test_extracted_values_match_the_full_document_for_any_chunk_size(self):
+        text = json.dumps(DOCUMENT, indent=2, ensure_ascii=False).encode('utf-8')
+
+        for size in (1, 3, 7, 64, len(text)):
+            data = extract(PATHS, text, size)
+            for path in PATHS:
+                self.assertEqual(jmespath.search(path, data), jmespath.search(path, DOCUMENT), (path, size))
+
+    def test_only_the_extracted_values_are_kept(self):
+        data = extract(["items[3].name", "total"], json.dumps(DOCUMENT).encode('utf-8'), 16)
+
+        self.assertEqual(data, {"items": [None, None, None, {"name": "item 3"}], "total": -2500.0})
+
+    def test_skipped_values_are_not_buffered(self):
+        extractor = Extractor(paths=[("total",)])
+        extractor.feed(b'{"items": [')
+        for _ in range(1000):
+            extractor.feed(b'{"id": 1, "name": "' + b'x' * 100 + b'"},')
+
+        self.assertLess(len(extractor.buffer), 200)
+
+        extractor.feed(b'{}], "total": 5}')
+        self.assertEqual(extractor.close(), {"total": 5})
+
+    def test_invalid_documents_raise_a_decode_error(self):
+        for text in (b'', b'{"a": ', b'{"a" 1}', b'[1 2]', b'{"a": tru}', b'{"a": 1} x', b'{"a": [1}', b'{"a": "\xff"}'):
+            with self.assertRaises(json.JSONDecodeError, msg=text):
+                extract(["a"], text, 2)
+
+
+class TestStreamPaths(TestCase):
+    def schema(self, **values):
+        return dict({"stream": True, "fields": {"a": {"path": "a.b", "type": "String"}}}, **values)
+
+    def test_streaming_schemas_get_their_paths(self):
+        self.assertEqual(stream_paths(self.schema()), (("a", "b"),))
+
+    def test_streaming_is_opt_in(self):
+        self.assertIsNone(stream_paths(self.schema(stream=False)))
+
+    def test_complex_paths_and_documents_fall_back_to_full_parsing(self):
+        self.assertIsNone(stream_paths(self.schema(fields={"a": {"path": "a[*].b", "type": "List"}})))
+        self.assertIsNone(stream_paths(self.schema(publish="both")))
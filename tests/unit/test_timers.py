@@ -0,0 +1,176 @@
+import threading
+import time
+
+from tests.testsuite import TestCase
+from json2mqtt.timers import Deferred, Dispatcher, Runs, Schedule, Timer, phase
+
+
+class TestPhase(TestCase):
+    def test_phase_is_stable_and_bounded(self):
+        self.assertEqual(phase(name="current_usage", interval=60), phase(name="current_usage", interval=60))
+        self.assertNotEqual(phase(name="current_usage", interval=60), phase(name="boilervalues", interval=60))
+
+        for name in ("a", "b", "c", "d"):
+            self.assertTrue(0 <= phase(name=name, interval=3600, window=30) < 30)
+            self.assertTrue(0 <= phase(name=name, interval=5, window=30) < 5)
+
+        self.assertEqual(phase(name="a", interval=60, window=0), 0)
+
+
+class TestSchedule(TestCase):
+    def test_schedule_follows_the_phase_shifted_grid(self):
+        schedule = Schedule(interval=10, phase=3)
+
+        self.assertEqual(schedule.reset(now=100), 103)
+        self.assertEqual(schedule.fired(now=103.5), 113)
+        self.assertEqual(schedule.drift, 0.5)
+
+    def test_missed_boundaries_are_skipped(self):
+        schedule = Schedule(interval=10)
+        schedule.reset(now=0)
+
+        self.assertEqual(schedule.fired(now=35), 40)
+        self.assertEqual(schedule.skipped, 3)
+        self.assertEqual(schedule.max_drift, 35)
+
+    def test_jitter_delays_within_bounds(self):
+        schedule = Schedule(interval=10, jitter=2)
+        due = schedule.reset(now=0)
+        self.assertTrue(0 <= due <= 2)
+
+
+class TestRuns(TestCase):
+    def test_skip_drops_runs_while_busy(self):
+        runs = Runs(policy="skip")
+
+        self.assertEqual([runs.due(), runs.due(), runs.due()], [True, False, False])
+        self.assertEqual(runs.missed, 2)
+        self.assertFalse(runs.finished(duration=1, interval=10))
+        self.assertEqual(runs.active, 0)
+
+    def test_queue_keeps_a_single_pending_run(self):
+        runs = Runs(policy="queue")
+
+        self.assertEqual([runs.due(), runs.due(), runs.due()], [True, False, False])
+        self.assertEqual(runs.missed, 1)
+        self.assertTrue(runs.finished(duration=15, interval=10))
+        self.assertFalse(runs.finished(duration=1, interval=10))
+        self.assertEqual((runs.active, runs.overruns), (0, 1))
+
+    def test_concurrent_allows_limited_overlap(self):
+        runs = Runs(policy="concurrent", limit=2)
+
+        self.assertEqual([runs.due(), runs.due(), runs.due()], [True, True, False])
+        self.assertEqual(runs.missed, 1)
+
+    def test_actual_interval_is_measured_between_starts(self):
+        runs = Runs()
+        runs.started(now=10)
+        runs.started(now=22.5)
+
+        self.assertEqual(runs.stats()["actual_interval"], 12.5)
+
+
+class TestTimer(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = Dispatcher(workers=2)
+        self.addCleanup(self.dispatcher.close)
+
+    def test_timer_runs_count_times_from_the_dispatcher(self):
+        done = threading.Event()
+        calls = []
+
+        def function(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 3:
+                done.set()
+
+        timer = Timer(dispatcher=self.dispatcher, interval=0.01, function=function, kwargs={"schema": 1}, count=3)
+        timer.start()
+
+        self.assertTrue(done.wait(timeout=2))
+        timer.join(timeout=2)
+        self.assertEqual(calls, [{"schema": 1}] * 3)
+        self.assertFalse(timer.is_alive())
+
+    def test_stop_prevents_further_runs(self):
+        ran = threading.Event()
+        calls = []
+
+        def function():
+            calls.append(1)
+            ran.set()
+
+        timer = Timer(dispatcher=self.dispatcher, interval=10, function=function)
+        timer.start()
+        self.assertTrue(ran.wait(timeout=2))
+
+        timer.stop()
+        self.assertTrue(timer.join(timeout=2))
+        self.assertFalse(timer.is_alive())
+        self.assertEqual(calls, [1])
+
+    def test_busy_timers_skip_their_run(self):
+        release = threading.Event()
+
+        timer = Timer(dispatcher=self.dispatcher, interval=0.01, function=lambda: release.wait(timeout=2))
+        timer.start()
+        self.addCleanup(timer.stop)
+        self.addCleanup(release.set)
+
+        for _ in range(100):
+            if timer.stats()["missed"]:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(timer.counter, 1)
+        self.assertGreater(timer.stats()["missed"], 0)
+
+    def test_deferred_runs_wait_without_holding_a_worker(self):
+        done = threading.Event()
+        calls = []
+
+        def deferred():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise Deferred(delay=0.2)
+            done.set()
+
+        dispatcher = Dispatcher(workers=1)
+        self.addCleanup(dispatcher.close)
+
+        timer = Timer(dispatcher=dispatcher, interval=10, function=deferred)
+        timer.start()
+        self.addCleanup(timer.stop)
+
+        # The only worker is free for other timers while the run is deferred
+        other = threading.Event()
+        Timer(dispatcher=dispatcher, interval=10, function=other.set, count=1).start()
+        self.assertTrue(other.wait(timeout=0.15))
+
+        self.assertTrue(done.wait(timeout=2))
+        self.assertGreaterEqual(calls[1] - calls[0], 0.2)
+        self.assertTrue(timer.join(timeout=2))
+        self.assertEqual(timer.counter, 1)
+
+    def test_stop_drops_deferred_runs(self):
+        calls = []
+
+        def function():
+            calls.append(1)
+            raise Deferred(delay=0.1)
+
+        timer = Timer(dispatcher=self.dispatcher, interval=10, function=function)
+        timer.start()
+        for _ in range(100):
+            if timer.deferred:
+                break
+            time.sleep(0.01)
+
+        timer.stop()
+        self.assertTrue(timer.join(timeout=0.05))
+        self.assertFalse(timer.is_alive())
+
+        time.sleep(0.2)
+        self.assertEqual(calls, [1])
@@ -0,0 +1,122 @@
+import json
+import logging
+import mock
+import os
+import tempfile
+import threading
+
+from tests.testsuite import TestCase
+from json2mqtt.commands import CommandHandler
+from json2mqtt.scheduler import Scheduler
+from json2mqtt.schemas import Schemas
+from json2mqtt.watcher import Inotify, SchemaWatcher
+
+
+def schema(name, interval=60, path="result"):
+    return {
+        "name": name,
+        "url": f"http://localhost/{name}",
+        "interval": interval,
+        "fields": {
+            "result": {"type": "String", "path": path},
+        }
+    }
+
+
+class TestSchemaWatcher(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        self.write("usage", schema("usage"))
+        self.write("thermostat", schema("thermostat"))
+
+        self.schemas = Schemas(logger=logging.getLogger('json2mqtt.tests'), schema_dir=self.directory)
+        self.schemas.import_all()
+
+        self.scheduler = Scheduler(client=self.setup_client(schemas=self.schemas, phase_window=0))
+        self.scheduler.sessions = mock.Mock()
+        self.scheduler.start()
+        self.addCleanup(self.scheduler.close)
+
+        self.watcher = SchemaWatcher(schemas=self.schemas, scheduler=self.scheduler, logger=self.schemas.logger)
+
+    def write(self, name, data):
+        filename = os.path.join(self.directory, f"{name}.json")
+        with open(filename, 'w') as fh:
+            json.dump(data, fh)
+
+        # Make sure the mtime changes on file systems with a coarse resolution
+        stat = os.stat(filename)
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        return filename
+
+    def test_unchanged_files_are_ignored(self):
+        self.assertEqual(self.watcher.sync(), ([], [], []))
+
+    def test_changed_schemas_restart_only_their_own_timer(self):
+        usage, thermostat = self.scheduler.timers["usage"], self.scheduler.timers["thermostat"]
+
+        filename = self.write("usage", schema("usage", interval=30))
+        self.assertEqual(self.watcher.sync(), ([], [filename], []))
+
+        self.assertIsNot(self.scheduler.timers["usage"], usage)
+        self.assertEqual(self.scheduler.timers["usage"].interval, 30)
+        self.assertIs(self.scheduler.timers["thermostat"], thermostat)
+
+    def test_rewriting_the_same_schema_keeps_the_timer(self):
+        usage = self.scheduler.timers["usage"]
+
+        with open(os.path.join(self.directory, "usage.json"), 'w') as fh:
+            json.dump(schema("usage"), fh, indent=4)
+        self.watcher.sync()
+
+        self.assertIs(self.scheduler.timers["usage"], usage)
+
+    def test_added_and_removed_files(self):
+        self.write("boiler", schema("boiler"))
+        os.remove(os.path.join(self.directory, "thermostat.json"))
+        self.watcher.sync()
+
+        self.assertEqual(sorted(self.schemas.keys()), ["boiler", "usage"])
+        self.assertEqual(sorted(self.scheduler.timers.keys()), ["boiler", "usage"])
+
+    def test_invalid_changes_keep_the_running_schema(self):
+        usage = self.scheduler.timers["usage"]
+
+        self.write("usage", {"name": "usage"})
+        self.watcher.sync()
+
+        self.assertIs(self.scheduler.timers["usage"], usage)
+        self.assertEqual(self.schemas["usage"]["interval"], 60)
+
+    def test_changes_wait_for_the_running_command(self):
+        client = self.setup_client(schemas=self.schemas)
+        client.scheduler = self.scheduler
+        handler = CommandHandler(client=client)
+        watcher = SchemaWatcher(schemas=self.schemas, scheduler=self.scheduler, logger=self.schemas.logger, lock=handler.lock)
+
+        self.write("boiler", schema("boiler"))
+        synced = threading.Event()
+
+        with handler.lock:
+            threading.Thread(target=lambda: (watcher.sync(), synced.set()), daemon=True).start()
+            self.assertFalse(synced.wait(timeout=0.1))
+            self.assertNotIn("boiler", self.scheduler.timers)
+
+        self.assertTrue(synced.wait(timeout=2))
+        self.assertIn("boiler", self.scheduler.timers)
+
+    def test_inotify_reports_changes(self):
+        try:
+            inotify = Inotify(path=self.directory)
+        except OSError as e:
+            self.skipTest(f"inotify is not available: {e}")
+
+        self.addCleanup(inotify.close)
+        self.assertFalse(inotify.wait(timeout=0))
+
+        self.write("boiler", schema("boiler"))
+        self.assertTrue(inotify.wait(timeout=2))
@@ -0,0 +1,75 @@
+import random
+
+from tests.testsuite import TestCase
+from json2mqtt.plan import SchemaPlan
+from json2mqtt.windows import Window, Windows
+
+
+def plan(**field):
+    return SchemaPlan.compile(schema={
+        "name": "usage",
+        "url": "http://localhost/usage",
+        "fields": {"power": dict({"type": "Integer", "path": "power", "derive": ["mean", "min", "max", "rate", "delta"]}, **field)},
+    }, mqtt_topic="base")
+
+
+class TestWindow(TestCase):
+    def test_derived_values_match_the_last_samples(self):
+        window = Window(size=7)
+        samples = [random.uniform(-100, 100) for _ in range(200)]
+
+        for number, value in enumerate(samples):
+            window.add(value=value, now=number)
+            last = samples[max(0, number - 6):number + 1]
+
+            self.assertAlmostEqual(window.derive("mean"), sum(last) / len(last))
+            self.assertEqual(window.derive("min"), min(last))
+            self.assertEqual(window.derive("max"), max(last))
+
+        self.assertEqual(len(window), 7)
+        self.assertAlmostEqual(window.derive("delta"), samples[-1] - samples[-7])
+        self.assertAlmostEqual(window.derive("rate"), (samples[-1] - samples[-7]) / 6)
+
+    def test_samples_older_than_the_window_are_dropped(self):
+        window = Window(size=100, seconds=10)
+        for now, value in ((0, 1000), (5, 1), (12, 3), (14, 5)):
+            window.add(value=value, now=now)
+
+        self.assertEqual(len(window), 3)
+        self.assertEqual(window.derive("max"), 5)
+        self.assertEqual(window.derive("rate"), 4 / 9)
+
+    def test_rate_and_delta_need_two_samples(self):
+        window = Window(size=3)
+        window.add(value=4, now=1)
+
+        self.assertEqual(window.derive("mean"), 4)
+        self.assertIsNone(window.derive("rate"))
+        self.assertIsNone(window.derive("delta"))
+
+
+class TestWindows(TestCase):
+    def test_derived_values_per_field(self):
+        now = iter(range(100))
+        windows = Windows(clock=lambda: next(now))
+        usage = plan(window=3)
+
+        windows.add(plan=usage, field=usage.fields[0], value=10)
+        windows.add(plan=usage, field=usage.fields[0], value=20)
+
+        self.assertEqual(windows.add(plan=usage, field=usage.fields[0], value=60), [
+            ("mean", 30), ("min", 10), ("max", 60), ("rate", 25), ("delta", 50),
+        ])
+
+    def test_non_numeric_values_are_ignored(self):
+        usage = plan()
+        self.assertEqual(Windows().add(plan=usage, field=usage.fields[0], value="10"), [])
+        self.assertEqual(Windows().add(plan=usage, field=usage.fields[0], value=True), [])
+
+    def test_forget_drops_a_schema(self):
+        windows = Windows()
+        usage = plan()
+        windows.add(plan=usage, field=usage.fields[0], value=1)
+        windows.forget(name="usage")
+
+        self.assertEqual(windows.windows, {})